@@ -0,0 +1,135 @@
+import asyncio
+import os
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Hashable, Tuple
+
+from hf_client import HF_POOL_SIZE
+
+GENERATION_MAX_ACTIVE = int(os.getenv("GENERATION_MAX_ACTIVE", str(HF_POOL_SIZE)))
+GENERATION_QUEUE_MAX = int(os.getenv("GENERATION_QUEUE_MAX", "32"))
+GENERATION_QUEUE_PER_KEY = int(os.getenv("GENERATION_QUEUE_PER_KEY", "2"))
+
+
+class AdmissionRejected(Exception):
+    """The generation queue (or the caller's share of it) is full."""
+
+    def __init__(self, reason: str) -> None:
+        super().__init__(reason)
+        self.reason = reason
+
+
+class AdmissionController:
+    """Caps concurrent answers; the rest wait in a bounded queue, fair across keys.
+
+    At most `max_active` callers hold a slot. Waiters are grouped by key
+    (Discord user or channel) and a freed slot goes to the next key in
+    round-robin order, so one user with many questions cannot starve the
+    others. With `max_queue` waiters in total, or `max_per_key` from the same
+    key, `slot()` raises AdmissionRejected immediately instead of queueing.
+    Event-loop only: no locking.
+    """
+
+    def __init__(
+        self,
+        max_active: int = GENERATION_MAX_ACTIVE,
+        max_queue: int = GENERATION_QUEUE_MAX,
+        max_per_key: int = GENERATION_QUEUE_PER_KEY,
+    ) -> None:
+        self.max_active = max(1, max_active)
+        self.max_queue = max(0, max_queue)
+        self.max_per_key = max(1, max_per_key)
+        self.active = 0
+        self.queued = 0
+        self._waiting: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+
+    @asynccontextmanager
+    async def slot(self, key: str) -> AsyncIterator[None]:
+        await self._acquire(key)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self, key: str) -> None:
+        if self.active < self.max_active and not self.queued:
+            self.active += 1
+            return
+        if self.queued >= self.max_queue:
+            raise AdmissionRejected("queue_full")
+        waiters = self._waiting.get(key)
+        if waiters is not None and len(waiters) >= self.max_per_key:
+            raise AdmissionRejected("per_key_limit")
+
+        fut: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(key, deque()).append(fut)
+        self.queued += 1
+        try:
+            await fut  # _release hands its slot over without decrementing `active`
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self._release()  # the slot arrived just as we were cancelled
+            else:
+                self._forget(key, fut)
+            raise
+
+    def _forget(self, key: str, fut: asyncio.Future) -> None:
+        waiters = self._waiting.get(key)
+        if waiters is not None and fut in waiters:
+            waiters.remove(fut)
+            self.queued -= 1
+            if not waiters:
+                del self._waiting[key]
+
+    def _release(self) -> None:
+        while self._waiting:
+            key, waiters = next(iter(self._waiting.items()))
+            fut = waiters.popleft()
+            self.queued -= 1
+            if waiters:
+                self._waiting.move_to_end(key)
+            else:
+                del self._waiting[key]
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self.active -= 1
+
+
+class SingleFlight:
+    """Concurrent calls with the same key share one execution of `fn`.
+
+    The first caller (the leader) runs `fn`; callers arriving while it runs
+    await the same result, or the same exception. The key is dropped once
+    the call finishes, so later callers start a fresh one.
+    """
+
+    def __init__(self) -> None:
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Returns (result, shared); `shared` is True for callers that did not run `fn`."""
+        fut = self._calls.get(key)
+        if fut is not None:
+            # shield: a follower giving up must not cancel the leader's work.
+            return await asyncio.shield(fut), True
+
+        fut = asyncio.get_running_loop().create_future()
+        self._calls[key] = fut
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            fut.cancel()
+            raise
+        except BaseException as exc:
+            fut.set_exception(exc)
+            fut.exception()  # retrieved: no "never retrieved" warning without followers
+            raise
+        else:
+            fut.set_result(result)
+            return result, False
+        finally:
+            self._calls.pop(key, None)
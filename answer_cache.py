@@ -0,0 +1,204 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))  # 0 disables
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "86400"))
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", "")  # e.g. /data/work/answer_cache.json
+ANSWER_CACHE_SAVE_SECONDS = float(os.getenv("ANSWER_CACHE_SAVE_SECONDS", "60"))
+
+_NUMBER = re.compile(r"\d+")
+
+
+def numbers_key(question: str) -> str:
+    """The numbers in a question ("art. 312" vs "art. 313"); cached answers must match them exactly.
+
+    Embeddings of questions that differ only in an article or súmula number
+    are nearly identical, but the answers are not.
+    """
+    return ",".join(_NUMBER.findall(question))
+
+
+class SemanticAnswerCache:
+    """Answers to past questions, found by cosine similarity of question embeddings.
+
+    Entries are tagged with the index token (LocalIndexRuntime.token) they
+    were answered from; a lookup under a new token first drops every entry of
+    the old one. Eviction is LRU by ANSWER_CACHE_SIZE plus ANSWER_CACHE_TTL_SECONDS.
+    The vectors live in one (n, dim) matrix searched by brute force, which for
+    a few hundred entries costs microseconds. With a `path`, new answers are
+    written out by start_autosave's thread, not on every put.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        max_size: int = ANSWER_CACHE_SIZE,
+        threshold: float = ANSWER_CACHE_THRESHOLD,
+        ttl_seconds: float = ANSWER_CACHE_TTL_SECONDS,
+        path: Path | None = Path(ANSWER_CACHE_PATH) if ANSWER_CACHE_PATH else None,
+    ) -> None:
+        self.model_name = model_name
+        self.max_size = max_size
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.path = path
+        self.token: str | None = None
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._next_id = 0
+        self._matrix: np.ndarray | None = None
+        self._matrix_ids: List[int] = []
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        if self.path is not None and self.path.exists():
+            self._load()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def _expired(self, entry: Dict[str, Any], now: float) -> bool:
+        return self.ttl_seconds > 0 and now - entry["created_at"] > self.ttl_seconds
+
+    def _retain(self, token: str, now: float) -> None:
+        if token != self.token:
+            self._entries = OrderedDict((i, e) for i, e in self._entries.items() if e["token"] == token)
+            self.token = token
+            self._matrix = None
+        expired = [i for i, e in self._entries.items() if self._expired(e, now)]
+        for i in expired:
+            del self._entries[i]
+        if expired:
+            self._matrix = None
+
+    def _search_matrix(self) -> Tuple[np.ndarray, List[int]]:
+        if self._matrix is None:
+            self._matrix_ids = list(self._entries)
+            vectors = [self._entries[i]["vector"] for i in self._matrix_ids]
+            self._matrix = np.vstack(vectors) if vectors else np.zeros((0, 0), dtype="float32")
+        return self._matrix, self._matrix_ids
+
+    def get(self, vector: np.ndarray, question: str, area: str | None, token: str) -> str | None:
+        """Cached answer for a question whose normalized embedding is `vector`, or None."""
+        if not self.enabled:
+            return None
+        now = time.time()
+        numbers = numbers_key(question)
+        with self._lock:
+            self._retain(token, now)
+            matrix, ids = self._search_matrix()
+            best: Tuple[float, int] | None = None
+            if len(ids):
+                scores = matrix @ vector.reshape(-1)
+                for row in np.argsort(-scores):
+                    if scores[row] < self.threshold:
+                        break
+                    entry = self._entries[ids[row]]
+                    if entry["area"] == area and entry["numbers"] == numbers:
+                        best = (float(scores[row]), ids[row])
+                        break
+            if best is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(best[1])
+            return self._entries[best[1]]["answer"]
+
+    def put(self, vector: np.ndarray, question: str, area: str | None, token: str, answer: str) -> None:
+        if not self.enabled:
+            return
+        now = time.time()
+        with self._lock:
+            self._retain(token, now)
+            self._entries[self._next_id] = {
+                "question": question,
+                "area": area,
+                "numbers": numbers_key(question),
+                "token": token,
+                "answer": answer,
+                "created_at": now,
+                "vector": np.asarray(vector, dtype="float32").reshape(-1),
+            }
+            self._next_id += 1
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            self._matrix = None
+            self._dirty = True
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    def save(self) -> None:
+        """Write the entries to `path` (write-then-rename); no-op without a path."""
+        if self.path is None:
+            return
+        with self._lock:
+            entries = [dict(e, vector=e["vector"].tolist()) for e in self._entries.values()]
+            self._dirty = False
+        payload = {"model": self.model_name, "entries": entries}
+        with self._save_lock:
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                tmp = self.path.with_name(self.path.name + ".tmp")
+                tmp.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+                os.replace(tmp, self.path)
+            except OSError:
+                self._dirty = True  # try again on the next save
+                raise
+
+    def save_if_dirty(self) -> bool:
+        """save() if an answer was added since the last one; failures are logged, not raised."""
+        if self.path is None or not self._dirty:
+            return False
+        try:
+            self.save()
+        except OSError as exc:
+            print(f"[ANSWER_CACHE] save failed: {type(exc).__name__}: {exc}")
+            return False
+        return True
+
+    def start_autosave(self, interval: float = ANSWER_CACHE_SAVE_SECONDS) -> threading.Thread | None:
+        """Save changes every `interval` seconds in a daemon thread; None without a path.
+
+        Call save_if_dirty() once more at shutdown for the last answers.
+        """
+        if self.path is None:
+            return None
+
+        def loop() -> None:
+            while True:
+                time.sleep(interval)
+                self.save_if_dirty()
+
+        thread = threading.Thread(target=loop, name="answer-cache-save", daemon=True)
+        thread.start()
+        return thread
+
+    def _load(self) -> None:
+        try:
+            payload = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError) as exc:
+            print(f"[ANSWER_CACHE] ignoring unreadable {self.path}: {type(exc).__name__}: {exc}")
+            return
+        if payload.get("model") != self.model_name:
+            # Vectors from another encoder are not comparable.
+            return
+        now = time.time()
+        for entry in payload.get("entries", [])[-self.max_size:] if self.max_size > 0 else []:
+            entry["vector"] = np.asarray(entry["vector"], dtype="float32")
+            if not self._expired(entry, now):
+                self._entries[self._next_id] = entry
+                self._next_id += 1
+        print(f"[ANSWER_CACHE] loaded {len(self._entries)} entries from {self.path}")
@@ -0,0 +1,260 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict
+
+import requests
+
+INDEX_REPO_ID = os.getenv("INDEX_REPO_ID")
+ARTIFACTS_PREFIX = os.getenv("ARTIFACTS_PREFIX", "artifacts")
+HF_TOKEN = os.getenv("HF_TOKEN")
+HF_ENDPOINT = os.getenv("HF_ENDPOINT", "https://huggingface.co").rstrip("/")
+LOCAL_STORAGE_DIR = Path(os.getenv("LOCAL_STORAGE_DIR", "/data/storage"))
+ARTIFACT_SOURCE = os.getenv("ARTIFACT_SOURCE", "local").lower()
+ARTIFACT_SOURCE_DIR = os.getenv("ARTIFACT_SOURCE_DIR")
+ARTIFACT_SYNC_SECONDS = int(os.getenv("ARTIFACT_SYNC_SECONDS", "60"))
+ARTIFACT_KEEP_VERSIONS = int(os.getenv("ARTIFACT_KEEP_VERSIONS", "2"))
+
+MANIFEST_NAME = "manifest.json"
+
+# manifest["files"] key -> manifest["checksums"] key (see ingest_job.create_manifest).
+# Index shards ("shard_<name>") use "<files key>_sha256"; any other key is an error.
+CHECKSUM_KEYS = {
+    "faiss_index": "faiss_sha256",
+    "meta_bin": "meta_sha256",
+    "failures_json": "failures_sha256",
+    "parse_report_json": "parse_report_sha256",
+    "citations_json": "citations_sha256",
+    "conversion_report_json": "conversion_report_sha256",
+    "rescore_vectors": "rescore_vectors_sha256",
+}
+
+
+def _checksum_key(files_key: str) -> str:
+    if files_key in CHECKSUM_KEYS:
+        return CHECKSUM_KEYS[files_key]
+    if files_key.startswith("shard_"):
+        return f"{files_key}_sha256"
+    # A new artifact must be mapped here, not synced unverified.
+    raise RuntimeError(f"Arquivo do manifest sem checksum conhecido: {files_key}")
+
+
+def _relative(path_in_repo: str) -> Path:
+    """Path under the artifacts dir ("artifacts/shards/penal.index" -> "shards/penal.index")."""
+    prefix = ARTIFACTS_PREFIX.strip("/") + "/"
+    return Path(path_in_repo[len(prefix):] if path_in_repo.startswith(prefix) else Path(path_in_repo).name)
+
+
+def _sha256_file(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class HubTransport:
+    """Reads artifacts from a Hub dataset over plain HTTPS.
+
+    Fresh downloads ask for gzip. An interrupted download resumes with a
+    Range request from the size of the `.part` file.
+    """
+
+    def __init__(self, repo_id: str, token: str | None = HF_TOKEN, endpoint: str = HF_ENDPOINT) -> None:
+        self.repo_id = repo_id
+        self.endpoint = endpoint
+        self.session = requests.Session()
+        if token:
+            self.session.headers["Authorization"] = f"Bearer {token}"
+
+    def _url(self, path: str, revision: str) -> str:
+        return f"{self.endpoint}/datasets/{self.repo_id}/resolve/{revision}/{path}"
+
+    def read_manifest(self) -> bytes:
+        r = self.session.get(self._url(f"{ARTIFACTS_PREFIX}/{MANIFEST_NAME}", "main"), timeout=30)
+        r.raise_for_status()
+        return r.content
+
+    def fetch(self, path: str, dest: Path, revision: str) -> None:
+        offset = dest.stat().st_size if dest.exists() else 0
+        headers = {"Accept-Encoding": "gzip"}
+        if offset:
+            # Byte ranges address the stored bytes, so resume without encoding.
+            headers = {"Accept-Encoding": "identity", "Range": f"bytes={offset}-"}
+        with self.session.get(self._url(path, revision), headers=headers, stream=True, timeout=(10, 120)) as r:
+            if r.status_code == 416:
+                return  # .part already holds the whole file; the checksum decides
+            r.raise_for_status()
+            mode = "ab" if r.status_code == 206 else "wb"
+            with dest.open(mode) as f:
+                for chunk in r.iter_content(chunk_size=1024 * 1024):
+                    f.write(chunk)
+
+
+class LocalDirTransport:
+    """Stand-in for the Hub: a directory laid out like the index dataset."""
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+
+    def read_manifest(self) -> bytes:
+        return (self.root / ARTIFACTS_PREFIX / MANIFEST_NAME).read_bytes()
+
+    def fetch(self, path: str, dest: Path, revision: str) -> None:
+        offset = dest.stat().st_size if dest.exists() else 0
+        with (self.root / path).open("rb") as src, dest.open("ab") as out:
+            src.seek(offset)
+            shutil.copyfileobj(src, out, 1024 * 1024)
+
+
+def make_transport() -> HubTransport | LocalDirTransport:
+    if ARTIFACT_SOURCE not in {"hub", "dir"}:
+        raise RuntimeError(f"ARTIFACT_SOURCE invalido para sync: {ARTIFACT_SOURCE} (use hub ou dir)")
+    if ARTIFACT_SOURCE == "dir":
+        if not ARTIFACT_SOURCE_DIR:
+            raise RuntimeError("ARTIFACT_SOURCE=dir exige ARTIFACT_SOURCE_DIR.")
+        return LocalDirTransport(Path(ARTIFACT_SOURCE_DIR))
+    if not INDEX_REPO_ID:
+        raise RuntimeError("ARTIFACT_SOURCE=hub exige INDEX_REPO_ID.")
+    return HubTransport(INDEX_REPO_ID)
+
+
+class ArtifactSync:
+    """Mirrors the published index artifacts into `storage_dir`.
+
+    Layout:
+      staging/<rev>/   downloads in progress (`.part` files survive restarts)
+      versions/<rev>/  complete, checksum-verified artifact sets
+      current          symlink to the active version, swapped atomically
+
+    Files whose checksum matches the active version are hard-linked instead
+    of downloaded.
+    """
+
+    def __init__(
+        self,
+        transport: Any,
+        storage_dir: Path = LOCAL_STORAGE_DIR,
+        on_update: Callable[[], None] | None = None,
+    ) -> None:
+        self.transport = transport
+        self.storage_dir = storage_dir
+        self.current = storage_dir / "current"
+        self.on_update = on_update
+        self.stats: Dict[str, int] = {"syncs": 0, "downloaded": 0, "reused": 0}
+
+    def _local_manifest(self) -> Dict[str, Any]:
+        path = self.current / MANIFEST_NAME
+        if not path.exists():
+            return {}
+        return json.loads(path.read_text(encoding="utf-8"))
+
+    def _fetch_verified(self, path_in_repo: str, dest: Path, checksum: str, revision: str) -> None:
+        part = dest.with_name(dest.name + ".part")
+        for _ in range(2):
+            self.transport.fetch(path_in_repo, part, revision)
+            if _sha256_file(part) == checksum:
+                os.replace(part, dest)
+                return
+            # Corrupt or stale partial download: start over once.
+            part.unlink(missing_ok=True)
+        raise RuntimeError(f"Checksum invalido para {path_in_repo}")
+
+    def _activate(self, version_dir: Path) -> None:
+        tmp = self.storage_dir / "current.tmp"
+        tmp.unlink(missing_ok=True)
+        os.symlink(os.path.relpath(version_dir, self.storage_dir), tmp)
+        os.replace(tmp, self.current)
+
+    def _prune(self, keep: Path) -> None:
+        versions = sorted(
+            (p for p in (self.storage_dir / "versions").iterdir() if p.is_dir()),
+            key=lambda p: p.stat().st_mtime,
+            reverse=True,
+        )
+        keep_set = {keep.resolve()} | {p.resolve() for p in versions[:max(1, ARTIFACT_KEEP_VERSIONS)]}
+        for path in versions:
+            if path.resolve() not in keep_set:
+                # Mapped files of an old snapshot stay readable after unlink.
+                shutil.rmtree(path, ignore_errors=True)
+
+    def sync_once(self) -> bool:
+        """Bring `current` up to the remote manifest. Returns True if it moved.
+
+        `on_update` runs only when some file content actually changed.
+        """
+        raw = self.transport.read_manifest()
+        remote = json.loads(raw)
+        revision = remote.get("revision")
+        if not revision or revision == "PENDING":
+            # Ingest publishes the manifest twice; wait for the one naming its commit.
+            return False
+
+        local = self._local_manifest()
+        if local.get("revision") == revision:
+            return False
+
+        local_checksums = local.get("checksums", {})
+        remote_checksums = remote.get("checksums", {})
+        files = {key: path for key, path in remote.get("files", {}).items() if key != "manifest_json"}
+        # Checked before any download: every file must be verifiable.
+        expected = {key: remote_checksums.get(_checksum_key(key)) for key in files}
+        missing = [key for key, checksum in expected.items() if not checksum]
+        if missing:
+            raise RuntimeError(f"Manifest sem checksum para: {', '.join(missing)}")
+
+        staging = self.storage_dir / "staging" / revision
+        staging.mkdir(parents=True, exist_ok=True)
+        downloaded = reused = 0
+
+        for key, path_in_repo in files.items():
+            rel = _relative(path_in_repo)
+            dest = staging / rel
+            if dest.exists():
+                continue  # verified by an earlier, interrupted sync of this revision
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            checksum = expected[key]
+            previous = self.current / rel
+            if local_checksums.get(_checksum_key(key)) == checksum and previous.exists():
+                try:
+                    os.link(previous.resolve(), dest)
+                except OSError:
+                    shutil.copy2(previous, dest)
+                reused += 1
+                continue
+            self._fetch_verified(path_in_repo, dest, checksum, revision)
+            downloaded += 1
+
+        (staging / MANIFEST_NAME).write_bytes(raw)
+        version_dir = self.storage_dir / "versions" / revision
+        version_dir.parent.mkdir(parents=True, exist_ok=True)
+        if version_dir.exists():
+            shutil.rmtree(version_dir)
+        os.replace(staging, version_dir)
+        self._activate(version_dir)
+        self._prune(version_dir)
+
+        self.stats["syncs"] += 1
+        self.stats["downloaded"] += downloaded
+        self.stats["reused"] += reused
+        print(f"[SYNC] revision {revision[:12]} active (downloaded={downloaded}, reused={reused})")
+        if remote_checksums != local_checksums and self.on_update is not None:
+            self.on_update()
+        return True
+
+    def run_forever(self, poll_seconds: int = ARTIFACT_SYNC_SECONDS) -> None:
+        while True:
+            time.sleep(poll_seconds)
+            try:
+                self.sync_once()
+            except Exception as exc:  # noqa: BLE001
+                print(f"[SYNC] failed; keeping current artifacts: {type(exc).__name__}: {exc}")
+
+    def start(self, poll_seconds: int = ARTIFACT_SYNC_SECONDS) -> threading.Thread:
+        thread = threading.Thread(target=self.run_forever, args=(poll_seconds,), name="artifact-sync", daemon=True)
+        thread.start()
+        return thread
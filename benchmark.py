@@ -0,0 +1,295 @@
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import redirect_stdout
+from pathlib import Path
+from typing import Any, Dict, List
+
+import faiss
+import numpy as np
+
+from index_builder import INDEX_TYPES, build_index, build_settings, measure_recall
+from ingest_job import (
+    ALLOWED_EXTS,
+    CHUNK_CHARS,
+    CHUNK_OVERLAP,
+    DOCS_SUBDIR,
+    EMBED_MODEL,
+    Embedder,
+    chunk_chars,
+    chunking_config,
+    normalize,
+    parse_docx,
+    parse_pdf,
+    utc_iso,
+)
+from pdf_extract import resolve_backend
+from query_encoder import SAMPLE_QUERIES
+
+BENCH_SAMPLE_PER_TYPE = int(os.getenv("BENCH_SAMPLE_PER_TYPE", "20"))
+BENCH_MAX_CHUNKS = int(os.getenv("BENCH_MAX_CHUNKS", "4096"))
+BENCH_SEED = 1234
+
+PARSERS = {".pdf": parse_pdf, ".docx": parse_docx}
+
+
+def _summary(samples_ms: List[float]) -> Dict[str, Any]:
+    if not samples_ms:
+        return {"count": 0}
+    ordered = sorted(samples_ms)
+    last = len(ordered) - 1
+    return {
+        "count": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered), 3),
+        "p50_ms": round(statistics.median(ordered), 3),
+        "p95_ms": round(ordered[int(0.95 * last)], 3),
+        "p99_ms": round(ordered[int(0.99 * last)], 3),
+        "max_ms": round(ordered[-1], 3),
+    }
+
+
+def _git_commit() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip()
+
+
+def sample_files(docs_dir: Path, per_type: int, seed: int = BENCH_SEED) -> Dict[str, List[Path]]:
+    """Up to `per_type` files per extension, the same ones for the same tree and seed."""
+    by_ext: Dict[str, List[Path]] = {ext: [] for ext in sorted(ALLOWED_EXTS)}
+    for path in sorted(docs_dir.rglob("*")):
+        if path.is_file() and path.suffix.lower() in by_ext:
+            by_ext[path.suffix.lower()].append(path)
+    rng = random.Random(seed)
+    return {ext: sorted(rng.sample(paths, min(per_type, len(paths)))) for ext, paths in by_ext.items()}
+
+
+def bench_parse(files: Dict[str, List[Path]]) -> tuple[Dict[str, Any], List[str]]:
+    """Time parse_pdf/parse_docx per file. Returns (results per extension, parsed texts)."""
+    results: Dict[str, Any] = {}
+    texts: List[str] = []
+    for ext, paths in files.items():
+        parser = PARSERS[ext]
+        samples: List[float] = []
+        chars = 0
+        errors = 0
+        for path in paths:
+            start = time.perf_counter()
+            try:
+                text = normalize(parser(path))
+            except Exception as exc:  # noqa: BLE001
+                print(f"[BENCH] parse failed {path}: {type(exc).__name__}: {exc}", file=sys.stderr)
+                errors += 1
+                continue
+            samples.append((time.perf_counter() - start) * 1000)
+            chars += len(text)
+            if text:
+                texts.append(text)
+        seconds = sum(samples) / 1000
+        results[ext] = {
+            "files": len(paths),
+            "errors": errors,
+            "chars": chars,
+            "chars_per_second": round(chars / seconds, 1) if seconds else None,
+            **_summary(samples),
+        }
+    return results, texts
+
+
+def bench_chunk(texts: List[str], embedder: Embedder) -> tuple[Dict[str, Any], List[str]]:
+    """Time chunk_chars and the configured chunker. Returns (results, configured chunks)."""
+    results: Dict[str, Any] = {}
+    chunks: List[str] = []
+    runs = {
+        "chunk_chars": lambda text: chunk_chars(text, CHUNK_CHARS, CHUNK_OVERLAP),
+        "configured": embedder.chunk,
+    }
+    embedder.chunk("aquecimento")  # loads the model outside the timed loop
+    for name, chunk in runs.items():
+        samples: List[float] = []
+        count = 0
+        for text in texts:
+            start = time.perf_counter()
+            parts = chunk(text)
+            samples.append((time.perf_counter() - start) * 1000)
+            count += len(parts)
+            if name == "configured":
+                chunks.extend(parts)
+        seconds = sum(samples) / 1000
+        results[name] = {
+            "chunks": count,
+            "chunks_per_second": round(count / seconds, 1) if seconds else None,
+            **_summary(samples),
+        }
+    results["configured"]["chunking"] = chunking_config()
+    return results, chunks
+
+
+def bench_embed(chunks: List[str], embedder: Embedder) -> tuple[Dict[str, Any], np.ndarray]:
+    """Encode throughput in the same batches ingest uses. Returns (results, vectors)."""
+    embedder.encode(chunks[:8])  # warm-up
+    start = time.perf_counter()
+    vectors = embedder.encode(chunks)
+    seconds = time.perf_counter() - start
+    return {
+        "embed_model": EMBED_MODEL,
+        "chunks": len(chunks),
+        "seconds": round(seconds, 3),
+        "chunks_per_second": round(len(chunks) / seconds, 1) if seconds else None,
+    }, vectors
+
+
+def bench_index(vectors: np.ndarray, queries: np.ndarray, kinds: List[str], k: int, rounds: int) -> Dict[str, Any]:
+    """Build time, recall and single-query FAISS latency per index type."""
+    results: Dict[str, Any] = {}
+    for kind in kinds:
+        start = time.perf_counter()
+        try:
+            index, info, search_params = build_index(vectors, kind)
+        except (RuntimeError, ValueError) as exc:
+            # e.g. too few vectors to train IVF-PQ on a small sample
+            results[kind] = {"error": f"{type(exc).__name__}: {exc}"}
+            continue
+        build_seconds = time.perf_counter() - start
+        index.search(queries[:1], k)  # warm-up
+        samples: List[float] = []
+        for _ in range(rounds):
+            for row in range(len(queries)):
+                start = time.perf_counter()
+                index.search(queries[row:row + 1], k)
+                samples.append((time.perf_counter() - start) * 1000)
+        results[kind] = {
+            "build_seconds": round(build_seconds, 3),
+            "vectors": int(index.ntotal),
+            "index": info,
+            "search_params": search_params,
+            "recall": measure_recall(index, vectors),
+            "search": _summary(samples),
+        }
+    return results
+
+
+def bench_runtime_search(queries: List[str], k: int, rounds: int, area: str | None, query_cache: bool) -> Dict[str, Any]:
+    """LocalIndexRuntime.search end to end (encode + search + metadata) on the local artifacts."""
+    from index_local_runtime import ART_DIR, LocalIndexRuntime
+
+    runtime = LocalIndexRuntime()
+    if not runtime.exists():
+        return {"skipped": f"no index at {ART_DIR}"}
+    if not query_cache:
+        # Otherwise every round after the first only measures the LRU.
+        runtime.query_cache.max_size = 0
+    runtime.load()
+    runtime.search(queries[0], k, area)  # warm-up
+    samples: List[float] = []
+    for _ in range(rounds):
+        for query in queries:
+            start = time.perf_counter()
+            runtime.search(query, k, area)
+            samples.append((time.perf_counter() - start) * 1000)
+    return {
+        "artifacts": str(ART_DIR),
+        "revision": runtime.revision,
+        "areas": runtime.areas,
+        "area": area,
+        "query_cache": query_cache,
+        "encoder": runtime.model.name,
+        **_summary(samples),
+    }
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    queries = SAMPLE_QUERIES
+    if args.queries:
+        lines = Path(args.queries).read_text(encoding="utf-8").splitlines()
+        queries = [line.strip() for line in lines if line.strip()]
+
+    report: Dict[str, Any] = {
+        "created_at": utc_iso(),
+        "commit": _git_commit(),
+        "host": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "faiss_version": getattr(faiss, "__version__", None),
+        "config": {
+            "docs_dir": str(args.docs),
+            "sample_per_type": args.sample,
+            "max_chunks": args.max_chunks,
+            "queries": len(queries),
+            "rounds": args.rounds,
+            "k": args.k,
+            "index": build_settings(),
+            "pdf_backend": resolve_backend(),
+        },
+    }
+
+    files = sample_files(args.docs, args.sample)
+    print(f"[BENCH] parsing {sum(len(p) for p in files.values())} sampled files from {args.docs}", file=sys.stderr)
+    report["parse"], texts = bench_parse(files)
+
+    embedder = Embedder()
+    print(f"[BENCH] chunking {len(texts)} documents", file=sys.stderr)
+    report["chunk"], chunks = bench_chunk(texts, embedder)
+    chunks = chunks[:args.max_chunks]
+    if not chunks:
+        raise SystemExit("Nenhum chunk gerado a partir da amostra; confira --docs.")
+
+    print(f"[BENCH] encoding {len(chunks)} chunks", file=sys.stderr)
+    report["embed"], vectors = bench_embed(chunks, embedder)
+    query_vectors = embedder.encode(queries)
+
+    print(f"[BENCH] building indexes: {', '.join(args.index_types)}", file=sys.stderr)
+    report["index_build"] = bench_index(vectors, query_vectors, args.index_types, args.k, args.rounds)
+
+    if args.skip_runtime:
+        report["runtime_search"] = {"skipped": "--skip-runtime"}
+    else:
+        print("[BENCH] timing LocalIndexRuntime.search", file=sys.stderr)
+        report["runtime_search"] = bench_runtime_search(queries, args.k, args.rounds, args.area, args.query_cache)
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Time ingest stages and retrieval latency on a sample of the corpus.")
+    parser.add_argument("--docs", type=Path, default=Path(DOCS_SUBDIR), help="Directory with .pdf/.docx files")
+    parser.add_argument("--sample", type=int, default=BENCH_SAMPLE_PER_TYPE, help="Files sampled per extension")
+    parser.add_argument("--max-chunks", type=int, default=BENCH_MAX_CHUNKS, help="Chunks encoded and indexed")
+    parser.add_argument("--queries", default=None, help="Text file with one query per line (default: built-in sample)")
+    parser.add_argument("--rounds", type=int, default=5, help="Passes over the queries when timing searches")
+    parser.add_argument("--k", type=int, default=4, help="Hits per search")
+    parser.add_argument(
+        "--index-types",
+        type=lambda s: [t.strip() for t in s.split(",") if t.strip()],
+        default=sorted(INDEX_TYPES),
+        help="Comma-separated index types to build (default: all)",
+    )
+    parser.add_argument("--area", default=None, help="Area filter for the runtime search (sharded indexes)")
+    parser.add_argument("--query-cache", action="store_true", help="Keep the query embedding LRU on while timing")
+    parser.add_argument("--skip-runtime", action="store_true", help="Do not time LocalIndexRuntime.search")
+    parser.add_argument("--output", type=Path, default=None, help="Write the JSON report here (default: stdout)")
+    args = parser.parse_args()
+
+    unknown = set(args.index_types) - INDEX_TYPES
+    if unknown:
+        parser.error(f"unknown index types: {', '.join(sorted(unknown))}")
+
+    # stdout carries only the JSON report; progress (ours and the runtime's) goes to stderr.
+    with redirect_stdout(sys.stderr):
+        report = run(args)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(text + "\n", encoding="utf-8")
+        print(f"[BENCH] report written to {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
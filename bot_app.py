@@ -1,86 +1,355 @@
 import asyncio
 import os
+import re
+import threading
+import time
+from contextlib import aclosing
 
 import discord
-import requests
 from discord.ext import commands
 
-from hf_client import call_hf
-from index_local_runtime import LocalIndexRuntime
+from admission import AdmissionController, AdmissionRejected, SingleFlight
+from answer_cache import SemanticAnswerCache
+from artifact_sync import ARTIFACT_SOURCE, ArtifactSync, make_transport
+from context_packer import pack_context, token_counter
+from hf_client import acall_hf, astream_hf
+from metrics import (
+    ANSWER_CACHE_LOOKUPS,
+    ANSWER_STAGE_SECONDS,
+    ANSWERS,
+    ANSWERS_IN_FLIGHT,
+    CONTEXT_TOKENS,
+    GENERATION_ACTIVE,
+    GENERATION_QUEUED,
+    GENERATION_REJECTED,
+    timed,
+)
 from prompts import SYSTEM_PROMPT, build_user_prompt
+from reindex_jobs import JOBS
+from startup import STARTUP
 
 DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
 BOT_PREFIX = os.getenv("BOT_PREFIX", "!")
-REINDEX_API_TOKEN = os.getenv("REINDEX_API_TOKEN")
+REINDEX_POLL_SECONDS = float(os.getenv("REINDEX_POLL_SECONDS", "5"))
+HF_STREAM = os.getenv("HF_STREAM", "1") == "1"
+STREAM_EDIT_SECONDS = float(os.getenv("STREAM_EDIT_SECONDS", "1.0"))
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", "4"))
+STARTUP_MODE = os.getenv("STARTUP_MODE", "background").lower()
+ADMISSION_FAIRNESS = os.getenv("ADMISSION_FAIRNESS", "user").lower()
+NO_HITS_ANSWER = "Nao encontrei isso nos documentos."
+WARMING_UP_ANSWER = "Ainda estou aquecendo (carregando modelo e indice). Tente novamente em instantes."
+BUSY_ANSWER = "Estou ocupado com muitas perguntas agora. Tente novamente em instantes."
+# "--area penal pergunta" / "--area=processo_civil,penal pergunta"
+_AREA_FLAG = re.compile(r"^\s*--area(?:=|\s+)(\S+)\s*(.*)$", re.DOTALL)
 
 if not DISCORD_TOKEN:
     raise RuntimeError("DISCORD_TOKEN nao definido.")
+if STARTUP_MODE not in {"background", "blocking"}:
+    raise RuntimeError(f"STARTUP_MODE invalido: {STARTUP_MODE} (use background ou blocking)")
+if ADMISSION_FAIRNESS not in {"user", "channel"}:
+    raise RuntimeError(f"ADMISSION_FAIRNESS invalido: {ADMISSION_FAIRNESS} (use user ou channel)")
 
-index_rt = LocalIndexRuntime()
+# Set by warm_up(); None until the model (and index, if present) are loaded.
+index_rt = None
+retriever = None
+answer_cache = None
+
+# Identical concurrent questions share one answer; distinct ones queue for a generation slot.
+INFLIGHT = SingleFlight()
+ADMISSION = AdmissionController()
+GENERATION_ACTIVE.set_function(lambda: ADMISSION.active)
+GENERATION_QUEUED.set_function(lambda: ADMISSION.queued)
 
 intents = discord.Intents.default()
 intents.message_content = True
 bot = commands.Bot(command_prefix=BOT_PREFIX, intents=intents)
 
 
-def _format_context(hits):
-    return "\n\n---\n\n".join(
-        [f"[{h['source']}] (score={h['score']:.3f})\n{h['text']}" for h in hits]
-    )
+def warm_up() -> None:
+    """Import faiss/torch, load the query encoder and index, and run one encode."""
+    global index_rt, retriever, answer_cache
+    try:
+        sync = None
+        if ARTIFACT_SOURCE != "local":
+            with STARTUP.phase("sync artifacts"):
+                sync = ArtifactSync(make_transport())
+                try:
+                    sync.sync_once()
+                except Exception as exc:  # noqa: BLE001
+                    # Serve whatever is already in storage; the sync thread retries.
+                    print(f"[SYNC] initial sync failed: {type(exc).__name__}: {exc}")
+        with STARTUP.phase("import runtime"):
+            from index_local_runtime import LocalIndexRuntime
+            from retrieval_batcher import RetrievalBatcher
+        with STARTUP.phase("load query encoder"):
+            runtime = LocalIndexRuntime()
+        if runtime.exists():
+            with STARTUP.phase("load index"):
+                try:
+                    runtime.load()
+                except Exception as exc:  # noqa: BLE001
+                    # Not fatal: searches retry via ensure_loaded and report the error.
+                    print(f"[BOT] falha ao carregar indice: {type(exc).__name__}: {exc}")
+        else:
+            print("[BOT] indice ainda nao existe; rode !reindex")
+        with STARTUP.phase("load context tokenizer"):
+            token_counter()
+        with STARTUP.phase("first encode"):
+            # The first call pays for lazy kernel/graph setup; keep it off a user's query.
+            runtime.model.encode(["aquecimento"])
+        answer_cache = SemanticAnswerCache(runtime.model.name)
+        answer_cache.start_autosave()
+        index_rt = runtime
+        retriever = RetrievalBatcher(runtime)
+        runtime.start_reload_watcher()
+        if sync is not None:
+            sync.on_update = runtime.load
+            sync.start()
+        STARTUP.mark_ready()
+    except Exception as exc:  # noqa: BLE001
+        STARTUP.fail(exc)
+
+
+def _not_ready_answer() -> str | None:
+    if STARTUP.error:
+        return f"Falha ao iniciar: {STARTUP.error}"
+    if not STARTUP.ready.is_set():
+        return WARMING_UP_ANSWER
+    return None
+
+
+def _requester(author, channel) -> str:
+    """Fairness key for admission control."""
+    if ADMISSION_FAIRNESS == "channel" or author is None:
+        return f"channel:{getattr(channel, 'id', '')}"
+    return f"user:{author.id}"
 
 
-async def _build_answer(question: str) -> str:
-    index_rt.maybe_reload()
-    hits = index_rt.search(question, k=4)
+def _question_key(question: str) -> str:
+    return " ".join(question.casefold().split())
+
+
+def _split_area(question: str) -> tuple[str | None, str]:
+    m = _AREA_FLAG.match(question)
+    if not m:
+        return None, question
+    return m.group(1), m.group(2).strip()
+
+
+async def _build_messages(question: str, area: str | None = None):
+    # Includes the batching window; "encode" and "search" are timed inside the runtime.
+    with timed("retrieve"):
+        hits = await retriever.search(question, k=RAG_TOP_K, area=area)
     if not hits:
-        return "Nao encontrei isso nos documentos."
+        return None
+
+    with timed("format"):
+        # Adjacent chunks of one source are merged and the whole is cut to CONTEXT_MAX_TOKENS.
+        context, stats = pack_context(hits)
+        CONTEXT_TOKENS.observe(stats["tokens"])
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": build_user_prompt(question, context)},
+        ]
+
+
+async def _build_answer(question: str, area: str | None = None) -> str | None:
+    messages = await _build_messages(question, area)
+    if messages is None:
+        return None
+    with timed("generate"):
+        return await acall_hf(messages)
+
+
+async def _reply_answer(reply, question: str, requester: str = "") -> None:
+    """Answer via `reply` (ctx.reply / message.reply).
+
+    With HF_STREAM, the first tokens go out in a placeholder message that is
+    edited at most every STREAM_EDIT_SECONDS (Discord rate-limits edits).
+    A leading `--area X` limits retrieval to those index shards. `requester`
+    is the admission fairness key (see _requester).
+    """
+    not_ready = _not_ready_answer()
+    if not_ready:
+        ANSWERS.labels("not_ready").inc()
+        await reply(not_ready)
+        return
+
+    with ANSWERS_IN_FLIGHT.track_inprogress(), timed("total"):
+        outcome = await _reply_ready(reply, question, requester)
+    ANSWERS.labels(outcome).inc()
+
+
+async def _reply_ready(reply, question: str, requester: str) -> str:
+    """Body of _reply_answer once warm; returns the outcome label for ANSWERS."""
+    area, question = _split_area(question)
+    if area:
+        if not question:
+            await reply("Informe a pergunta depois de --area. Ex: !rag --area penal o que e peculato?")
+            return "bad_request"
+        try:
+            await asyncio.to_thread(index_rt.match_areas, area)
+        except ValueError as exc:
+            await reply(str(exc)[:1900])
+            return "bad_request"
+
+    token = index_rt.token if answer_cache.enabled else None
+    # Article/súmula questions are answered from the citation index; a semantically
+    # close cached answer is as likely to be about a neighbouring article.
+    if token and await asyncio.to_thread(index_rt.cites, question, area):
+        token = None
+
+    try:
+        (outcome, text), shared = await INFLIGHT.do(
+            (_question_key(question), area),
+            lambda: _answer_once(reply, question, area, requester, token),
+        )
+    except AdmissionRejected as exc:
+        GENERATION_REJECTED.labels(exc.reason).inc()
+        await reply(BUSY_ANSWER)
+        return "busy"
+    if shared:
+        # Another asker's identical question was already being answered.
+        await reply((text or NO_HITS_ANSWER)[:1900])
+        return "coalesced"
+    return outcome
+
+
+async def _answer_once(reply, question: str, area: str | None, requester: str, token) -> tuple[str, str]:
+    """Single-flight leader: semantic cache, then admission and generation.
 
-    context = _format_context(hits)
-    messages = [
-        {"role": "system", "content": SYSTEM_PROMPT},
-        {"role": "user", "content": build_user_prompt(question, context)},
-    ]
-    return await asyncio.to_thread(call_hf, messages)
+    The question is encoded only here, after coalescing and only when the
+    cache is used (`token` set); retrieval then finds it in the query LRU.
+    """
+    vector = None
+    if token:
+        with timed("answer_cache"):
+            vector = (await asyncio.to_thread(index_rt.encode_query, question))[0]
+            cached = answer_cache.get(vector, question, area, token)
+        ANSWER_CACHE_LOOKUPS.labels("hit" if cached else "miss").inc()
+        if cached:
+            await reply(cached[:1900])
+            return "cached", cached
+
+    start = time.monotonic()
+    async with ADMISSION.slot(requester):
+        ANSWER_STAGE_SECONDS.labels("admission_wait").observe(time.monotonic() - start)
+        return await _generate_reply(reply, question, area, vector, token)
+
+
+async def _generate_reply(reply, question: str, area: str | None, vector, token) -> tuple[str, str]:
+    """Retrieve, generate and send the answer; returns (outcome, answer text)."""
+    if not HF_STREAM:
+        answer = await _build_answer(question, area)
+        await reply((answer or NO_HITS_ANSWER)[:1900])
+        if answer:
+            _remember_answer(vector, question, area, token, answer)
+        return ("answered" if answer else "no_hits"), answer or ""
+
+    messages = await _build_messages(question, area)
+    if messages is None:
+        await reply(NO_HITS_ANSWER)
+        return "no_hits", ""
+
+    sent = None
+    text = ""
+    last_edit = 0.0
+    start = time.monotonic()
+    with timed("generate"):
+        async with aclosing(astream_hf(messages)) as stream:
+            async for piece in stream:
+                text += piece
+                if not text.strip():
+                    continue
+                now = time.monotonic()
+                if sent is None:
+                    ANSWER_STAGE_SECONDS.labels("first_token").observe(now - start)
+                    sent = await reply(text[:1900])
+                    last_edit = now
+                elif now - last_edit >= STREAM_EDIT_SECONDS:
+                    await sent.edit(content=text[:1900])
+                    last_edit = now
+
+    text = text.strip()
+    if sent is None:
+        await reply((text or NO_HITS_ANSWER)[:1900])
+    elif text:
+        await sent.edit(content=text[:1900])
+    if text:
+        _remember_answer(vector, question, area, token, text)
+    return ("answered" if text else "no_hits"), text
+
+
+def _remember_answer(vector, question: str, area: str | None, token: str | None, answer: str) -> None:
+    # In memory only; the autosave thread and run_bot's shutdown write it to disk.
+    if vector is None or not token:
+        return
+    answer_cache.put(vector, question, area, token, answer)
 
 
 @bot.event
 async def on_ready():
     print(f"[BOT] logged in as {bot.user}")
-    if index_rt.exists():
-        index_rt.load()
-    else:
-        print("[BOT] indice ainda nao existe; rode !reindex")
 
 
 @bot.command(name="rag")
 async def rag_cmd(ctx, *, question: str):
     try:
-        answer = await _build_answer(question)
-        await ctx.reply(answer[:1900])
+        await _reply_answer(ctx.reply, question, _requester(ctx.author, ctx.channel))
     except Exception as exc:  # noqa: BLE001
+        ANSWERS.labels("error").inc()
         await ctx.reply(f"Falha ao responder: {type(exc).__name__}: {exc}")
 
 
+@bot.command(name="areas")
+async def areas_cmd(ctx):
+    """Lists the index shards accepted by `!rag --area`."""
+    not_ready = _not_ready_answer()
+    if not_ready:
+        await ctx.reply(not_ready)
+        return
+    areas = index_rt.areas
+    if not areas or areas == ["all"]:
+        await ctx.reply("Indice sem areas (INDEX_SHARDING=none ou indice nao carregado).")
+        return
+    await ctx.reply(("Areas: " + ", ".join(areas))[:1900])
+
+
 @bot.command(name="reindex")
 @commands.has_permissions(administrator=True)
-async def reindex_cmd(ctx):
-    await ctx.reply("Iniciando reindex... (pode demorar)")
-    try:
-        headers = {}
-        if REINDEX_API_TOKEN:
-            headers["Authorization"] = f"Bearer {REINDEX_API_TOKEN}"
-        r = await asyncio.to_thread(
-            requests.post,
-            "http://127.0.0.1:7860/reindex",
-            headers=headers,
-            timeout=3600,
-        )
-        txt = r.text
-        await ctx.reply(("Reindex concluido\n" + txt)[:1900])
-        if index_rt.exists():
-            index_rt.load()
-    except Exception as exc:  # noqa: BLE001
-        await ctx.reply(f"Falha no reindex: {type(exc).__name__}: {exc}")
+async def reindex_cmd(ctx, action: str = ""):
+    """`!reindex` queues a rebuild and reports when it ends; `!reindex status|cancel`."""
+    if action == "status":
+        job = JOBS.active() or next(iter(JOBS.list()), None)
+        await ctx.reply(_job_status_text(job) if job else "Nenhum reindex registrado.")
+        return
+    if action == "cancel":
+        job = JOBS.active()
+        if job is None:
+            await ctx.reply("Nenhum reindex em andamento.")
+            return
+        JOBS.cancel(job.id)
+        await ctx.reply(f"Cancelando reindex {job.id}...")
+        return
+
+    job = JOBS.submit("discord")
+    await ctx.reply(f"Reindex {job.id} na fila (status: `!reindex status`, cancelar: `!reindex cancel`).")
+    while not job.done.is_set():
+        await asyncio.sleep(REINDEX_POLL_SECONDS)
+    await ctx.reply(_job_status_text(job)[:1900])
+    if job.status == "succeeded" and index_rt is not None and index_rt.exists():
+        try:
+            await asyncio.to_thread(index_rt.load)
+        except Exception as exc:  # noqa: BLE001
+            await ctx.reply(f"Falha ao recarregar indice: {type(exc).__name__}: {exc}")
+
+
+def _job_status_text(job) -> str:
+    text = f"Reindex {job.summary()}"
+    if job.progress:
+        p = job.progress
+        text += f"\n{p['desc'] or 'progresso'}: {p['current']}/{p['total']} ({p['percent']}%)"
+    return text
 
 
 @bot.event
@@ -101,11 +370,19 @@ async def on_message(message: discord.Message):
             return
 
         try:
-            answer = await _build_answer(content)
-            await message.reply(answer[:1900])
+            await _reply_answer(message.reply, content, _requester(message.author, message.channel))
         except Exception as exc:  # noqa: BLE001
+            ANSWERS.labels("error").inc()
             await message.reply(f"Falha ao responder: {type(exc).__name__}: {exc}")
 
 
 def run_bot():
-    bot.run(DISCORD_TOKEN)
+    if STARTUP_MODE == "blocking":
+        warm_up()
+    else:
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    try:
+        bot.run(DISCORD_TOKEN)
+    finally:
+        if answer_cache is not None:
+            answer_cache.save_if_dirty()
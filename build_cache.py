@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Set, Tuple
+
+import numpy as np
+
+
+def _atomic_write_bytes(path: Path, data: bytes) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+class BuildCache:
+    """Persistent per-file cache for ingest.
+
+    Parsed text is keyed by the file's sha256 (it does not depend on the
+    embedding setup). PDFs (`pdf=True`) add the PDF backend when it is not
+    pypdf, so switching backends re-parses only PDFs; pypdf keeps the plain
+    keys of caches written before backends were selectable. Chunks and
+    vectors are keyed by the same plus embed model + chunking params, so
+    changing any of them invalidates just that layer.
+    """
+
+    def __init__(self, root: Path, embed_model: str, chunking: Dict[str, Any], pdf_backend: str = "pypdf") -> None:
+        self.root = root
+        self.text_dir = root / "text"
+        self.embed_dir = root / "embed"
+        self.text_dir.mkdir(parents=True, exist_ok=True)
+        self.embed_dir.mkdir(parents=True, exist_ok=True)
+        self.text_variant = "" if pdf_backend == "pypdf" else pdf_backend
+        self.config = f"{embed_model}|{json.dumps(chunking, sort_keys=True)}"
+        self.stats: Dict[str, int] = {
+            "parse_hits": 0,
+            "parse_misses": 0,
+            "embed_hits": 0,
+            "embed_misses": 0,
+        }
+        self._used_text: Set[str] = set()
+        self._used_embed: Set[str] = set()
+
+    def embed_key(self, digest: str, pdf: bool = False) -> str:
+        config = f"{self.config}|{self.text_variant}" if pdf and self.text_variant else self.config
+        return hashlib.sha256(f"{digest}|{config}".encode("utf-8")).hexdigest()
+
+    def text_key(self, digest: str, pdf: bool = False) -> str:
+        return f"{digest}.{self.text_variant}" if pdf and self.text_variant else digest
+
+    def get_text(self, digest: str, pdf: bool = False) -> str | None:
+        key = self.text_key(digest, pdf)
+        self._used_text.add(key)
+        path = self.text_dir / f"{key}.txt"
+        if not path.exists():
+            self.stats["parse_misses"] += 1
+            return None
+        self.stats["parse_hits"] += 1
+        return path.read_text(encoding="utf-8")
+
+    def get_text_stats(self, digest: str, pdf: bool = False) -> Dict[str, Any] | None:
+        """Parse stats saved with the text (pages, chars, seconds...), if any."""
+        try:
+            path = self.text_dir / f"{self.text_key(digest, pdf)}.stats.json"
+            return json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def put_text(self, digest: str, text: str, stats: Dict[str, Any] | None = None, pdf: bool = False) -> None:
+        key = self.text_key(digest, pdf)
+        self._used_text.add(key)
+        _atomic_write_bytes(self.text_dir / f"{key}.txt", text.encode("utf-8"))
+        if stats is not None:
+            _atomic_write_bytes(self.text_dir / f"{key}.stats.json", json.dumps(stats).encode("utf-8"))
+
+    def get_chunks(self, digest: str, pdf: bool = False) -> Tuple[List[str], np.ndarray] | None:
+        key = self.embed_key(digest, pdf)
+        self._used_embed.add(key)
+        chunks_path = self.embed_dir / f"{key}.json"
+        vectors_path = self.embed_dir / f"{key}.npy"
+        if not chunks_path.exists() or not vectors_path.exists():
+            self.stats["embed_misses"] += 1
+            return None
+        try:
+            parts = json.loads(chunks_path.read_text(encoding="utf-8"))
+            vectors = np.load(vectors_path)
+        except Exception:  # noqa: BLE001
+            self.stats["embed_misses"] += 1
+            return None
+        if len(parts) != vectors.shape[0]:
+            self.stats["embed_misses"] += 1
+            return None
+        self.stats["embed_hits"] += 1
+        return parts, np.asarray(vectors, dtype="float32")
+
+    def put_chunks(self, digest: str, parts: List[str], vectors: np.ndarray, pdf: bool = False) -> None:
+        key = self.embed_key(digest, pdf)
+        self._used_embed.add(key)
+        vectors_path = self.embed_dir / f"{key}.npy"
+        tmp = vectors_path.with_name(vectors_path.name + ".tmp")
+        with tmp.open("wb") as f:
+            np.save(f, np.asarray(vectors, dtype="float32"))
+        os.replace(tmp, vectors_path)
+        # json last: get_chunks treats a missing json as a miss.
+        _atomic_write_bytes(
+            self.embed_dir / f"{key}.json",
+            json.dumps(parts, ensure_ascii=False).encode("utf-8"),
+        )
+
+    def prune(self) -> int:
+        """Remove entries not touched in this run (deleted or changed files)."""
+        removed = 0
+        for path in self.text_dir.iterdir():
+            key = path.name.removesuffix(".stats.json").removesuffix(".txt")
+            if key != path.name and key not in self._used_text:
+                path.unlink(missing_ok=True)
+                removed += 1
+        for path in self.embed_dir.iterdir():
+            if path.suffix in {".json", ".npy"} and path.stem not in self._used_embed:
+                path.unlink(missing_ok=True)
+                removed += 1
+        return removed
@@ -0,0 +1,96 @@
+import re
+from typing import Any, List
+
+# Lines that open a new legal unit. A chunk that is already half full is cut
+# before a major boundary so articles/súmulas don't straddle chunks needlessly.
+_MAJOR = re.compile(
+    r"^\s*(?:(?:Art|ART)\.?\s*\d|s[úu]mula\b|t[íi]tulo\b|cap[íi]tulo\b|se[çc][ãa]o\b|livro\b|parte\s+(?:geral|especial)\b)",
+    re.IGNORECASE,
+)
+
+
+def is_major_boundary(line: str) -> bool:
+    return bool(_MAJOR.match(line))
+
+
+class TokenChunker:
+    """Packs lines of a legal text into chunks of at most `max_tokens` tokens.
+
+    Sizes come from the embedding model's own (fast) tokenizer, so every chunk
+    fits the encoder window and nothing is silently truncated. All lines of a
+    document are tokenized in one batched call. Lines longer than the budget
+    are split on token offsets.
+    """
+
+    def __init__(self, tokenizer: Any, max_tokens: int, overlap_tokens: int = 0) -> None:
+        if max_tokens <= 0:
+            raise ValueError("max_tokens deve ser > 0")
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self.overlap_tokens = max(0, min(overlap_tokens, max_tokens // 2))
+        self.min_fill = max_tokens // 2
+
+    def _count(self, lines: List[str]) -> List[int]:
+        enc = self.tokenizer(lines, add_special_tokens=False, return_attention_mask=False)
+        return [len(ids) for ids in enc["input_ids"]]
+
+    def _split_long(self, line: str) -> List[str]:
+        enc = self.tokenizer(line, add_special_tokens=False, return_offsets_mapping=True)
+        offsets = enc["offset_mapping"]
+        pieces: List[str] = []
+        for start in range(0, len(offsets), self.max_tokens):
+            window = offsets[start:start + self.max_tokens]
+            begin = window[0][0]
+            end = offsets[start + self.max_tokens][0] if start + self.max_tokens < len(offsets) else len(line)
+            piece = line[begin:end].strip()
+            if piece:
+                pieces.append(piece)
+        return pieces
+
+    def chunk(self, text: str) -> List[str]:
+        lines = [line.strip() for line in text.split("\n")]
+        lines = [line for line in lines if line]
+        if not lines:
+            return []
+        counts = self._count(lines)
+
+        out: List[str] = []
+        cur: List[str] = []
+        cur_counts: List[int] = []
+        fresh = False  # cur holds lines not yet emitted (not just carried overlap)
+
+        def flush() -> None:
+            nonlocal cur, cur_counts, fresh
+            if cur and fresh:
+                out.append("\n".join(cur))
+            fresh = False
+            keep: List[str] = []
+            keep_counts: List[int] = []
+            budget = self.overlap_tokens
+            for line, n in zip(reversed(cur), reversed(cur_counts)):
+                if n > budget:
+                    break
+                keep.insert(0, line)
+                keep_counts.insert(0, n)
+                budget -= n
+            cur, cur_counts = keep, keep_counts
+
+        for line, n in zip(lines, counts):
+            if n > self.max_tokens:
+                flush()
+                cur, cur_counts = [], []
+                out.extend(self._split_long(line))
+                continue
+            total = sum(cur_counts)
+            if cur and (total + n > self.max_tokens or (total >= self.min_fill and is_major_boundary(line))):
+                flush()
+                # Drop carried-over overlap if it leaves no room for the new line.
+                while cur and sum(cur_counts) + n > self.max_tokens:
+                    cur.pop(0)
+                    cur_counts.pop(0)
+            cur.append(line)
+            cur_counts.append(n)
+            fresh = True
+
+        flush()
+        return out
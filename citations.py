@@ -0,0 +1,184 @@
+import json
+import re
+import unicodedata
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+# Anchor keys:
+#   "<law>|art:<n>"        e.g. "dl:3689|art:312", "lei:8666|art:24-a"
+#   "sumula:<court>:<n>"   e.g. "sumula:stf:691", "sumula:sv:11"
+# Laws are "<kind>:<number>" with kind in lei/lc/dl/dec, plus "cf:1988".
+
+CITATIONS_VERSION = 1
+
+# Common abbreviations -> law key.
+LAW_ALIASES: Dict[str, str] = {
+    "cf": "cf:1988",
+    "crfb": "cf:1988",
+    "cp": "dl:2848",
+    "cpp": "dl:3689",
+    "cpc": "lei:13105",
+    "cc": "lei:10406",
+    "clt": "dl:5452",
+    "ctn": "lei:5172",
+    "cdc": "lei:8078",
+    "eca": "lei:8069",
+    "lep": "lei:7210",
+    "ctb": "lei:9503",
+    "cpm": "dl:1001",
+    "cppm": "dl:1002",
+    "lindb": "dl:4657",
+    "lia": "lei:8429",
+    "constituição federal": "cf:1988",
+    "constituicao federal": "cf:1988",
+    "código penal": "dl:2848",
+    "codigo penal": "dl:2848",
+    "código de processo penal": "dl:3689",
+    "codigo de processo penal": "dl:3689",
+    "código de processo civil": "lei:13105",
+    "codigo de processo civil": "lei:13105",
+    "código civil": "lei:10406",
+    "codigo civil": "lei:10406",
+}
+_ALIAS_ALT = "|".join(re.escape(a) for a in sorted(LAW_ALIASES, key=len, reverse=True))
+
+_KIND_WORDS = {
+    "lei complementar": "lc",
+    "lc": "lc",
+    "decreto lei": "dl",
+    "dec lei": "dl",
+    "dl": "dl",
+    "decreto": "dec",
+    "dec": "dec",
+    "lei": "lei",
+}
+
+# Anchored at line start so only the title line counts, not "Regulamenta a Lei nº ...".
+_HEADER_LAW = re.compile(
+    r"(?m)^\s*(lei complementar|decreto[- ]lei|decreto|lei)\s+n?[º°o.]*\s*(\d{1,3}(?:\.\d{3})+|\d+)",
+    re.IGNORECASE,
+)
+# The ementa after the title names the laws this one amends or regulates.
+_EMENTA_VERB = re.compile(r"\b(?:regulamenta|altera|revoga|acrescenta|d[áa] nova reda[çc][ãa]o)\b")
+_STEM_LAW = re.compile(r"(?:^|_)(lei|lc|dl|dec_lei|decreto|dec)_(\d{1,3}(?:_\d{3})+|\d+)(?=_|$)")
+_STEM_COURT = re.compile(r"sumulas?_(?:do_|da_|dos_)?(vinculantes?|stf|stj|tse|tnu|tcu|stm|tst)(?:_|$)")
+
+# Case-sensitive on purpose: an article heading is "Art."/"ART.", while a
+# lowercase "art." at line start is usually a wrapped cross-reference.
+_ARTICLE_LINE = re.compile(r"(?m)^\s*(?:Art|ART)\.?\s*(\d{1,4})\s*(?:[º°o]\.?)?(?:\s*-\s*([A-Za-z])\b)?")
+_SUMULA_LINE = re.compile(
+    # The number either ends the line ("SÚMULA VINCULANTE 11") or is followed by punctuation.
+    r"(?m)^\s*s[úu]mula(?:\s+vinculante)?\s*(?:n[º°o.]*\s*)?(\d{1,4})\s*(?:[:\-–.]|$)",
+    re.IGNORECASE,
+)
+
+_QUERY_ARTICLE = re.compile(
+    r"\bart(?:igo)?\.?\s*(\d{1,4})\s*(?:[º°o]\.?)?(?:\s*-\s*([a-z])\b)?"
+    r"[^\n]{0,12}?\b(?:d[aoe]s?\s+)?"
+    rf"(?:(?P<alias>{_ALIAS_ALT})\b|(?P<kind>lei complementar|decreto[- ]lei|decreto|lei|lc|dl)\s*n?[º°o.]*\s*"
+    r"(?P<num>\d{1,3}(?:\.\d{3})+|\d+))",
+    re.IGNORECASE,
+)
+_QUERY_SUMULA = re.compile(
+    r"\bs[úu]mula\s*(?P<vinc>vinculante)?\s*(?:n[º°o.]*\s*)?(?P<num>\d{1,4})\b"
+    r"(?:[^\n]{0,8}?\b(?:d[oa]\s+)?(?P<court>stf|stj|tse|tnu|tcu|stm|tst)\b)?",
+    re.IGNORECASE,
+)
+
+
+def _fold(text: str) -> str:
+    return unicodedata.normalize("NFC", text).lower()
+
+
+def _law_key(kind_word: str, number: str) -> str:
+    kind = _KIND_WORDS[re.sub(r"[_-]", " ", kind_word.lower())]
+    return f"{kind}:{int(re.sub(r'[._]', '', number))}"
+
+
+def document_keys(source_path: str, text: str) -> List[str]:
+    """Law/court identifiers of a document, from its file name and header."""
+    stem = Path(source_path).stem.lower()
+    keys: List[str] = []
+
+    m = _STEM_COURT.search(stem)
+    if m:
+        court = m.group(1)
+        # Súmula compilations cite laws in their headers; those aren't the doc's identity.
+        return ["court:sv" if court.startswith("vinculante") else f"court:{court}"]
+
+    header = _fold(text[:800])
+    m = _STEM_LAW.search(stem)
+    if m:
+        # The file name is the most reliable identity; the header only fills in when it has none.
+        keys.append(_law_key(m.group(1), m.group(2)))
+    else:
+        verb = _EMENTA_VERB.search(header)
+        m = _HEADER_LAW.search(header[: verb.start()] if verb else header)
+        if m:
+            keys.append(_law_key(m.group(1), m.group(2)))
+    if "constituição da república federativa do brasil" in header and "art. 1" in _fold(text[:6000]):
+        keys.append("cf:1988")
+
+    return list(dict.fromkeys(keys))
+
+
+def chunk_anchors(doc_keys: Iterable[str], chunk_text: str) -> List[str]:
+    """Anchors for articles/súmulas that start (at line start) inside the chunk."""
+    laws = [k for k in doc_keys if not k.startswith("court:")]
+    courts = [k.split(":", 1)[1] for k in doc_keys if k.startswith("court:")]
+    anchors: List[str] = []
+
+    if laws:
+        for m in _ARTICLE_LINE.finditer(chunk_text):
+            art = m.group(1).lstrip("0") or "0"
+            if m.group(2):
+                art += f"-{m.group(2).lower()}"
+            anchors.extend(f"{law}|art:{art}" for law in laws)
+
+    if courts:
+        for m in _SUMULA_LINE.finditer(chunk_text):
+            anchors.extend(f"sumula:{court}:{int(m.group(1))}" for court in courts)
+
+    return list(dict.fromkeys(anchors))
+
+
+def query_anchors(query: str) -> List[str]:
+    """Anchor keys referenced by a query, or [] if it has no resolvable citation."""
+    text = _fold(query)
+    anchors: List[str] = []
+
+    for m in _QUERY_ARTICLE.finditer(text):
+        if m.group("alias"):
+            law = LAW_ALIASES[m.group("alias")]
+        else:
+            law = _law_key(m.group("kind"), m.group("num"))
+        art = m.group(1).lstrip("0") or "0"
+        if m.group(2):
+            art += f"-{m.group(2)}"
+        anchors.append(f"{law}|art:{art}")
+
+    for m in _QUERY_SUMULA.finditer(text):
+        if m.group("vinc"):
+            court = "sv"
+        elif m.group("court"):
+            court = m.group("court")
+        else:
+            # "Súmula 691" alone is ambiguous across courts.
+            continue
+        anchors.append(f"sumula:{court}:{int(m.group('num'))}")
+
+    return list(dict.fromkeys(anchors))
+
+
+def write_citation_index(path: Path, anchors: Dict[str, List[int]]) -> None:
+    payload = {"version": CITATIONS_VERSION, "anchors": anchors}
+    path.write_text(json.dumps(payload, ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
+
+
+def load_citation_index(path: Path) -> Dict[str, List[int]]:
+    if not path.exists():
+        return {}
+    payload = json.loads(path.read_text(encoding="utf-8"))
+    if payload.get("version") != CITATIONS_VERSION:
+        return {}
+    return payload.get("anchors", {})
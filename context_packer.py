@@ -0,0 +1,172 @@
+import os
+import re
+import threading
+from typing import Any, Callable, Dict, List
+
+HF_TOKEN = os.getenv("HF_TOKEN")
+HF_TEXT_MODEL = os.getenv("HF_TEXT_MODEL", "microsoft/Phi-3.5-mini-instruct")
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "1500"))
+# Hub repo whose tokenizer.json counts prompt tokens; empty = estimate from chars.
+CONTEXT_TOKENIZER = os.getenv("CONTEXT_TOKENIZER", HF_TEXT_MODEL)
+CONTEXT_CHARS_PER_TOKEN = float(os.getenv("CONTEXT_CHARS_PER_TOKEN", "3.5"))
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.85"))
+
+SEPARATOR = "\n\n---\n\n"
+# A partial block shorter than this is more noise than context.
+MIN_BLOCK_TOKENS = 64
+# chunk_chars overlaps 200 chars by default; leave room for larger settings.
+MAX_OVERLAP_CHARS = 2000
+_OVERLAP_PROBE = 40
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+_counter: Callable[[str], int] | None = None
+_counter_lock = threading.Lock()
+
+
+def _estimate_tokens(text: str) -> int:
+    return int(len(text) / CONTEXT_CHARS_PER_TOKEN) + 1
+
+
+def token_counter() -> Callable[[str], int]:
+    """Token count for HF_TEXT_MODEL's tokenizer, or a chars/token estimate.
+
+    The tokenizer loads once (warm-up calls this); any failure falls back to
+    the estimate rather than blocking answers.
+    """
+    global _counter
+    with _counter_lock:
+        if _counter is None:
+            _counter = _estimate_tokens
+            if CONTEXT_TOKENIZER:
+                try:
+                    from tokenizers import Tokenizer
+
+                    tokenizer = Tokenizer.from_pretrained(CONTEXT_TOKENIZER, token=HF_TOKEN)
+                    _counter = lambda text: len(tokenizer.encode(text, add_special_tokens=False).ids)
+                    print(f"[CONTEXT] counting tokens with {CONTEXT_TOKENIZER}")
+                except Exception as exc:  # noqa: BLE001
+                    print(
+                        f"[CONTEXT] tokenizer {CONTEXT_TOKENIZER} unavailable, estimating "
+                        f"{CONTEXT_CHARS_PER_TOKEN:g} chars/token: {type(exc).__name__}: {exc}"
+                    )
+        return _counter
+
+
+def _join_overlapping(a: str, b: str) -> str:
+    """`a` + `b` without the text `b` repeats from the end of `a` (chunk overlap)."""
+    tail_start = max(0, len(a) - MAX_OVERLAP_CHARS)
+    probe = b[:_OVERLAP_PROBE]
+    if probe:
+        pos = a.find(probe, tail_start)
+        while pos != -1:
+            if b.startswith(a[pos:]):
+                return a[:pos] + b
+            pos = a.find(probe, pos + 1)
+    return a + "\n" + b
+
+
+def merge_adjacent(hits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Fuse hits of the same source whose chunk_ids are equal or consecutive.
+
+    A merged block keeps the best score of its parts and lists their chunk_ids.
+    """
+    by_source: Dict[str, List[Dict[str, Any]]] = {}
+    for hit in hits:
+        by_source.setdefault(hit["source"], []).append(hit)
+
+    blocks: List[Dict[str, Any]] = []
+    for source, group in by_source.items():
+        group.sort(key=lambda h: h["chunk_id"])
+        current: Dict[str, Any] | None = None
+        for hit in group:
+            if current is not None and hit["chunk_id"] <= current["chunk_ids"][-1] + 1:
+                if hit["chunk_id"] != current["chunk_ids"][-1]:
+                    current["text"] = _join_overlapping(current["text"], hit["text"])
+                    current["chunk_ids"].append(hit["chunk_id"])
+                current["score"] = max(current["score"], hit["score"])
+                continue
+            current = {"source": source, "text": hit["text"], "score": hit["score"], "chunk_ids": [hit["chunk_id"]]}
+            blocks.append(current)
+    blocks.sort(key=lambda b: -b["score"])
+    return blocks
+
+
+def _shingles(text: str) -> set:
+    words = _WORD.findall(text.lower())
+    if len(words) < 3:
+        return set(words)
+    return {" ".join(words[i:i + 3]) for i in range(len(words) - 2)}
+
+
+def drop_near_duplicates(blocks: List[Dict[str, Any]], threshold: float = CONTEXT_DEDUP_THRESHOLD) -> List[Dict[str, Any]]:
+    """Drop blocks whose word 3-grams are mostly (>= threshold) inside a better block.
+
+    Catches the same article reproduced in two compilations, including a
+    short copy contained in a longer merged block. `blocks` must be sorted
+    best first.
+    """
+    kept: List[Dict[str, Any]] = []
+    kept_shingles: List[set] = []
+    for block in blocks:
+        sh = _shingles(block["text"])
+        if sh and any(len(sh & other) / len(sh) >= threshold for other in kept_shingles):
+            continue
+        kept.append(block)
+        kept_shingles.append(sh)
+    return kept
+
+
+def _format_block(block: Dict[str, Any], text: str) -> str:
+    return f"[{block['source']}] (score={block['score']:.3f})\n{text}"
+
+
+def _truncate(text: str, max_tokens: int, count: Callable[[str], int]) -> str:
+    """Longest prefix of `text`, cut at a word boundary, within `max_tokens`."""
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count(text[:mid]) <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    cut = text[:lo]
+    space = cut.rfind(" ")
+    if space > lo // 2:
+        cut = cut[:space]
+    return cut.rstrip() + " [...]"
+
+
+def pack_context(hits: List[Dict[str, Any]], max_tokens: int = CONTEXT_MAX_TOKENS) -> tuple[str, Dict[str, int]]:
+    """Merge, de-duplicate and pack `hits` into at most `max_tokens` of context.
+
+    Blocks go in best-score order; the first one that does not fit is cut
+    short if enough budget remains, and the rest are left out. Returns
+    (context, stats) where stats counts hits, blocks and tokens.
+    """
+    count = token_counter()
+    blocks = drop_near_duplicates(merge_adjacent(hits))
+    sep_tokens = count(SEPARATOR)
+    parts: List[str] = []
+    used = 0
+    for block in blocks:
+        cost = sep_tokens if parts else 0
+        text = _format_block(block, block["text"])
+        tokens = count(text)
+        if used + cost + tokens <= max_tokens:
+            parts.append(text)
+            used += cost + tokens
+            continue
+        budget = max_tokens - used - cost
+        remaining = budget - count(_format_block(block, ""))
+        while remaining >= MIN_BLOCK_TOKENS:
+            text = _format_block(block, _truncate(block["text"], remaining, count))
+            tokens = count(text)
+            if tokens <= budget:
+                parts.append(text)
+                used += cost + tokens
+                break
+            # Counts of the pieces need not add up exactly; shrink and retry.
+            remaining -= tokens - budget
+        break
+    stats = {"hits": len(hits), "blocks": len(blocks), "packed": len(parts), "tokens": used}
+    return SEPARATOR.join(parts), stats
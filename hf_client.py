@@ -1,7 +1,14 @@
+import asyncio
+import json
 import os
-from typing import Any, Dict, List
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, Iterator, List
 
 import requests
+from requests.adapters import HTTPAdapter
 
 HF_TOKEN = os.getenv("HF_TOKEN")
 HF_TEXT_MODEL = os.getenv("HF_TEXT_MODEL", "microsoft/Phi-3.5-mini-instruct")
@@ -9,10 +16,44 @@ HF_INFERENCE_URL = os.getenv(
     "HF_INFERENCE_URL",
     f"https://api-inference.huggingface.co/models/{HF_TEXT_MODEL}",
 )
+HF_POOL_SIZE = int(os.getenv("HF_POOL_SIZE", "8"))
+HF_MAX_RETRIES = int(os.getenv("HF_MAX_RETRIES", "3"))
+HF_BACKOFF_SECONDS = float(os.getenv("HF_BACKOFF_SECONDS", "0.5"))
+HF_BACKOFF_MAX_SECONDS = float(os.getenv("HF_BACKOFF_MAX_SECONDS", "20"))
+HF_CONNECT_TIMEOUT = float(os.getenv("HF_CONNECT_TIMEOUT", "10"))
+HF_READ_TIMEOUT = float(os.getenv("HF_READ_TIMEOUT", "120"))
+# No retry starts once this much time has gone by since the first attempt.
+HF_RETRY_BUDGET_SECONDS = float(os.getenv("HF_RETRY_BUDGET_SECONDS", "60"))
+
+RETRY_STATUS = {429, 503}
 
 if not HF_TOKEN:
     raise RuntimeError("HF_TOKEN nao definido.")
 
+_session: requests.Session | None = None
+_session_lock = threading.Lock()
+
+# Generation gets its own pool instead of the default to_thread executor, so
+# slow LLM calls can't starve the threads used for retrieval and reloads.
+GENERATION_EXECUTOR = ThreadPoolExecutor(max_workers=HF_POOL_SIZE, thread_name_prefix="hf-gen")
+
+
+def _get_session() -> requests.Session:
+    """Process-wide keep-alive session; connections are reused across answers."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HF_POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update({
+                "Authorization": f"Bearer {HF_TOKEN}",
+                "Content-Type": "application/json",
+            })
+            _session = session
+        return _session
+
 
 def _messages_to_prompt(messages: List[Dict[str, str]]) -> str:
     lines: List[str] = []
@@ -24,26 +65,75 @@ def _messages_to_prompt(messages: List[Dict[str, str]]) -> str:
     return "\n\n".join(lines)
 
 
-def call_hf(messages: List[Dict[str, str]], max_tokens: int = 500, temperature: float = 0.2) -> str:
-    prompt = _messages_to_prompt(messages)
-
-    headers = {
-        "Authorization": f"Bearer {HF_TOKEN}",
-        "Content-Type": "application/json",
-    }
+def _build_payload(
+    messages: List[Dict[str, str]],
+    max_tokens: int,
+    temperature: float,
+    stream: bool,
+) -> Dict[str, Any]:
     payload: Dict[str, Any] = {
-        "inputs": prompt,
+        "inputs": _messages_to_prompt(messages),
         "parameters": {
             "max_new_tokens": max_tokens,
             "temperature": temperature,
             "return_full_text": False,
         },
     }
+    if stream:
+        payload["stream"] = True
+    return payload
+
+
+def _retry_delay(attempt: int, response: requests.Response | None) -> float:
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), HF_BACKOFF_MAX_SECONDS)
+    delay = min(HF_BACKOFF_MAX_SECONDS, HF_BACKOFF_SECONDS * (2 ** attempt))
+    return delay * random.uniform(0.5, 1.5)
+
+
+def _post(payload: Dict[str, Any], stream: bool = False) -> requests.Response:
+    """POST with bounded, jittered retries on 429/503 and connection errors.
+
+    A read timeout is not retried: the backend is slow, not unreachable, and
+    another HF_READ_TIMEOUT wait would only hold the answer longer. No retry
+    starts past HF_RETRY_BUDGET_SECONDS from the first attempt.
+    """
+    session = _get_session()
+    started = time.monotonic()
+    for attempt in range(HF_MAX_RETRIES + 1):
+        last_attempt = attempt >= HF_MAX_RETRIES
+        response: requests.Response | None = None
+        try:
+            response = session.post(
+                HF_INFERENCE_URL,
+                json=payload,
+                timeout=(HF_CONNECT_TIMEOUT, HF_READ_TIMEOUT),
+                stream=stream,
+            )
+        except requests.ConnectionError:  # includes ConnectTimeout, not ReadTimeout
+            delay = _retry_delay(attempt, None)
+            if last_attempt or time.monotonic() - started + delay > HF_RETRY_BUDGET_SECONDS:
+                raise
+        else:
+            delay = _retry_delay(attempt, response)
+            if (
+                response.status_code not in RETRY_STATUS
+                or last_attempt
+                or time.monotonic() - started + delay > HF_RETRY_BUDGET_SECONDS
+            ):
+                response.raise_for_status()
+                return response
+            response.close()
+
+        print(f"[HF] retry {attempt + 1}/{HF_MAX_RETRIES} in {delay:.1f}s")
+        time.sleep(delay)
+
+    raise RuntimeError("unreachable")
 
-    response = requests.post(HF_INFERENCE_URL, headers=headers, json=payload, timeout=120)
-    response.raise_for_status()
-    data = response.json()
 
+def _parse_generated(data: Any) -> str:
     # Typical formats from HF Inference API
     if isinstance(data, list) and data and isinstance(data[0], dict):
         if "generated_text" in data[0]:
@@ -56,3 +146,96 @@ def call_hf(messages: List[Dict[str, str]], max_tokens: int = 500, temperature:
             raise RuntimeError(f"HF inference error: {data['error']}")
 
     raise RuntimeError(f"HF inference response format unexpected: {data}")
+
+
+def call_hf(messages: List[Dict[str, str]], max_tokens: int = 500, temperature: float = 0.2) -> str:
+    payload = _build_payload(messages, max_tokens, temperature, stream=False)
+    response = _post(payload)
+    return _parse_generated(response.json())
+
+
+def stream_hf(
+    messages: List[Dict[str, str]],
+    max_tokens: int = 500,
+    temperature: float = 0.2,
+    stop: threading.Event | None = None,
+) -> Iterator[str]:
+    """Yield generated text pieces as the backend streams them (SSE).
+
+    Backends that ignore `stream` and answer with plain JSON yield the whole
+    text once. Setting `stop` ends the stream at the next event and closes
+    the response.
+    """
+    payload = _build_payload(messages, max_tokens, temperature, stream=True)
+    with _post(payload, stream=True) as response:
+        content_type = response.headers.get("Content-Type", "")
+        if "text/event-stream" not in content_type:
+            yield _parse_generated(response.json())
+            return
+
+        for raw in response.iter_lines(decode_unicode=True):
+            if stop is not None and stop.is_set():
+                break
+            if not raw or not raw.startswith("data:"):
+                continue
+            data = raw[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            event = json.loads(data)
+            if "error" in event:
+                raise RuntimeError(f"HF inference error: {event['error']}")
+            token = event.get("token") or {}
+            if token.get("special"):
+                continue
+            text = token.get("text")
+            if text:
+                yield text
+
+
+async def acall_hf(messages: List[Dict[str, str]], max_tokens: int = 500, temperature: float = 0.2) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(GENERATION_EXECUTOR, call_hf, messages, max_tokens, temperature)
+
+
+async def astream_hf(
+    messages: List[Dict[str, str]],
+    max_tokens: int = 500,
+    temperature: float = 0.2,
+) -> AsyncIterator[str]:
+    """Async view of stream_hf; the blocking read runs on GENERATION_EXECUTOR.
+
+    Closing the generator early (break, aclose, cancellation) stops the pump,
+    so an abandoned answer does not keep holding an executor slot.
+    """
+    loop = asyncio.get_running_loop()
+    queue: "asyncio.Queue[tuple[str, Any]]" = asyncio.Queue()
+    stop = threading.Event()
+
+    def pump() -> None:
+        pieces = stream_hf(messages, max_tokens, temperature, stop=stop)
+        try:
+            for piece in pieces:
+                if stop.is_set():
+                    break
+                loop.call_soon_threadsafe(queue.put_nowait, ("data", piece))
+        except BaseException as exc:  # noqa: BLE001
+            if not stop.is_set():
+                loop.call_soon_threadsafe(queue.put_nowait, ("error", exc))
+        else:
+            if not stop.is_set():
+                loop.call_soon_threadsafe(queue.put_nowait, ("done", None))
+        finally:
+            pieces.close()
+
+    loop.run_in_executor(GENERATION_EXECUTOR, pump)
+    try:
+        while True:
+            kind, value = await queue.get()
+            if kind == "data":
+                yield value
+            elif kind == "error":
+                raise value
+            else:
+                return
+    finally:
+        stop.set()
@@ -0,0 +1,273 @@
+import math
+import os
+from pathlib import Path
+from typing import Any, Dict, Tuple
+
+import faiss
+import numpy as np
+
+INDEX_TYPE = os.getenv("INDEX_TYPE", "auto").lower()
+HNSW_M = int(os.getenv("HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "200"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+IVF_NLIST = int(os.getenv("IVF_NLIST", "0"))  # 0 = derive from chunk count
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "16"))
+RECALL_QUERIES = int(os.getenv("RECALL_QUERIES", "200"))
+RECALL_K = int(os.getenv("RECALL_K", "10"))
+INDEX_STORAGE = os.getenv("INDEX_STORAGE", "float32").lower()
+RESCORE_FACTOR = int(os.getenv("RESCORE_FACTOR", "4"))
+ADD_BATCH = 65_536
+
+INDEX_TYPES = {"flat", "hnsw", "ivf", "ivfpq"}
+# Vector codes kept inside the index. ivfpq always stores PQ codes.
+STORAGE_TYPES = {
+    "float32": None,
+    "fp16": faiss.ScalarQuantizer.QT_fp16,
+    "sq8": faiss.ScalarQuantizer.QT_8bit,
+}
+
+# Below FLAT_MAX a brute-force scan is already sub-millisecond-ish and exact.
+FLAT_MAX = 20_000
+HNSW_MAX = 500_000
+
+_SEED = 1234
+
+
+def build_settings() -> Dict[str, Any]:
+    """Index knobs that change what build_index produces for the same vectors."""
+    return {
+        "index_type": INDEX_TYPE,
+        "storage": INDEX_STORAGE,
+        "hnsw_m": HNSW_M,
+        "hnsw_ef_construction": HNSW_EF_CONSTRUCTION,
+        "hnsw_ef_search": HNSW_EF_SEARCH,
+        "ivf_nlist": IVF_NLIST,
+        "ivf_nprobe": IVF_NPROBE,
+    }
+
+
+def min_train_size(kind: str, n: int) -> int:
+    """Fewest vectors faiss can train a `kind` index on (0: no training needed)."""
+    if kind == "ivf":
+        return _nlist_for(n)
+    if kind == "ivfpq":
+        return max(_nlist_for(n), 256)  # each PQ sub-quantizer has 2**8 centroids
+    return 0
+
+
+def choose_index_type(n: int, requested: str = INDEX_TYPE) -> str:
+    if requested != "auto":
+        if requested not in INDEX_TYPES:
+            raise ValueError(f"INDEX_TYPE invalido: {requested} (use auto, {', '.join(sorted(INDEX_TYPES))})")
+        needed = min_train_size(requested, n)
+        if n < needed:
+            # A small domain shard can't train a forced ivf/ivfpq; a flat scan over it is cheap anyway.
+            print(f"[INDEX] {requested} needs {needed} vectors to train, got {n}; using flat")
+            return "flat"
+        return requested
+    if n <= FLAT_MAX:
+        return "flat"
+    if n <= HNSW_MAX:
+        return "hnsw"
+    return "ivfpq"
+
+
+def _nlist_for(n: int) -> int:
+    if IVF_NLIST > 0:
+        return IVF_NLIST
+    # faiss wants ~39+ training points per centroid.
+    return max(1, min(int(4 * math.sqrt(n)), n // 39))
+
+
+def _pq_m_for(dim: int) -> int:
+    for m in (64, 48, 32, 24, 16, 12, 8, 4, 2, 1):
+        if m <= dim and dim % m == 0:
+            return m
+    return 1
+
+
+def search_params_string(params: Dict[str, Any]) -> str:
+    return ",".join(f"{k}={v}" for k, v in params.items())
+
+
+def apply_search_params(index: faiss.Index, params: Dict[str, Any]) -> None:
+    if params:
+        faiss.ParameterSpace().set_index_parameters(index, search_params_string(params))
+
+
+def build_index(
+    vectors: np.ndarray,
+    kind: str,
+    storage: str = INDEX_STORAGE,
+) -> Tuple[faiss.Index, Dict[str, Any], Dict[str, Any]]:
+    """Build a FAISS index of `kind` over L2-normalized `vectors` (inner product).
+
+    `storage` picks how flat/hnsw/ivf keep vectors: float32, fp16 or sq8
+    (8-bit scalar quantizer, 4x smaller). Returns (index, build_info,
+    search_params). search_params are the runtime knobs (nprobe/efSearch) to
+    store in the manifest and apply on load.
+    """
+    if storage not in STORAGE_TYPES:
+        raise ValueError(f"INDEX_STORAGE invalido: {storage} (use {', '.join(STORAGE_TYPES)})")
+    n, dim = vectors.shape
+    metric = faiss.METRIC_INNER_PRODUCT
+    qtype = STORAGE_TYPES[storage]
+    info: Dict[str, Any] = {"type": kind, "storage": "pq" if kind == "ivfpq" else storage}
+    params: Dict[str, Any] = {}
+    nlist = 0
+
+    if kind == "flat":
+        if qtype is None:
+            index = faiss.IndexFlatIP(dim)
+        else:
+            index = faiss.IndexScalarQuantizer(dim, qtype, metric)
+    elif kind == "hnsw":
+        if qtype is None:
+            index = faiss.IndexHNSWFlat(dim, HNSW_M, metric)
+        else:
+            index = faiss.IndexHNSWSQ(dim, qtype, HNSW_M, metric)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        info.update({"M": HNSW_M, "efConstruction": HNSW_EF_CONSTRUCTION})
+        params["efSearch"] = HNSW_EF_SEARCH
+    elif kind in {"ivf", "ivfpq"}:
+        nlist = _nlist_for(n)
+        quantizer = faiss.IndexFlatIP(dim)
+        if kind == "ivfpq":
+            pq_m = _pq_m_for(dim)
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, 8, metric)
+            info["pq_m"] = pq_m
+        elif qtype is None:
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, metric)
+        else:
+            index = faiss.IndexIVFScalarQuantizer(quantizer, dim, nlist, qtype, metric)
+        info["nlist"] = nlist
+        params["nprobe"] = min(IVF_NPROBE, nlist)
+    else:
+        raise ValueError(f"INDEX_TYPE invalido: {kind}")
+
+    if not index.is_trained:
+        # Centroids (IVF) and per-dimension ranges (SQ) come from a seeded sample.
+        train_n = min(n, max(nlist * 256, 10_000))
+        rng = np.random.default_rng(_SEED)
+        sample = np.ascontiguousarray(vectors[np.sort(rng.choice(n, size=train_n, replace=False))])
+        index.train(sample)
+        info["train_size"] = int(train_n)
+
+    # Batched so a disk-backed (memmap) matrix is paged in a slice at a time.
+    for start in range(0, n, ADD_BATCH):
+        index.add(np.ascontiguousarray(vectors[start:start + ADD_BATCH]))
+    apply_search_params(index, params)
+    return index, info, params
+
+
+def is_lossy(info: Dict[str, Any]) -> bool:
+    """True when the index scores with compressed codes rather than float32."""
+    return info.get("storage", "float32") != "float32"
+
+
+def read_index(path: Path, mmap: bool = True) -> faiss.Index:
+    """Open an index file, memory-mapped when faiss supports it for the type.
+
+    A mapped index shares the page cache and only faults in what searches
+    touch. Artifacts are replaced by rename, so a mapping stays valid after a
+    newer index lands on disk.
+    """
+    if mmap:
+        # IO_FLAG_MMAP_IFC maps flat/SQ codes (flat, hnsw storage); IVF lists
+        # only map with IO_FLAG_MMAP alone, so try both before a plain read.
+        attempts = [faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY]
+        if hasattr(faiss, "IO_FLAG_MMAP_IFC"):
+            attempts.insert(0, faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        for flags in attempts:
+            try:
+                return faiss.read_index(str(path), flags)
+            except RuntimeError:
+                continue
+        print(f"[INDEX] mmap not supported for {path}; reading into memory")
+    return faiss.read_index(str(path))
+
+
+def rescore(
+    queries: np.ndarray,
+    ids: np.ndarray,
+    vectors: np.ndarray,
+    k: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Re-rank candidate `ids` per query by exact inner product with float32 `vectors`.
+
+    Returns (scores, ids) of shape (n_queries, k), padded with -1 like faiss.
+    """
+    out_scores = np.full((len(queries), k), -np.inf, dtype="float32")
+    out_ids = np.full((len(queries), k), -1, dtype="int64")
+    for row, (query, cand) in enumerate(zip(queries, ids)):
+        cand = cand[cand >= 0]
+        if not len(cand):
+            continue
+        order = np.argsort(cand)  # sorted reads are kinder to a memmap
+        exact = np.asarray(vectors[cand[order]], dtype="float32") @ query
+        top = np.argsort(-exact)[:k]
+        out_scores[row, :len(top)] = exact[top]
+        out_ids[row, :len(top)] = cand[order][top]
+    return out_scores, out_ids
+
+
+def export_rescore_vectors(path: Path, vectors: np.ndarray) -> None:
+    """Write `vectors` as a float32 .npy that the runtime can np.load(mmap_mode="r")."""
+    tmp = path.with_name(path.name + ".tmp")
+    out = np.lib.format.open_memmap(tmp, mode="w+", dtype="float32", shape=vectors.shape)
+    for start in range(0, len(vectors), ADD_BATCH):
+        out[start:start + ADD_BATCH] = vectors[start:start + ADD_BATCH]
+    out.flush()
+    del out
+    os.replace(tmp, path)
+
+
+def measure_recall(
+    index: faiss.Index,
+    vectors: np.ndarray,
+    k: int = RECALL_K,
+    n_queries: int = RECALL_QUERIES,
+    rescore_factor: int = 0,
+) -> Dict[str, Any]:
+    """recall@k of `index` against exact inner-product search.
+
+    Queries are chunk vectors picked at random and held out: each query's own
+    row is dropped from both the index's answer and the ground truth (a flat
+    scan over the same vectors), so it cannot count as its own top hit. With
+    `rescore_factor` > 1 the index returns k * factor candidates that are
+    re-ranked exactly before scoring.
+    """
+    n = vectors.shape[0]
+    n_queries = min(n_queries, n)
+    k = min(k, n - 1)
+    if n_queries == 0 or k <= 0:
+        return {"k": max(k, 0), "queries": 0, "recall": None}
+
+    rng = np.random.default_rng(_SEED + 1)
+    query_ids = np.sort(rng.choice(n, size=n_queries, replace=False))
+    queries = np.ascontiguousarray(vectors[query_ids])
+
+    # Exact top-k computed slice by slice instead of a second full flat index.
+    best_scores = np.full((n_queries, k), -np.inf, dtype="float32")
+    best_ids = np.zeros((n_queries, k), dtype="int64")
+    for start in range(0, n, ADD_BATCH):
+        block = np.asarray(vectors[start:start + ADD_BATCH], dtype="float32")
+        scores = queries @ block.T
+        ids = np.broadcast_to(np.arange(start, start + len(block)), scores.shape)
+        scores[ids == query_ids[:, None]] = -np.inf  # held out
+        all_scores = np.concatenate([best_scores, scores], axis=1)
+        all_ids = np.concatenate([best_ids, ids], axis=1)
+        top = np.argpartition(-all_scores, k - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(all_scores, top, axis=1)
+        best_ids = np.take_along_axis(all_ids, top, axis=1)
+    truth = best_ids
+    # One extra result makes up for the query's own row, dropped below.
+    if rescore_factor > 1:
+        _, candidates = index.search(queries, min(n, (k + 1) * rescore_factor))
+        _, found = rescore(queries, candidates, vectors, k + 1)
+    else:
+        _, found = index.search(queries, k + 1)
+    found = [[i for i in row if i != qid][:k] for row, qid in zip(found.tolist(), query_ids.tolist())]
+
+    hits = sum(len(set(t) & set(f)) for t, f in zip(truth.tolist(), found))
+    return {"k": k, "queries": n_queries, "recall": round(hits / (n_queries * k), 4)}
@@ -1,83 +1,478 @@
+import hashlib
 import json
 import os
+import re
 import threading
 import time
+import unicodedata
+from collections import OrderedDict
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Sequence, Tuple
 
 import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
+
+from artifact_sync import ARTIFACT_SOURCE, LOCAL_STORAGE_DIR
+from citations import load_citation_index, query_anchors
+from index_builder import RESCORE_FACTOR, apply_search_params, read_index, rescore
+from meta_store import MetaStore
+from metrics import CITATION_HITS, QUERY_CACHE_LOOKUPS, record_ingest, timed
+from query_encoder import load_query_encoder
 
 EMBED_MODEL = os.getenv("EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
 WORK_DIR = Path(os.getenv("WORK_DIR", "/data/work"))
-ART_DIR = WORK_DIR / "out" / "artifacts"
+# "local": artifacts written by this Space's own ingest runs. Otherwise the
+# `current` symlink maintained by artifact_sync.ArtifactSync.
+ART_DIR = WORK_DIR / "out" / "artifacts" if ARTIFACT_SOURCE == "local" else LOCAL_STORAGE_DIR / "current"
 RELOAD_POLL_SECONDS = int(os.getenv("RELOAD_POLL_SECONDS", "30"))
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+INDEX_MMAP = os.getenv("INDEX_MMAP", "1") == "1"
+
+
+def normalize_query(query: str) -> str:
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", query)).strip()
+
+
+class QueryEmbeddingCache:
+    """Bounded LRU of (encoder name, normalized query text) -> float32 query vector.
+
+    The encoder name is part of the key, so a vector is only ever served for
+    the encoder that produced it.
+    """
+
+    def __init__(self, max_size: int = QUERY_CACHE_SIZE) -> None:
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[str, str]) -> np.ndarray | None:
+        with self._lock:
+            vec = self._data.get(key)
+            if vec is None:
+                self.misses += 1
+                QUERY_CACHE_LOOKUPS.labels("miss").inc()
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            QUERY_CACHE_LOOKUPS.labels("hit").inc()
+            return vec
+
+    def put(self, key: Tuple[str, str], vec: np.ndarray) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = vec
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+def _area_key(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode().lower()
+    return re.sub(r"[^a-z0-9_]+", "_", text).strip("_")
+
+
+def _revision_token(manifest: Dict[str, Any], base: Path) -> str:
+    """Identity of the artifact set on disk.
+
+    The index checksums from the manifest identify the build (ingest rewrites
+    the manifest once more to fill in the Hub revision, which must not count as
+    a new index). Artifacts without a manifest fall back to the index mtime.
+    """
+    checksum = manifest.get("checksums", {}).get("faiss_sha256")
+    if checksum:
+        return checksum
+    shards = manifest.get("shards")
+    if shards:
+        return hashlib.sha256("".join(s["sha256"] for s in shards).encode("utf-8")).hexdigest()
+    return f"mtime:{(base / 'faiss.index').stat().st_mtime_ns}"
+
+
+class IndexShard:
+    """One FAISS index holding global chunk ids [offset, offset + ntotal)."""
+
+    def __init__(self, name: str, index: faiss.Index, offset: int) -> None:
+        self.name = name
+        self.index = index
+        self.offset = offset
+        self.end = offset + index.ntotal
+
+    def search(self, qv: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        scores, ids = self.index.search(qv, k)
+        return scores, np.where(ids >= 0, ids + self.offset, -1)
+
+
+def search_shards(shards: Sequence[IndexShard], qv: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Top-k over several shards: k from each, merged by score."""
+    if len(shards) == 1:
+        return shards[0].search(qv, k)
+    parts = [shard.search(qv, k) for shard in shards]
+    scores = np.hstack([p[0] for p in parts])
+    ids = np.hstack([p[1] for p in parts])
+    top = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+    return np.take_along_axis(scores, top, axis=1), np.take_along_axis(ids, top, axis=1)
+
+
+class IndexSnapshot:
+    """One immutable generation of index shards + metadata. Never mutated after load."""
+
+    def __init__(
+        self,
+        shards: List[IndexShard],
+        meta: MetaStore | List[Dict[str, Any]],
+        token: str,
+        manifest: Dict[str, Any],
+        citations: Dict[str, List[int]],
+        vectors: np.ndarray | None = None,
+    ) -> None:
+        self.shards = shards
+        self.ntotal = sum(shard.index.ntotal for shard in shards)
+        self.meta = meta
+        # float32 copy for exact re-scoring of compressed indexes (memmap), or None.
+        self.vectors = vectors
+        self.citations = citations
+        self.token = token
+        self.revision = manifest.get("revision")
+        self.manifest = manifest
+        self.loaded_at = time.time()
 
 
 class LocalIndexRuntime:
     def __init__(self) -> None:
-        self.model = SentenceTransformer(EMBED_MODEL)
-        self.index: faiss.Index | None = None
-        self.meta: List[Dict[str, Any]] | None = None
-        self.last_mtime: float | None = None
+        self.model = load_query_encoder()
+        self.query_cache = QueryEmbeddingCache()
         self.last_check = 0.0
-        self._lock = threading.RLock()
+        # Searches read self._snapshot without locking; reloads build a new
+        # snapshot off to the side and publish it with a single assignment.
+        self._snapshot: IndexSnapshot | None = None
+        self._load_lock = threading.Lock()
+        self._reloading = threading.Event()
+
+    @property
+    def areas(self) -> List[str]:
+        snap = self._snapshot
+        return [shard.name for shard in snap.shards] if snap else []
 
-    def _paths(self) -> tuple[Path, Path]:
-        return (ART_DIR / "faiss.index", ART_DIR / "meta.json")
+    @property
+    def meta(self) -> MetaStore | List[Dict[str, Any]] | None:
+        snap = self._snapshot
+        return snap.meta if snap else None
+
+    @property
+    def token(self) -> str | None:
+        """Identity of the loaded index build (see _revision_token)."""
+        snap = self._snapshot
+        return snap.token if snap else None
+
+    @property
+    def revision(self) -> str | None:
+        snap = self._snapshot
+        return snap.revision if snap else None
+
+    def _base(self) -> Path:
+        # Resolved once per load: a synced `current` symlink can flip mid-read.
+        return ART_DIR.resolve()
+
+    def _meta_path(self, base: Path) -> Path:
+        meta = base / "meta.bin"
+        if not meta.exists() and (base / "meta.json").exists():
+            # Artifacts built before meta.bin existed.
+            meta = base / "meta.json"
+        return meta
+
+    def _shard_specs(self, base: Path, manifest: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """name/path/offset/index info per shard; a single faiss.index is shard "all"."""
+        shards = manifest.get("shards")
+        if shards:
+            return [
+                {"name": s["name"], "path": base / s["file"], "offset": s["offset"], "info": s.get("index", {})}
+                for s in shards
+            ]
+        return [{"name": "all", "path": base / "faiss.index", "offset": 0, "info": manifest.get("index", {})}]
+
+    def _manifest(self, base: Path | None = None) -> Dict[str, Any]:
+        path = (base or self._base()) / "manifest.json"
+        if not path.exists():
+            return {}
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except json.JSONDecodeError:
+            # Caught mid-write; the next poll will see the full file.
+            return {}
 
     def exists(self) -> bool:
-        idx, meta = self._paths()
-        return idx.exists() and meta.exists()
+        base = self._base()
+        specs = self._shard_specs(base, self._manifest(base))
+        return self._meta_path(base).exists() and all(spec["path"].exists() for spec in specs)
+
+    def _build_snapshot(self) -> IndexSnapshot:
+        base = self._base()
+        meta_path = self._meta_path(base)
+        manifest = self._manifest(base)
+        token = _revision_token(manifest, base)
+        dim = manifest.get("embedding_dim")
+        built_with = manifest.get("embed_model")
+        shards: List[IndexShard] = []
+        for spec in self._shard_specs(base, manifest):
+            index = read_index(spec["path"], mmap=INDEX_MMAP)
+            if (built_with and built_with != EMBED_MODEL) or (dim and dim != index.d):
+                raise RuntimeError(
+                    f"Indice incompativel com o encoder de consulta: "
+                    f"embed_model={built_with} (esperado {EMBED_MODEL}), embedding_dim={dim}, index.d={index.d}"
+                )
+            apply_search_params(index, spec["info"].get("search_params", {}))
+            shards.append(IndexShard(spec["name"], index, spec["offset"]))
+        if meta_path.suffix == ".bin":
+            meta: MetaStore | List[Dict[str, Any]] = MetaStore(meta_path)
+        else:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        ntotal = sum(s.index.ntotal for s in shards)
+        if len(meta) != ntotal:
+            raise RuntimeError(
+                f"meta e indice de builds diferentes: {len(meta)} chunks em {meta_path.name}, {ntotal} vetores no indice"
+            )
+        citations = load_citation_index(base / "citations.json")
+        vectors = self._rescore_vectors(base, manifest, shards)
+        print(
+            f"[INDEX] loaded local index from {base} "
+            f"(revision={manifest.get('revision')}, shards={[s.name for s in shards]}, "
+            f"mmap={INDEX_MMAP}, rescore={vectors is not None})"
+        )
+        return IndexSnapshot(shards, meta, token, manifest, citations, vectors)
+
+    def _rescore_vectors(self, base: Path, manifest: Dict[str, Any], shards: List[IndexShard]) -> np.ndarray | None:
+        path = base / "vectors.npy"
+        if RESCORE_FACTOR <= 1 or "rescore_vectors" not in manifest.get("files", {}) or not path.exists():
+            return None
+        vectors = np.load(path, mmap_mode="r")
+        if vectors.shape != (sum(s.index.ntotal for s in shards), shards[0].index.d):
+            print(f"[INDEX] ignoring {path}: shape {vectors.shape} does not match the index")
+            return None
+        return vectors
 
     def load(self) -> None:
-        with self._lock:
-            idx, meta = self._paths()
-            self.index = faiss.read_index(str(idx))
-            self.meta = json.loads(meta.read_text(encoding="utf-8"))
-            self.last_mtime = idx.stat().st_mtime
+        """Build a new snapshot and swap it in. In-flight searches keep the old one."""
+        with self._load_lock:
+            snap = self._build_snapshot()
+            self._snapshot = snap
             self.last_check = time.time()
-            print(f"[INDEX] loaded local index from {idx}")
+        record_ingest(snap.manifest.get("ingest_stats"))
 
-    def ensure_loaded(self) -> None:
-        with self._lock:
-            if not self.exists():
-                raise RuntimeError(f"Indice nao existe em {ART_DIR}. Rode reindex primeiro.")
-            if self.index is None or self.meta is None:
-                self.load()
+    def ensure_loaded(self) -> IndexSnapshot:
+        snap = self._snapshot
+        if snap is not None:
+            return snap
+        if not self.exists():
+            raise RuntimeError(f"Indice nao existe em {ART_DIR}. Rode reindex primeiro.")
+        with self._load_lock:
+            if self._snapshot is None:
+                self._snapshot = self._build_snapshot()
+                record_ingest(self._snapshot.manifest.get("ingest_stats"))
+            return self._snapshot
+
+    def _reload_in_background(self) -> None:
+        try:
+            self.load()
+        except Exception as exc:  # noqa: BLE001
+            print(f"[INDEX] reload failed; keeping current index: {type(exc).__name__}: {exc}")
+        finally:
+            self._reloading.clear()
 
     def maybe_reload(self) -> None:
+        """Cheap, non-blocking check; a changed revision reloads in a background thread."""
         now = time.time()
         if now - self.last_check < RELOAD_POLL_SECONDS:
             return
         self.last_check = now
 
-        idx, _ = self._paths()
-        if not idx.exists():
+        base = self._base()
+        manifest = self._manifest(base)
+        if self._reloading.is_set() or not all(spec["path"].exists() for spec in self._shard_specs(base, manifest)):
             return
 
-        mtime = idx.stat().st_mtime
-        if self.last_mtime is None or mtime > self.last_mtime:
-            print("[INDEX] detected updated index; reloading...")
-            self.load()
+        current = self._snapshot
+        token = _revision_token(manifest, base)
+        if current is not None and token == current.token:
+            return
 
-    def search(self, query: str, k: int = 4) -> List[Dict[str, Any]]:
-        self.ensure_loaded()
+        print("[INDEX] detected updated index; reloading in background...")
+        self._reloading.set()
+        threading.Thread(target=self._reload_in_background, name="index-reload", daemon=True).start()
 
-        with self._lock:
-            assert self.index is not None
-            assert self.meta is not None
+    def start_reload_watcher(self, poll_seconds: float = RELOAD_POLL_SECONDS) -> threading.Thread:
+        """Run maybe_reload every `poll_seconds` in a daemon thread, off the request path."""
+
+        def loop() -> None:
+            while True:
+                time.sleep(poll_seconds)
+                try:
+                    self.maybe_reload()
+                except Exception as exc:  # noqa: BLE001
+                    print(f"[INDEX] reload check failed: {type(exc).__name__}: {exc}")
+
+        thread = threading.Thread(target=loop, name="index-reload-watch", daemon=True)
+        thread.start()
+        return thread
+
+    def encode_queries(self, queries: List[str]) -> np.ndarray:
+        """Return an (n, dim) float32 matrix; LRU misses are encoded in one batch."""
+        keys = [(self.model.name, normalize_query(q)) for q in queries]
+        found = [self.query_cache.get(key) for key in keys]
+        missing = sorted({key for key, qv in zip(keys, found) if qv is None})
+        if missing:
+            encoded = self.model.encode([text for _, text in missing])
+            fresh: Dict[Tuple[str, str], np.ndarray] = {}
+            for key, row in zip(missing, encoded):
+                qv = row.reshape(1, -1)
+                qv.setflags(write=False)
+                self.query_cache.put(key, qv)
+                fresh[key] = qv
+            found = [qv if qv is not None else fresh[key] for key, qv in zip(keys, found)]
+        return np.vstack(found)
+
+    def encode_query(self, query: str) -> np.ndarray:
+        """Return the (1, dim) float32 query vector, served from the LRU when possible."""
+        return self.encode_queries([query])
+
+    def _select_shards(self, snap: IndexSnapshot, area: str | None) -> List[IndexShard]:
+        """Shards named by `area` ("penal", "processo_civil,penal"); all shards if empty.
+
+        Each comma-separated term matches a shard name exactly, else by prefix
+        ("sumulas" -> "sumulas_tse_stj_stf_e_tnu").
+        """
+        terms = [t for t in (_area_key(part) for part in (area or "").split(",")) if t]
+        if not terms:
+            return snap.shards
+        if snap.manifest.get("sharding") != "domain":
+            raise ValueError("Indice nao particionado por area; rode reindex com INDEX_SHARDING=domain.")
+        picked: List[IndexShard] = []
+        for term in terms:
+            matches = [s for s in snap.shards if s.name == term] or [
+                s for s in snap.shards if s.name.startswith(term)
+            ]
+            if not matches:
+                names = ", ".join(s.name for s in snap.shards)
+                raise ValueError(f"Area desconhecida: {term}. Areas disponiveis: {names}")
+            picked.extend(s for s in matches if s not in picked)
+        return picked
 
-            qv = self.model.encode([query], normalize_embeddings=True)
-            qv = np.asarray(qv, dtype="float32")
+    def match_areas(self, area: str) -> List[str]:
+        """Shard names `area` selects; ValueError with the valid names otherwise."""
+        return [shard.name for shard in self._select_shards(self.ensure_loaded(), area)]
 
-            scores, idxs = self.index.search(qv, k)
+    def _resolve_citation(
+        self,
+        snap: IndexSnapshot,
+        query: str,
+        k: int,
+        shards: List[IndexShard],
+    ) -> List[Dict[str, Any]]:
+        """Exact hits for "art. 312 do CPP" / "Súmula 691 STF" style queries, or []."""
+        if not snap.citations:
+            return []
+        ids: List[int] = []
+        for anchor in query_anchors(query):
+            ids.extend(snap.citations.get(anchor, []))
+        if len(shards) < len(snap.shards):
+            ids = [i for i in ids if any(s.offset <= i < s.end for s in shards)]
+        ids = list(dict.fromkeys(ids))
+        # Articles often run past their chunk; the next chunk of the same source follows.
+        for i in list(ids):
+            if len(ids) >= k:
+                break
+            nxt = i + 1
+            if nxt < len(snap.meta) and nxt not in ids and snap.meta[nxt]["source"] == snap.meta[i]["source"]:
+                ids.append(nxt)
+
+        out: List[Dict[str, Any]] = []
+        for i in ids[:k]:
+            item = dict(snap.meta[i])
+            item["score"] = 1.0
+            item["match"] = "citation"
+            out.append(item)
+        return out
+
+    def cites(self, query: str, area: str | None = None) -> bool:
+        """Whether `query` names an article/súmula the citation index answers (no encoding)."""
+        snap = self.ensure_loaded()
+        return bool(self._resolve_citation(snap, query, 1, self._select_shards(snap, area)))
+
+    def search_batch(
+        self,
+        queries: List[str],
+        k: int = 4,
+        areas: List[str | None] | None = None,
+    ) -> List[List[Dict[str, Any]] | Exception]:
+        """One encode batch and one multi-row FAISS search per area for several queries.
+
+        `areas[n]` restricts query n to the matching shards (see _select_shards);
+        without it, every shard is searched and the top-k merged. Queries that
+        name an article or súmula present in the citation index are answered
+        from it and never reach the encoder. A query whose area is invalid
+        gets the ValueError in its slot instead of failing the whole batch.
+        """
+        if not queries:
+            return []
+        snap = self.ensure_loaded()
+        areas = areas or [None] * len(queries)
+        selected: Dict[str | None, List[IndexShard] | ValueError] = {}
+        for area in set(areas):
+            try:
+                selected[area] = self._select_shards(snap, area)
+            except ValueError as exc:
+                selected[area] = exc
+        results: List[List[Dict[str, Any]] | Exception] = []
+        for q, area in zip(queries, areas):
+            shards = selected[area]
+            results.append(shards if isinstance(shards, ValueError) else self._resolve_citation(snap, q, k, shards))
+        pending = [n for n, hits in enumerate(results) if isinstance(hits, list) and not hits]
+        CITATION_HITS.inc(sum(1 for hits in results if isinstance(hits, list) and hits))
+        if not pending:
+            return results
+
+        with timed("encode"):
+            qv_all = self.encode_queries([queries[n] for n in pending])
+        groups: Dict[str | None, List[int]] = {}
+        for row, n in enumerate(pending):
+            groups.setdefault(areas[n], []).append(row)
+        with timed("search"):
+            for area, rows in groups.items():
+                self._search_rows(snap, selected[area], qv_all[rows], k, [pending[r] for r in rows], results)
+        return results
+
+    def _search_rows(
+        self,
+        snap: IndexSnapshot,
+        shards: List[IndexShard],
+        qv: np.ndarray,
+        k: int,
+        slots: List[int],
+        results: List[List[Dict[str, Any]] | Exception],
+    ) -> None:
+        if snap.vectors is not None:
+            # Over-fetch from the compressed index, then re-rank exactly.
+            _, candidates = search_shards(shards, qv, k * RESCORE_FACTOR)
+            scores, idxs = rescore(qv, candidates, snap.vectors, k)
+        else:
+            scores, idxs = search_shards(shards, qv, k)
+        for n, row_scores, row_idxs in zip(slots, scores, idxs):
             out: List[Dict[str, Any]] = []
-            for score, i in zip(scores[0], idxs[0]):
+            for score, i in zip(row_scores, row_idxs):
                 if i == -1:
                     continue
-                item = dict(self.meta[i])
+                item = dict(snap.meta[i])
                 item["score"] = float(score)
                 out.append(item)
-            return out
+            results[n] = out
+
+    def search(self, query: str, k: int = 4, area: str | None = None) -> List[Dict[str, Any]]:
+        hits = self.search_batch([query], k, [area])[0]
+        if isinstance(hits, Exception):
+            raise hits
+        return hits
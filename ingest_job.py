@@ -2,20 +2,49 @@ import datetime as dt
 import hashlib
 import json
 import os
+import queue
 import re
+import signal
 import subprocess
+import threading
+import time
+import unicodedata
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeout
 from pathlib import Path
-from typing import Any, Dict, List, Tuple
+from typing import Any, Callable, Deque, Dict, Iterator, List, Tuple, TypeVar
 
 import faiss
 import numpy as np
 from huggingface_hub import HfApi, snapshot_download
 from huggingface_hub._commit_api import CommitOperationAdd
-from pypdf import PdfReader
 from sentence_transformers import SentenceTransformer
 from tqdm import tqdm
 import docx
 
+from build_cache import BuildCache
+from chunker import TokenChunker
+from citations import chunk_anchors, document_keys, write_citation_index
+from index_builder import (
+    RESCORE_FACTOR,
+    build_index,
+    build_settings,
+    choose_index_type,
+    export_rescore_vectors,
+    is_lossy,
+    measure_recall,
+)
+from meta_store import MetaStoreWriter
+from pdf_extract import (
+    PDF_PAGE_TIMEOUT_SECONDS,
+    PDF_PAGES_PER_TASK,
+    extract_pdf,
+    merge_stats,
+    page_count,
+    page_ranges,
+    resolve_backend,
+)
+
 DOCS_REPO_ID = os.getenv("DOCS_REPO_ID")
 INDEX_REPO_ID = os.getenv("INDEX_REPO_ID")
 DOCS_SUBDIR = os.getenv("DOCS_SUBDIR", "docs_rag")
@@ -23,11 +52,55 @@ DOCS_SUBDIR = os.getenv("DOCS_SUBDIR", "docs_rag")
 EMBED_MODEL = os.getenv("EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
 CHUNK_CHARS = int(os.getenv("CHUNK_CHARS", "1200"))
 CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "200"))
+CHUNKER = os.getenv("CHUNKER", "tokens").lower()
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "0"))  # 0 = the encoder's window
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "0"))
 
 ARTIFACTS_PREFIX = os.getenv("ARTIFACTS_PREFIX", "artifacts")
 WORK_DIR = Path(os.getenv("WORK_DIR", "/tmp/rag_job"))
+BUILD_CACHE_DIR = Path(os.getenv("BUILD_CACHE_DIR", str(WORK_DIR / "build_cache")))
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(os.cpu_count() or 1)))
+PARSE_TIMEOUT_SECONDS = float(os.getenv("PARSE_TIMEOUT_SECONDS", "300"))
+# Extra wait in the parent before a worker past PARSE_TIMEOUT_SECONDS is killed
+# (SIGALRM in the worker cannot interrupt native pdfium/pymupdf calls).
+PARSE_KILL_MARGIN_SECONDS = float(os.getenv("PARSE_KILL_MARGIN_SECONDS", "30"))
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "16"))  # parsed docs waiting for embedding
+EMBED_BATCH_CHUNKS = int(os.getenv("EMBED_BATCH_CHUNKS", "512"))  # chunks per model.encode call
+INDEX_SHARDING = os.getenv("INDEX_SHARDING", "domain").lower()  # domain | none
 
 ALLOWED_EXTS = {".pdf", ".docx"}
+SHARDING_MODES = {"domain", "none"}
+# "sumulas_tse_stj_stf_e_tnu_atualiz_01_01_2026_2" -> "sumulas_tse_stj_stf_e_tnu"
+_SHARD_DATE_SUFFIX = re.compile(r"_atualiz.*$")
+
+T = TypeVar("T")
+
+
+_STAGE_STARTS: List[Tuple[str, float]] = []
+
+
+def stage(name: str) -> None:
+    # Parsed by reindex_jobs to report the running job's stage.
+    _STAGE_STARTS.append((name, time.monotonic()))
+    print(f"[STAGE] {name}", flush=True)
+
+
+def ingest_stats(docs_ok_count: int, chunks_count: int) -> Dict[str, Any]:
+    """Seconds per stage so far (the current one up to now) and ingest throughput.
+
+    Stored in the manifest so /metrics on any replica can expose it.
+    """
+    now = time.monotonic()
+    ends = [start for _, start in _STAGE_STARTS[1:]] + [now]
+    stages = {name: round(end - start, 3) for (name, start), end in zip(_STAGE_STARTS, ends)}
+    ingest_seconds = stages.get("ingest") or 0
+    return {
+        "stages": stages,
+        "total_seconds": round(now - _STAGE_STARTS[0][1], 3) if _STAGE_STARTS else 0,
+        "docs_per_second": round(docs_ok_count / ingest_seconds, 3) if ingest_seconds else None,
+        "chunks_per_second": round(chunks_count / ingest_seconds, 3) if ingest_seconds else None,
+        "finished_at": round(time.time(), 3),
+    }
 
 
 def utc_iso() -> str:
@@ -70,18 +143,47 @@ def chunk_chars(text: str, size: int, overlap: int) -> List[str]:
     return out
 
 
+def chunking_config() -> Dict[str, Any]:
+    if CHUNKER == "chars":
+        return {"strategy": "chars", "chunk_chars": CHUNK_CHARS, "overlap": CHUNK_OVERLAP}
+    if CHUNKER == "tokens":
+        return {
+            "strategy": "tokens",
+            "max_tokens": CHUNK_TOKENS or "auto",
+            "overlap_tokens": CHUNK_OVERLAP_TOKENS,
+        }
+    raise RuntimeError(f"CHUNKER invalido: {CHUNKER} (use tokens ou chars)")
+
+
+def make_chunker(model: SentenceTransformer) -> Callable[[str], List[str]]:
+    if CHUNKER == "chars":
+        return lambda text: chunk_chars(text, CHUNK_CHARS, CHUNK_OVERLAP)
+    # Leave room for the [CLS]/[SEP] tokens the encoder adds.
+    max_tokens = CHUNK_TOKENS or model.max_seq_length - 2
+    return TokenChunker(model.tokenizer, max_tokens, CHUNK_OVERLAP_TOKENS).chunk
+
+
+def parse_summary(report: List[Dict[str, Any]], pdf_backend: str) -> Dict[str, Any]:
+    """manifest["parse"]: totals over parse_report.json and its slowest documents."""
+    return {
+        "pdf_backend": pdf_backend,
+        "page_timeout_seconds": PDF_PAGE_TIMEOUT_SECONDS,
+        "pages_per_task": PDF_PAGES_PER_TASK,
+        "docs_parsed": sum(1 for r in report if not r.get("cached")),
+        "pages": sum(r.get("pages") or 0 for r in report),
+        "seconds": round(sum(r.get("seconds") or 0 for r in report), 3),
+        "failed_pages": sum(r.get("num_failed_pages", 0) for r in report),
+        "timed_out_pages": sum(r.get("num_timed_out_pages", 0) for r in report),
+        "timed_out_docs": sum(1 for r in report if r.get("timed_out")),
+        "slowest": [
+            {"path": r["path"], "seconds": r.get("seconds"), "pages": r.get("pages")}
+            for r in sorted(report, key=lambda r: -(r.get("seconds") or 0))[:10]
+        ],
+    }
+
+
 def parse_pdf(path: Path) -> str:
-    reader = PdfReader(str(path))
-    parts: List[str] = []
-    for page in reader.pages:
-        try:
-            text = page.extract_text() or ""
-        except Exception:
-            text = ""
-        text = text.strip()
-        if text:
-            parts.append(text)
-    return "\n\n".join(parts)
+    return extract_pdf(path)[0]
 
 
 def parse_docx(path: Path) -> str:
@@ -89,22 +191,358 @@ def parse_docx(path: Path) -> str:
     return "\n".join(p.text for p in document.paragraphs if p.text and p.text.strip())
 
 
-def parse_file(path: Path) -> Tuple[str, str]:
+def parse_file(
+    path: Path,
+    pdf_backend: str | None = None,
+    pages: Tuple[int, int] | None = None,
+) -> Tuple[str, str, Dict[str, Any]]:
+    """(text, error, stats) for one file, or for the page range `pages` of a PDF.
+
+    stats has at least `chars` and `seconds`; PDFs add the pdf_extract page
+    stats. A page range may come back empty; only whole documents fail with
+    empty_text_after_parsing.
+    """
     ext = path.suffix.lower()
+    start = time.perf_counter()
+    stats: Dict[str, Any] = {}
     try:
         if ext == ".pdf":
-            text = parse_pdf(path)
+            text, stats = extract_pdf(path, pdf_backend, pages)
         elif ext == ".docx":
             text = parse_docx(path)
         else:
-            return "", f"unsupported_extension:{ext}"
+            return "", f"unsupported_extension:{ext}", stats
 
         text = normalize(text)
-        if not text:
-            return "", "empty_text_after_parsing"
-        return text, ""
+        stats.update(chars=len(text), seconds=round(time.perf_counter() - start, 3))
+        if not text and pages is None:
+            return "", "empty_text_after_parsing", stats
+        return text, "", stats
     except Exception as exc:  # noqa: BLE001
-        return "", f"{type(exc).__name__}: {exc}"
+        stats["seconds"] = round(time.perf_counter() - start, 3)
+        return "", f"{type(exc).__name__}: {exc}", stats
+
+
+class ParseTimeout(BaseException):
+    # BaseException so the per-page `except Exception` in extract_pdf can't swallow it.
+    pass
+
+
+def _raise_parse_timeout(signum, frame) -> None:
+    raise ParseTimeout()
+
+
+def parse_file_with_timeout(
+    path: Path,
+    timeout: float,
+    pdf_backend: str | None = None,
+    pages: Tuple[int, int] | None = None,
+) -> Tuple[str, str, Dict[str, Any]]:
+    use_alarm = (
+        timeout > 0
+        and hasattr(signal, "SIGALRM")
+        and threading.current_thread() is threading.main_thread()
+    )
+    if not use_alarm:
+        return parse_file(path, pdf_backend, pages)
+
+    previous = signal.signal(signal.SIGALRM, _raise_parse_timeout)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return parse_file(path, pdf_backend, pages)
+    except ParseTimeout:
+        return "", f"timeout_after_{timeout:g}s", {"seconds": timeout, "timed_out": True}
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def _parse_worker(args: Tuple[str, float, str, Tuple[int, int] | None]) -> Tuple[str, str, Dict[str, Any]]:
+    path, timeout, pdf_backend, pages = args
+    return parse_file_with_timeout(Path(path), timeout, pdf_backend, pages)
+
+
+def _join_ranges(results: List[Tuple[str, str, Dict[str, Any]]]) -> Tuple[str, str, Dict[str, Any]]:
+    """Combine the page-range results of one PDF, in page order."""
+    stats = merge_stats([r[2] for r in results])
+    errors = [r[1] for r in results if r[1]]
+    if errors:
+        return "", errors[0], stats
+    text = normalize("\n\n".join(r[0] for r in results if r[0]))
+    stats["chars"] = len(text)
+    if not text:
+        return "", "empty_text_after_parsing", stats
+    return text, "", stats
+
+
+class ParsePool:
+    """ProcessPoolExecutor that can be killed and replaced when a task hangs."""
+
+    def __init__(self, workers: int) -> None:
+        self.workers = max(1, workers)
+        self._pool = ProcessPoolExecutor(max_workers=self.workers)
+
+    def submit(self, fn: Callable[..., T], *args: Any) -> "Future[T]":
+        return self._pool.submit(fn, *args)
+
+    def replace(self) -> None:
+        """Kill every worker (running tasks included) and start a fresh pool."""
+        processes = list((self._pool._processes or {}).values())  # no public API for this
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        for proc in processes:
+            proc.kill()
+        self._pool = ProcessPoolExecutor(max_workers=self.workers)
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _is_pdf(path: str | Path) -> bool:
+    return str(path).lower().endswith(".pdf")
+
+
+def _count_pages(counter: ParsePool, path: Path, timeout: float, pdf_backend: str) -> int | None:
+    """Page count from a helper process: a PDF that hangs its parser must not stall the parent."""
+    future = counter.submit(page_count, path, pdf_backend)
+    try:
+        return future.result(timeout=timeout if timeout > 0 else None)
+    except FutureTimeout:
+        print(f"[JOB] {path.name}: no page count after {timeout:g}s; parsing it as one task")
+        counter.replace()
+    except Exception:  # noqa: BLE001
+        pass  # unreadable: the parse worker reports the error
+    return None
+
+
+def _submit_parse(
+    pool: ParsePool,
+    counter: ParsePool,
+    path: Path,
+    timeout: float,
+    pdf_backend: str,
+) -> Future | List[Future]:
+    """One task per file; PDFs longer than PDF_PAGES_PER_TASK pages get one per page range."""
+    ranges = [None]
+    if _is_pdf(path) and PDF_PAGES_PER_TASK > 0:
+        pages = _count_pages(counter, path, timeout, pdf_backend)
+        if pages is not None and pages > PDF_PAGES_PER_TASK:
+            ranges = page_ranges(pages, PDF_PAGES_PER_TASK)
+    futures = [pool.submit(_parse_worker, (str(path), timeout, pdf_backend, r)) for r in ranges]
+    return futures if len(futures) > 1 else futures[0]
+
+
+def iter_documents(
+    files: List[Path],
+    docs_root: Path,
+    cache: BuildCache,
+    workers: int,
+    timeout: float,
+    pdf_backend: str,
+) -> Iterator[Dict[str, Any]]:
+    """Yield {source_path, sha256, text, error, stats} per file, in file order.
+
+    Cache misses are parsed in a process pool with a bounded window of
+    in-flight files, so only a handful of texts exist at any time. Long PDFs
+    are split into page ranges that run in parallel on the same pool; their
+    pages are counted in a separate one-process pool, under `timeout`.
+    Cache hits carry the stats of the run that parsed them, marked `cached`.
+
+    A task still running `timeout` + PARSE_KILL_MARGIN_SECONDS after the
+    parent starts waiting for it (it is then at the head of the pool's queue)
+    fails its file with a timeout; the pool is killed and replaced, and the
+    files that were still in flight are submitted again.
+    """
+    window = max(1, workers) * 2
+    wait_seconds = timeout + PARSE_KILL_MARGIN_SECONDS if timeout > 0 else None
+    pool = ParsePool(workers)
+    counter = ParsePool(1)
+    try:
+        inflight: Deque[List[Any]] = deque()  # [path, digest, cached text | Future | List[Future]]
+
+        def collect(value: Future | List[Future]) -> Tuple[str, str, Dict[str, Any]] | None:
+            # Ranges of one PDF run in submission order, so each gets a full wait in turn.
+            try:
+                if isinstance(value, list):
+                    return _join_ranges([f.result(timeout=wait_seconds) for f in value])
+                return value.result(timeout=wait_seconds)
+            except FutureTimeout:
+                return None
+
+        def emit(item: List[Any]) -> Dict[str, Any]:
+            path, digest, value = item
+            if isinstance(value, str):
+                text, err, stats = value, "", dict(cache.get_text_stats(digest, _is_pdf(path)) or {}, cached=True)
+            else:
+                started = time.perf_counter()
+                result = collect(value)
+                if result is None:
+                    print(f"[JOB] {path.name}: no result after {wait_seconds:g}s; restarting parse workers")
+                    text, err, stats = "", f"timeout_after_{timeout:g}s", {
+                        "seconds": round(time.perf_counter() - started, 3),
+                        "timed_out": True,
+                    }
+                    pool.replace()
+                    for other in inflight:
+                        futures = other[2] if isinstance(other[2], list) else [other[2]]
+                        if not isinstance(other[2], str) and not all(f.done() for f in futures):
+                            other[2] = _submit_parse(pool, counter, other[0], timeout, pdf_backend)
+                else:
+                    text, err, stats = result
+                if not err:
+                    cache.put_text(digest, text, stats, _is_pdf(path))
+            return {
+                "source_path": str(path.relative_to(docs_root)),
+                "sha256": digest,
+                "text": text,
+                "error": err,
+                "stats": stats,
+            }
+
+        for path in files:
+            digest = sha256_file(path)
+            text = cache.get_text(digest, _is_pdf(path))
+            if text is None:
+                inflight.append([path, digest, _submit_parse(pool, counter, path, timeout, pdf_backend)])
+            else:
+                inflight.append([path, digest, text])
+            while len(inflight) >= window:
+                yield emit(inflight.popleft())
+        while inflight:
+            yield emit(inflight.popleft())
+    finally:
+        pool.shutdown()
+        counter.shutdown()
+
+
+def run_in_thread(items: Iterator[T], maxsize: int) -> Iterator[T]:
+    """Drive `items` on a background thread, handing results over a bounded queue.
+
+    The producer blocks once `maxsize` items are waiting, which keeps the
+    stages overlapped without letting one run ahead of the other.
+    """
+    handoff: "queue.Queue[Tuple[str, Any]]" = queue.Queue(maxsize=max(1, maxsize))
+
+    def pump() -> None:
+        try:
+            for item in items:
+                handoff.put(("item", item))
+        except BaseException as exc:  # noqa: BLE001
+            handoff.put(("error", exc))
+        else:
+            handoff.put(("done", None))
+
+    threading.Thread(target=pump, name="ingest-parse", daemon=True).start()
+    while True:
+        kind, value = handoff.get()
+        if kind == "item":
+            yield value
+        elif kind == "error":
+            raise value
+        else:
+            return
+
+
+class Embedder:
+    """Chunks and encodes documents; the model loads on the first cache miss."""
+
+    def __init__(self) -> None:
+        self._model: SentenceTransformer | None = None
+        self._chunk_text: Callable[[str], List[str]] | None = None
+
+    def _load(self) -> None:
+        if self._model is None:
+            print(f"[JOB] Loading embedding model {EMBED_MODEL}")
+            self._model = SentenceTransformer(EMBED_MODEL)
+            self._chunk_text = make_chunker(self._model)
+
+    def chunk(self, text: str) -> List[str]:
+        self._load()
+        return self._chunk_text(text)
+
+    def encode(self, parts: List[str]) -> np.ndarray:
+        self._load()
+        encoded = self._model.encode(
+            parts,
+            batch_size=64,
+            normalize_embeddings=True,
+            show_progress_bar=False,
+        )
+        return np.asarray(encoded, dtype="float32")
+
+
+def iter_embedded(
+    docs: Iterator[Dict[str, str]],
+    cache: BuildCache,
+    embedder: Embedder,
+    batch_chunks: int,
+) -> Iterator[Dict[str, Any]]:
+    """Attach `parts`, `vectors` and citation `keys` to each parsed document.
+
+    Cache misses are buffered until about `batch_chunks` chunks are held,
+    then encoded in one call. Order is preserved; the full text is dropped
+    as soon as a document is chunked.
+    """
+    buffer: List[Dict[str, Any]] = []
+    pending_chunks = 0
+    buffered_chunks = 0
+
+    def flush() -> Iterator[Dict[str, Any]]:
+        nonlocal buffer, pending_chunks, buffered_chunks
+        todo = [d for d in buffer if not d["error"] and d["vectors"] is None]
+        if todo:
+            encoded = embedder.encode([part for d in todo for part in d["parts"]])
+            offset = 0
+            for d in todo:
+                n = len(d["parts"])
+                d["vectors"] = encoded[offset:offset + n]
+                offset += n
+                cache.put_chunks(d["sha256"], d["parts"], d["vectors"], _is_pdf(d["source_path"]))
+        out, buffer, pending_chunks, buffered_chunks = buffer, [], 0, 0
+        yield from out
+
+    for doc in docs:
+        if doc["error"]:
+            buffer.append(doc)
+            continue
+        doc["keys"] = document_keys(doc["source_path"], doc["text"])
+        cached = cache.get_chunks(doc["sha256"], _is_pdf(doc["source_path"]))
+        if cached is None:
+            doc["parts"] = embedder.chunk(doc["text"])
+            doc["vectors"] = None
+            pending_chunks += len(doc["parts"])
+        else:
+            doc["parts"], doc["vectors"] = cached
+        del doc["text"]
+        buffer.append(doc)
+        buffered_chunks += len(doc["parts"])
+        # Nothing to encode yet means nothing to wait for.
+        if pending_chunks == 0 or buffered_chunks >= batch_chunks:
+            yield from flush()
+    yield from flush()
+
+
+class VectorSpool:
+    """Appends float32 rows to a raw file; read back as a memmap once done."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.count = 0
+        self.dim = 0
+        self._file = path.open("wb")
+
+    def append(self, vectors: np.ndarray) -> None:
+        if len(vectors) == 0:
+            return
+        vectors = np.ascontiguousarray(vectors, dtype="float32")
+        if self.dim and vectors.shape[1] != self.dim:
+            raise RuntimeError(f"Dimensao inconsistente no spool: {vectors.shape[1]} != {self.dim}")
+        self.dim = vectors.shape[1]
+        self._file.write(vectors.tobytes())
+        self.count += len(vectors)
+
+    def finish(self) -> np.ndarray:
+        self._file.close()
+        return np.memmap(self.path, dtype="float32", mode="r", shape=(self.count, self.dim))
 
 
 def sanitize_docs_inplace(root: Path, report_path: Path) -> None:
@@ -116,56 +554,216 @@ def sanitize_docs_inplace(root: Path, report_path: Path) -> None:
         "--delete-original-doc",
         "--report",
         str(report_path),
+        "--cache-dir",
+        str(WORK_DIR / "conversion_cache"),
+        "--profile-dir",
+        str(WORK_DIR / "lo_profiles"),
     ]
     subprocess.run(cmd, check=True)
 
 
+def shard_slug(folder: str) -> str:
+    name = unicodedata.normalize("NFKD", folder).encode("ascii", "ignore").decode().lower()
+    name = _SHARD_DATE_SUFFIX.sub("", name)
+    return re.sub(r"[^a-z0-9_]+", "_", name).strip("_") or "geral"
+
+
+def shard_names(files: List[Path], base: Path, mode: str = INDEX_SHARDING) -> List[str]:
+    """Shard (legal domain) of each file: its top-level folder under DOCS_SUBDIR.
+
+    A top-level folder with no documents of its own only groups domains
+    (legislacao_grifada_.../penal/...), so its subfolders become the shards.
+    """
+    if mode == "none":
+        return ["all"] * len(files)
+    rels = [p.relative_to(base).parts for p in files]
+    direct = {parts[0] for parts in rels if len(parts) == 2}
+    names: List[str] = []
+    for parts in rels:
+        if len(parts) == 1:
+            names.append("geral")
+        elif len(parts) >= 3 and parts[0] not in direct:
+            names.append(shard_slug(parts[1]))
+        else:
+            names.append(shard_slug(parts[0]))
+    return names
+
+
+def shard_file(name: str, mode: str = INDEX_SHARDING) -> str:
+    """Index file of a shard, relative to the artifacts dir."""
+    return "faiss.index" if mode == "none" else f"shards/{name}.index"
+
+
+def build_shards(
+    vectors: np.ndarray,
+    shards: List[Dict[str, Any]],
+    out_dir: Path,
+    previous_manifest: Dict[str, Any],
+) -> List[Dict[str, Any]]:
+    """Build one index per shard over its slice of the global vectors.
+
+    Shard indexes use local ids 0..count-1; the runtime adds `offset` to get
+    the global chunk id in meta.bin. A shard whose content_key and file match
+    the previous build keeps its index file untouched; rebuilt ones are written
+    to staged_path() and only go live in publish_staged().
+    """
+    previous = {s["name"]: s for s in previous_manifest.get("shards", [])}
+    entries: List[Dict[str, Any]] = []
+    for shard in shards:
+        name, offset, count = shard["name"], shard["offset"], shard["count"]
+        rel = shard_file(name)
+        path = out_dir / rel
+        view = vectors[offset:offset + count]
+        prev = previous.get(name)
+        if (
+            prev
+            and prev.get("content_key") == shard["content_key"]
+            and prev.get("file") == rel
+            and path.exists()
+            and sha256_file(path) == prev.get("sha256")
+        ):
+            info = prev["index"]
+            staged_path(path).unlink(missing_ok=True)  # left over from an interrupted build
+            print(f"[JOB] Shard {name}: unchanged, reusing {rel} ({count} vectors)")
+        else:
+            kind = choose_index_type(count)
+            print(f"[JOB] Shard {name}: building {kind} index over {count} vectors")
+            index, info, search_params = build_index(view, kind)
+            info["search_params"] = search_params
+            info["recall"] = measure_recall(index, view)
+            if is_lossy(info):
+                info["recall_rescored"] = measure_recall(index, view, rescore_factor=RESCORE_FACTOR)
+            print(f"[JOB] Shard {name}: recall {info['recall']}")
+            path.parent.mkdir(parents=True, exist_ok=True)
+            faiss.write_index(index, str(staged_path(path)))
+            del index
+        built = staged_path(path)
+        entries.append(
+            {
+                "name": name,
+                "file": rel,
+                "offset": offset,
+                "count": count,
+                "num_docs": shard["num_docs"],
+                "content_key": shard["content_key"],
+                "sha256": sha256_file(built if built.exists() else path),
+                "index": info,
+            }
+        )
+    return entries
+
+
+def staged_path(path: Path) -> Path:
+    """Where a build writes `path` before publish_staged() swaps it in."""
+    return path.with_name(path.name + ".staged")
+
+
+def publish_staged(paths: List[Path]) -> None:
+    """Swap freshly built artifacts over the live ones.
+
+    A runtime sharing this directory only reloads when manifest.json changes,
+    so the caller writes the manifest after this and meta.bin never goes live
+    next to shards from another build.
+    """
+    for path in paths:
+        os.replace(staged_path(path), path)
+
+
+def write_manifest(path: Path, manifest: Dict[str, Any]) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _remove_stale_shards(out_dir: Path, entries: List[Dict[str, Any]]) -> None:
+    keep = {out_dir / s["file"] for s in entries}
+    candidates = [out_dir / "faiss.index", *(out_dir / "shards").glob("*.index")]
+    for path in candidates:
+        if path not in keep:
+            path.unlink(missing_ok=True)
+
+
+def _changed_shards(entries: List[Dict[str, Any]], previous_manifest: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Shards whose file differs from the last published build (all, if it never published)."""
+    if previous_manifest.get("revision") in (None, "PENDING"):
+        return entries
+    published = {(s["file"], s["sha256"]) for s in previous_manifest.get("shards", [])}
+    return [s for s in entries if (s["file"], s["sha256"]) not in published]
+
+
 def create_manifest(
     docs_repo_id: str,
     docs_revision: str,
-    vectors: np.ndarray,
+    embedding_dim: int,
     docs_ok_count: int,
     failures_count: int,
     chunks_count: int,
     report_path: Path,
-    faiss_path: Path,
+    shards: List[Dict[str, Any]],
     meta_path: Path,
     failures_path: Path,
+    parse_report_path: Path,
+    parse_info: Dict[str, Any],
+    citations_path: Path,
+    citations_count: int,
+    cache_stats: Dict[str, int],
+    index_info: Dict[str, Any],
+    rescore_path: Path | None = None,
 ) -> Dict[str, Any]:
-    return {
+    manifest = {
         "revision": "PENDING",
         "created_at": utc_iso(),
         "docs_repo_id": docs_repo_id,
         "docs_revision": docs_revision,
         "docs_subdir": DOCS_SUBDIR,
         "embed_model": EMBED_MODEL,
-        "embedding_dim": int(vectors.shape[1]),
+        "embedding_dim": embedding_dim,
         "num_docs_ok": docs_ok_count,
         "num_docs_failed": failures_count,
         "num_chunks": chunks_count,
-        "chunking": {
-            "chunk_chars": CHUNK_CHARS,
-            "overlap": CHUNK_OVERLAP,
-        },
+        "chunking": chunking_config(),
+        "parse": parse_info,
+        "build_cache": cache_stats,
+        "num_citation_anchors": citations_count,
+        "index": index_info,
+        "sharding": INDEX_SHARDING,
+        "shards": shards,
         "files": {
-            "faiss_index": f"{ARTIFACTS_PREFIX}/faiss.index",
-            "meta_json": f"{ARTIFACTS_PREFIX}/meta.json",
+            "meta_bin": f"{ARTIFACTS_PREFIX}/meta.bin",
             "failures_json": f"{ARTIFACTS_PREFIX}/failures.json",
+            "parse_report_json": f"{ARTIFACTS_PREFIX}/parse_report.json",
+            "citations_json": f"{ARTIFACTS_PREFIX}/citations.json",
             "conversion_report_json": f"{ARTIFACTS_PREFIX}/conversion_report.json",
             "manifest_json": f"{ARTIFACTS_PREFIX}/manifest.json",
         },
         "checksums": {
-            "faiss_sha256": sha256_file(faiss_path),
             "meta_sha256": sha256_file(meta_path),
             "conversion_report_sha256": sha256_file(report_path),
             "failures_sha256": sha256_file(failures_path),
+            "parse_report_sha256": sha256_file(parse_report_path),
+            "citations_sha256": sha256_file(citations_path),
         },
     }
+    for shard in shards:
+        if shard["file"] == "faiss.index":
+            files_key, checksum_key = "faiss_index", "faiss_sha256"
+        else:
+            # artifact_sync expects "<files key>_sha256" for "shard_*" keys.
+            files_key = f"shard_{shard['name']}"
+            checksum_key = f"{files_key}_sha256"
+        manifest["files"][files_key] = f"{ARTIFACTS_PREFIX}/{shard['file']}"
+        manifest["checksums"][checksum_key] = shard["sha256"]
+    if rescore_path is not None:
+        manifest["files"]["rescore_vectors"] = f"{ARTIFACTS_PREFIX}/vectors.npy"
+        manifest["checksums"]["rescore_vectors_sha256"] = sha256_file(rescore_path)
+    return manifest
 
 
 def main() -> None:
     if not DOCS_REPO_ID or not INDEX_REPO_ID:
         raise RuntimeError("Defina DOCS_REPO_ID e INDEX_REPO_ID no ambiente do Job.")
+    if INDEX_SHARDING not in SHARDING_MODES:
+        raise RuntimeError(f"INDEX_SHARDING invalido: {INDEX_SHARDING} (use domain ou none)")
 
     docs_dir = WORK_DIR / "docs"
     out_dir = WORK_DIR / "out" / "artifacts"
@@ -174,6 +772,7 @@ def main() -> None:
 
     api = HfApi()
 
+    stage("download")
     print(f"[JOB] Download docs dataset: {DOCS_REPO_ID}")
     docs_local = snapshot_download(
         repo_id=DOCS_REPO_ID,
@@ -189,91 +788,172 @@ def main() -> None:
         raise RuntimeError(f"Subdir '{DOCS_SUBDIR}' não existe no dataset. Esperado: {base}")
 
     report_path = out_dir / "conversion_report.json"
+    stage("sanitize")
     print(f"[JOB] Sanitizing docs at {base}")
     sanitize_docs_inplace(base, report_path)
 
-    files = sorted(
-        [p for p in base.rglob("*") if p.is_file() and p.suffix.lower() in ALLOWED_EXTS],
-        key=lambda p: str(p).lower(),
-    )
-    print(f"[JOB] Files found after sanitize: {len(files)}")
+    files = [p for p in base.rglob("*") if p.is_file() and p.suffix.lower() in ALLOWED_EXTS]
+    # Grouped by shard so each shard is one contiguous range of chunk ids.
+    by_shard = sorted(zip(shard_names(files, base), files), key=lambda t: (t[0], str(t[1]).lower()))
+    files = [p for _, p in by_shard]
+    shard_of = {str(p.relative_to(docs_local)): name for name, p in by_shard}
+    print(f"[JOB] Files found after sanitize: {len(files)} in {len(set(shard_of.values()))} shard(s)")
 
-    docs_ok: List[Dict[str, str]] = []
+    pdf_backend = resolve_backend()
+    cache = BuildCache(BUILD_CACHE_DIR, EMBED_MODEL, chunking_config(), pdf_backend)
     failures: List[Dict[str, str]] = []
+    parse_report: List[Dict[str, Any]] = []
+    docs_ok_count = 0
 
-    for file_path in tqdm(files, desc="Parsing"):
-        text, err = parse_file(file_path)
-        rel = str(file_path.relative_to(Path(docs_local)))
-        if err:
-            failures.append({"path": rel, "error": err})
+    meta_path = out_dir / "meta.bin"
+    failures_path = out_dir / "failures.json"
+    parse_report_path = out_dir / "parse_report.json"
+    citations_path = out_dir / "citations.json"
+    manifest_path = out_dir / "manifest.json"
+    try:
+        previous_manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError):
+        previous_manifest = {}
+
+    stage("ingest")
+    # files -> parsed text (background thread + process pool) -> chunks ->
+    # embedding batches (main thread) -> meta.bin / vector spool on disk.
+    print(
+        f"[JOB] Streaming {len(files)} files (workers={PARSE_WORKERS}, "
+        f"timeout={PARSE_TIMEOUT_SECONDS:g}s, pdf={pdf_backend}, embed_batch={EMBED_BATCH_CHUNKS})"
+    )
+    parsed = run_in_thread(
+        iter_documents(files, Path(docs_local), cache, PARSE_WORKERS, PARSE_TIMEOUT_SECONDS, pdf_backend),
+        PIPELINE_QUEUE_SIZE,
+    )
+    meta_writer = MetaStoreWriter(staged_path(meta_path))
+    spool = VectorSpool(WORK_DIR / "vectors.f32")
+    citation_index: Dict[str, List[int]] = {}
+    shards: List[Dict[str, Any]] = []
+
+    for doc in tqdm(iter_embedded(parsed, cache, Embedder(), EMBED_BATCH_CHUNKS), total=len(files), desc="Ingest"):
+        parse_report.append({"path": doc["source_path"], "error": doc["error"], **doc["stats"]})
+        if doc["error"]:
+            failures.append({"path": doc["source_path"], "error": doc["error"]})
             continue
-        docs_ok.append({"source_path": rel, "text": text})
+        docs_ok_count += 1
+        name = shard_of[doc["source_path"]]
+        if not shards or shards[-1]["name"] != name:
+            shards.append(
+                {"name": name, "offset": meta_writer.count, "count": 0, "num_docs": 0, "digest": hashlib.sha256()}
+            )
+        shard = shards[-1]
+        shard["count"] += len(doc["parts"])
+        shard["num_docs"] += 1
+        shard["digest"].update(f"{doc['source_path']}\0{doc['sha256']}\n".encode("utf-8"))
+        for i, part in enumerate(doc["parts"]):
+            for anchor in chunk_anchors(doc["keys"], part):
+                citation_index.setdefault(anchor, []).append(meta_writer.count)
+            meta_writer.append(part, doc["source_path"], i)
+        spool.append(doc["vectors"])
+
+    meta_writer.close()
+    vectors = spool.finish()
+    chunks_count = meta_writer.count
+    failures_path.write_text(json.dumps(failures, ensure_ascii=False, indent=2), encoding="utf-8")
+    parse_report.sort(key=lambda r: -(r.get("seconds") or 0))
+    parse_report_path.write_text(json.dumps(parse_report, ensure_ascii=False, indent=2), encoding="utf-8")
 
-    if not docs_ok:
-        failures_path = out_dir / "failures.json"
-        failures_path.write_text(json.dumps(failures, ensure_ascii=False, indent=2), encoding="utf-8")
+    if not docs_ok_count:
         raise RuntimeError("Nenhum documento parseado com sucesso.")
-
-    chunks: List[Dict[str, Any]] = []
-    for doc_item in docs_ok:
-        parts = chunk_chars(doc_item["text"], CHUNK_CHARS, CHUNK_OVERLAP)
-        for i, part in enumerate(parts):
-            chunks.append({
-                "text": part,
-                "source": doc_item["source_path"],
-                "chunk_id": i,
-            })
-
-    print(f"[JOB] Parsed OK: {len(docs_ok)} | Failed: {len(failures)} | Chunks: {len(chunks)}")
-
-    model = SentenceTransformer(EMBED_MODEL)
-    vectors = model.encode(
-        [chunk["text"] for chunk in chunks],
-        batch_size=64,
-        normalize_embeddings=True,
-        show_progress_bar=False,
+    if not chunks_count:
+        raise RuntimeError("Nenhum chunk gerado a partir dos documentos.")
+    print(f"[JOB] Citation anchors: {len(citation_index)}")
+
+    pruned = cache.prune()
+    print(f"[JOB] Parsed OK: {docs_ok_count} | Failed: {len(failures)} | Chunks: {chunks_count}")
+    print(f"[JOB] Build cache: {cache.stats} | pruned={pruned}")
+    parse_info = parse_summary(parse_report, pdf_backend)
+    print(f"[JOB] Parse: {parse_info['pages']} pages in {parse_info['seconds']}s, slowest: "
+          + ", ".join(f"{s['path']} ({s['seconds']}s)" for s in parse_info["slowest"][:3]))
+
+    # Each shard's index type depends on its final count, so vectors are added
+    # from the disk-backed spool in slices rather than while streaming.
+    stage("index")
+    build_config = json.dumps(
+        {"embed_model": EMBED_MODEL, "chunking": chunking_config(), "index": build_settings()},
+        sort_keys=True,
     )
-    vectors = np.asarray(vectors, dtype="float32")
-
-    index = faiss.IndexFlatIP(vectors.shape[1])
-    index.add(vectors)
-
-    faiss_path = out_dir / "faiss.index"
-    meta_path = out_dir / "meta.json"
-    failures_path = out_dir / "failures.json"
-    manifest_path = out_dir / "manifest.json"
-
-    faiss.write_index(index, str(faiss_path))
-    meta_path.write_text(json.dumps(chunks, ensure_ascii=False, indent=2), encoding="utf-8")
-    failures_path.write_text(json.dumps(failures, ensure_ascii=False, indent=2), encoding="utf-8")
+    shards = [s for s in shards if s["count"]]
+    for shard in shards:
+        digest = shard.pop("digest")
+        digest.update(build_config.encode("utf-8"))
+        shard["content_key"] = digest.hexdigest()
+    shard_entries = build_shards(vectors, shards, out_dir, previous_manifest)
+    if INDEX_SHARDING == "none":
+        index_info = shard_entries[0]["index"]
+    else:
+        index_info = {"sharding": "domain", "shards": len(shard_entries)}
+    rescore_path: Path | None = None
+    if any(is_lossy(s["index"]) for s in shard_entries):
+        # Compressed codes lose some precision; ship the float32 vectors so the
+        # runtime can re-rank the top candidates exactly.
+        rescore_path = out_dir / "vectors.npy"
+        export_rescore_vectors(staged_path(rescore_path), vectors)
+    embedding_dim = int(vectors.shape[1])
+    del vectors
+    spool.path.unlink(missing_ok=True)
+
+    stage("write")
+    write_citation_index(staged_path(citations_path), citation_index)
+    # Everything the runtime pairs up goes live together, then the manifest announces it.
+    rebuilt = [out_dir / s["file"] for s in shard_entries if staged_path(out_dir / s["file"]).exists()]
+    publish_staged([meta_path, citations_path, *rebuilt, *([rescore_path] if rescore_path else [])])
+    _remove_stale_shards(out_dir, shard_entries)
+    if rescore_path is None:
+        (out_dir / "vectors.npy").unlink(missing_ok=True)
 
     manifest = create_manifest(
         docs_repo_id=DOCS_REPO_ID,
         docs_revision=docs_sha,
-        vectors=vectors,
-        docs_ok_count=len(docs_ok),
+        embedding_dim=embedding_dim,
+        docs_ok_count=docs_ok_count,
         failures_count=len(failures),
-        chunks_count=len(chunks),
+        chunks_count=chunks_count,
         report_path=report_path,
-        faiss_path=faiss_path,
+        shards=shard_entries,
         meta_path=meta_path,
         failures_path=failures_path,
+        parse_report_path=parse_report_path,
+        parse_info=parse_info,
+        citations_path=citations_path,
+        citations_count=len(citation_index),
+        cache_stats=cache.stats,
+        index_info=index_info,
+        rescore_path=rescore_path,
     )
-    manifest_path.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+    manifest["ingest_stats"] = ingest_stats(docs_ok_count, chunks_count)
+    write_manifest(manifest_path, manifest)
 
     ops = [
         CommitOperationAdd(
-            path_in_repo=f"{ARTIFACTS_PREFIX}/faiss.index",
-            path_or_fileobj=str(faiss_path),
-        ),
+            path_in_repo=f"{ARTIFACTS_PREFIX}/{shard['file']}",
+            path_or_fileobj=str(out_dir / shard["file"]),
+        )
+        for shard in _changed_shards(shard_entries, previous_manifest)
+    ]
+    ops += [
         CommitOperationAdd(
-            path_in_repo=f"{ARTIFACTS_PREFIX}/meta.json",
+            path_in_repo=f"{ARTIFACTS_PREFIX}/meta.bin",
             path_or_fileobj=str(meta_path),
         ),
         CommitOperationAdd(
             path_in_repo=f"{ARTIFACTS_PREFIX}/failures.json",
             path_or_fileobj=str(failures_path),
         ),
+        CommitOperationAdd(
+            path_in_repo=f"{ARTIFACTS_PREFIX}/parse_report.json",
+            path_or_fileobj=str(parse_report_path),
+        ),
+        CommitOperationAdd(
+            path_in_repo=f"{ARTIFACTS_PREFIX}/citations.json",
+            path_or_fileobj=str(citations_path),
+        ),
         CommitOperationAdd(
             path_in_repo=f"{ARTIFACTS_PREFIX}/conversion_report.json",
             path_or_fileobj=str(report_path),
@@ -283,8 +963,16 @@ def main() -> None:
             path_or_fileobj=str(manifest_path),
         ),
     ]
+    if rescore_path is not None:
+        ops.append(
+            CommitOperationAdd(
+                path_in_repo=f"{ARTIFACTS_PREFIX}/vectors.npy",
+                path_or_fileobj=str(rescore_path),
+            )
+        )
 
-    msg = f"reindex: {utc_iso()} docs_sha={docs_sha[:7]} chunks={len(chunks)}"
+    msg = f"reindex: {utc_iso()} docs_sha={docs_sha[:7]} chunks={chunks_count}"
+    stage("publish")
     print(f"[JOB] Publish artifacts to {INDEX_REPO_ID}")
     commit = api.create_commit(
         repo_id=INDEX_REPO_ID,
@@ -294,7 +982,9 @@ def main() -> None:
     )
 
     manifest["revision"] = commit.oid
-    manifest_path.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+    # Now including the time spent uploading.
+    manifest["ingest_stats"] = ingest_stats(docs_ok_count, chunks_count)
+    write_manifest(manifest_path, manifest)
 
     api.create_commit(
         repo_id=INDEX_REPO_ID,
@@ -308,6 +998,7 @@ def main() -> None:
         commit_message=f"manifest: set revision {commit.oid[:7]}",
     )
 
+    stage("done")
     print(f"[JOB] Done. index_revision={commit.oid} docs_revision={docs_sha}")
 
 
@@ -0,0 +1,410 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import threading
+import time
+from contextlib import redirect_stdout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+from query_encoder import SAMPLE_QUERIES
+
+LOADTEST_SEED = 1234
+MOCK_ANSWER = (
+    "Resposta simulada pelo servidor de teste de carga. Segundo os trechos recuperados, "
+    "o dispositivo citado se aplica ao caso descrito na pergunta."
+)
+TARGETS = {"command", "answer"}
+
+
+class MockInference:
+    """Local stand-in for the HF Inference API text-generation endpoint.
+
+    Answers after `latency_ms` (± `jitter_ms`), then streams MOCK_ANSWER one
+    word every `token_ms` when the payload asks for `stream`, or sends it as
+    plain JSON otherwise. A fraction `error_rate` of the requests gets
+    `error_status` instead (503 exercises the client's retries, 500 does not).
+    """
+
+    def __init__(
+        self,
+        latency_ms: float,
+        jitter_ms: float,
+        token_ms: float,
+        error_rate: float,
+        error_status: int,
+        seed: int = LOADTEST_SEED,
+    ) -> None:
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.token_ms = token_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.requests = 0
+        self.errors = 0
+        self.max_concurrent = 0
+        self._connections: set = set()
+        self._concurrent = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server: ThreadingHTTPServer | None = None
+
+    def _draw(self, client: tuple) -> tuple[float, bool]:
+        with self._lock:
+            self.requests += 1
+            self._connections.add(client)
+            self._concurrent += 1
+            self.max_concurrent = max(self.max_concurrent, self._concurrent)
+            delay = max(0.0, self.latency_ms + self._rng.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+            failed = self._rng.random() < self.error_rate
+            if failed:
+                self.errors += 1
+            return delay, failed
+
+    def _done(self) -> None:
+        with self._lock:
+            self._concurrent -= 1
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, like the real endpoint, so client connection reuse shows in stats().
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self) -> None:  # noqa: N802
+                length = int(self.headers.get("Content-Length") or 0)
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                delay, failed = mock._draw(self.client_address)
+                try:
+                    time.sleep(delay)
+                    if failed:
+                        self._send_json(mock.error_status, {"error": "mock inference error"})
+                    elif payload.get("stream"):
+                        self._send_stream()
+                    else:
+                        time.sleep(len(MOCK_ANSWER.split()) * mock.token_ms / 1000)
+                        self._send_json(200, [{"generated_text": MOCK_ANSWER}])
+                except (BrokenPipeError, ConnectionResetError):
+                    self.close_connection = True  # the client gave up (timeout) mid-answer
+                finally:
+                    mock._done()
+
+            def _send_json(self, status: int, data: Any) -> None:
+                body = json.dumps(data).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_stream(self) -> None:
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                # Chunked like TGI, so the client sees every event as soon as it is sent.
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for word in MOCK_ANSWER.split():
+                    event = {"token": {"text": word + " ", "special": False}}
+                    self._send_chunk(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+                    time.sleep(mock.token_ms / 1000)
+                self._send_chunk(b"data: [DONE]\n\n")
+                self._send_chunk(b"")
+
+            def _send_chunk(self, data: bytes) -> None:
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+
+            def log_message(self, format: str, *args: Any) -> None:  # noqa: A002
+                pass
+
+        return Handler
+
+    def start(self) -> str:
+        """Serve on an ephemeral localhost port; returns the URL to use as HF_INFERENCE_URL."""
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="mock-inference", daemon=True).start()
+        return f"http://127.0.0.1:{self._server.server_address[1]}/models/mock"
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "latency_ms": self.latency_ms,
+                "jitter_ms": self.jitter_ms,
+                "token_ms": self.token_ms,
+                "error_rate": self.error_rate,
+                "error_status": self.error_status,
+                "requests": self.requests,
+                "errors": self.errors,
+                "max_concurrent": self.max_concurrent,
+                "connections": len(self._connections),
+            }
+
+
+class FakeMessage:
+    """What ctx.reply returns; records the streaming edits."""
+
+    def __init__(self, content: str) -> None:
+        self.content = content
+        self.edits = 0
+
+    async def edit(self, content: str) -> None:
+        self.content = content
+        self.edits += 1
+
+
+class FakeContext:
+    """The parts of commands.Context the bot handlers use."""
+
+    def __init__(self, user_id: int, channel_id: int) -> None:
+        self.author = SimpleNamespace(id=user_id, bot=False)
+        self.channel = SimpleNamespace(id=channel_id)
+        self.replies: List[FakeMessage] = []
+        self.first_reply_at: float | None = None
+
+    async def reply(self, content: str) -> FakeMessage:
+        if self.first_reply_at is None:
+            self.first_reply_at = time.perf_counter()
+        message = FakeMessage(content)
+        self.replies.append(message)
+        return message
+
+
+def load_questions(path: str | None) -> tuple[List[str], List[float]]:
+    """Questions and weights: one per line, optionally "peso<TAB>pergunta".
+
+    A question may start with `--area X`, as in `!rag --area X ...`.
+    """
+    if not path:
+        return list(SAMPLE_QUERIES), [1.0] * len(SAMPLE_QUERIES)
+    questions: List[str] = []
+    weights: List[float] = []
+    for line in Path(path).read_text(encoding="utf-8").splitlines():
+        weight, sep, question = line.partition("\t")
+        if not sep:
+            weight, question = "1", line
+        if question.strip():
+            questions.append(question.strip())
+            weights.append(float(weight))
+    if not questions:
+        raise SystemExit(f"Nenhuma pergunta em {path}.")
+    return questions, weights
+
+
+def _answer_outcomes() -> Dict[str, float]:
+    from prometheus_client import REGISTRY
+
+    counts: Dict[str, float] = {}
+    for metric in REGISTRY.collect():
+        if metric.name == "rag_answers":
+            for sample in metric.samples:
+                if sample.name == "rag_answers_total":
+                    counts[sample.labels["outcome"]] = sample.value
+    return counts
+
+
+async def _monitor_lag(interval: float, samples: List[float], stop: asyncio.Event) -> None:
+    """How late the loop wakes a sleeper; blocking work on the loop shows up here."""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - start - interval) * 1000)
+
+
+async def _one_request(bot_app, target: str, question: str, user_id: int, channel_id: int) -> Dict[str, Any]:
+    start = time.perf_counter()
+    result: Dict[str, Any] = {"error": None}
+    ctx = FakeContext(user_id, channel_id)
+    try:
+        if target == "command":
+            await bot_app.rag_cmd.callback(ctx, question=question)
+        else:
+            area, question = bot_app._split_area(question)
+            answer = await bot_app._build_answer(question, area)
+            result["no_hits"] = answer is None
+    except Exception as exc:  # noqa: BLE001
+        result["error"] = f"{type(exc).__name__}: {exc}"
+    result["latency_ms"] = (time.perf_counter() - start) * 1000
+    if ctx.first_reply_at is not None:
+        result["first_reply_ms"] = (ctx.first_reply_at - start) * 1000
+        result["edits"] = sum(m.edits for m in ctx.replies)
+    return result
+
+
+async def drive(bot_app, args: argparse.Namespace, questions: List[str], weights: List[float]) -> Dict[str, Any]:
+    """Open-loop Poisson arrivals at `args.rate`/s for `args.duration` s (or `args.requests`)."""
+    from benchmark import _summary
+
+    rng = random.Random(LOADTEST_SEED)
+    lag: List[float] = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(_monitor_lag(args.lag_interval, lag, stop))
+
+    tasks: List[asyncio.Task] = []
+    start = time.perf_counter()
+    deadline = start + args.duration
+    while time.perf_counter() < deadline and (not args.requests or len(tasks) < args.requests):
+        question = rng.choices(questions, weights)[0]
+        user_id = rng.randrange(args.users)
+        channel_id = rng.randrange(args.channels)
+        tasks.append(asyncio.create_task(_one_request(bot_app, args.target, question, user_id, channel_id)))
+        await asyncio.sleep(rng.expovariate(args.rate))
+    sent_seconds = time.perf_counter() - start
+
+    done, pending = await asyncio.wait(tasks, timeout=args.drain) if tasks else (set(), set())
+    for task in pending:
+        task.cancel()
+    wall = time.perf_counter() - start
+    stop.set()
+    await monitor
+
+    results = [t.result() for t in done]
+    ok = [r for r in results if r["error"] is None]
+    errors: Dict[str, int] = {}
+    for r in results:
+        if r["error"]:
+            errors[r["error"]] = errors.get(r["error"], 0) + 1
+    report: Dict[str, Any] = {
+        "sent": len(tasks),
+        "completed": len(ok),
+        "failed": len(results) - len(ok),
+        "timed_out": len(pending),
+        "send_seconds": round(sent_seconds, 3),
+        "wall_seconds": round(wall, 3),
+        "offered_rps": round(len(tasks) / sent_seconds, 2) if sent_seconds else None,
+        "throughput_rps": round(len(ok) / wall, 2) if wall else None,
+        "latency": _summary([r["latency_ms"] for r in ok]),
+        "event_loop_lag": _summary(lag),
+        "errors": dict(sorted(errors.items(), key=lambda kv: -kv[1])[:10]),
+    }
+    if args.target == "command":
+        report["first_reply"] = _summary([r["first_reply_ms"] for r in ok if "first_reply_ms" in r])
+        report["stream_edits"] = sum(r.get("edits", 0) for r in ok)
+    else:
+        report["no_hits"] = sum(1 for r in ok if r.get("no_hits"))
+    return report
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    questions, weights = load_questions(args.questions)
+
+    mock = None
+    if args.hf_url:
+        os.environ["HF_INFERENCE_URL"] = args.hf_url
+    else:
+        mock = MockInference(args.mock_latency_ms, args.mock_jitter_ms, args.mock_token_ms,
+                             args.mock_error_rate, args.mock_error_status)
+        os.environ["HF_INFERENCE_URL"] = mock.start()
+    # bot_app and hf_client refuse to import without these; neither is used for real here.
+    os.environ.setdefault("DISCORD_TOKEN", "loadtest")
+    os.environ.setdefault("HF_TOKEN", "loadtest")
+    # Mock answers must never reach a persisted answer cache.
+    os.environ["ANSWER_CACHE_PATH"] = ""
+
+    # Imported here so MockInference alone doesn't pull in the ingest stack.
+    import bot_app
+    from benchmark import _git_commit
+    from ingest_job import utc_iso
+
+    print("[LOADTEST] warming up (query encoder and index)", file=sys.stderr)
+    bot_app.warm_up()
+    if bot_app.STARTUP.error:
+        raise SystemExit(f"Falha ao iniciar: {bot_app.STARTUP.error}")
+    if not args.answer_cache:
+        # Otherwise repeated questions only measure the cache.
+        bot_app.answer_cache.max_size = 0
+
+    report: Dict[str, Any] = {
+        "created_at": utc_iso(),
+        "commit": _git_commit(),
+        "config": {
+            "target": args.target,
+            "rate": args.rate,
+            "duration": args.duration,
+            "requests": args.requests,
+            "questions": len(questions),
+            "users": args.users,
+            "channels": args.channels,
+            "answer_cache": args.answer_cache,
+            "hf_url": os.environ["HF_INFERENCE_URL"],
+            "hf_stream": bot_app.HF_STREAM,
+            "admission": {
+                "max_active": bot_app.ADMISSION.max_active,
+                "max_queue": bot_app.ADMISSION.max_queue,
+                "max_per_key": bot_app.ADMISSION.max_per_key,
+                "fairness": bot_app.ADMISSION_FAIRNESS,
+            },
+            "startup": bot_app.STARTUP.status(),
+        },
+    }
+    before = _answer_outcomes()
+    print(f"[LOADTEST] {args.target}: {args.rate:g} req/s for {args.duration:g}s", file=sys.stderr)
+    try:
+        report["load"] = asyncio.run(drive(bot_app, args, questions, weights))
+    finally:
+        if mock is not None:
+            mock.stop()
+    after = _answer_outcomes()
+    report["outcomes"] = {k: int(v - before.get(k, 0)) for k, v in sorted(after.items()) if v - before.get(k, 0)}
+    if mock is not None:
+        report["mock_inference"] = mock.stats()
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Drive the bot's answer path with concurrent traffic against a mock LLM.")
+    parser.add_argument("--target", choices=sorted(TARGETS), default="command",
+                        help="command: the !rag handler with a fake ctx (admission, cache, streaming); "
+                             "answer: _build_answer directly")
+    parser.add_argument("--rate", type=float, default=5.0, help="Mean arrivals per second (Poisson)")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of arrivals")
+    parser.add_argument("--requests", type=int, default=0, help="Stop after this many arrivals (0: no limit)")
+    parser.add_argument("--drain", type=float, default=120.0, help="Seconds to wait for in-flight answers")
+    parser.add_argument("--questions", default=None,
+                        help="Text file, one question per line, optionally 'peso<TAB>pergunta' (default: built-in sample)")
+    parser.add_argument("--users", type=int, default=20, help="Distinct fake Discord users")
+    parser.add_argument("--channels", type=int, default=3, help="Distinct fake Discord channels")
+    parser.add_argument("--answer-cache", action="store_true", help="Keep the semantic answer cache on")
+    parser.add_argument("--lag-interval", type=float, default=0.05, help="Event-loop lag probe interval (s)")
+    parser.add_argument("--hf-url", default=None, help="Use this inference URL instead of the local mock")
+    parser.add_argument("--mock-latency-ms", type=float, default=800.0, help="Mock delay before the first token")
+    parser.add_argument("--mock-jitter-ms", type=float, default=200.0, help="Uniform ± jitter on that delay")
+    parser.add_argument("--mock-token-ms", type=float, default=20.0, help="Mock delay between streamed words")
+    parser.add_argument("--mock-error-rate", type=float, default=0.0, help="Fraction of mock requests that fail")
+    parser.add_argument("--mock-error-status", type=int, default=503, help="HTTP status of the failures")
+    parser.add_argument("--output", type=Path, default=None, help="Write the JSON report here (default: stdout)")
+    args = parser.parse_args()
+
+    if args.rate <= 0:
+        parser.error("--rate must be positive")
+    if not 0 <= args.mock_error_rate <= 1:
+        parser.error("--mock-error-rate must be between 0 and 1")
+    if args.users < 1 or args.channels < 1:
+        parser.error("--users and --channels must be at least 1")
+
+    # stdout carries only the JSON report; progress (ours and the bot's) goes to stderr.
+    with redirect_stdout(sys.stderr):
+        report = run(args)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(text + "\n", encoding="utf-8")
+        print(f"[LOADTEST] report written to {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,14 @@
 import os
-import subprocess
 import threading
 import time
-from pathlib import Path
 
 import uvicorn
 from fastapi import FastAPI, Header, HTTPException, Request
-from fastapi.responses import PlainTextResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
 
-from bot_app import run_bot
-
-WORK_DIR = Path(os.getenv("WORK_DIR", "/data/work"))
-LOCK_PATH = WORK_DIR / "reindex.lock"
-LOG_PATH = WORK_DIR / "reindex.log"
+from metrics import render as render_metrics
+from reindex_jobs import JOBS, LOG_PATH
+from startup import STARTUP
 
 REINDEX_EVERY_SECONDS = int(os.getenv("REINDEX_EVERY_SECONDS", "0"))
 REINDEX_API_TOKEN = os.getenv("REINDEX_API_TOKEN")
@@ -20,61 +16,54 @@ REINDEX_API_TOKEN = os.getenv("REINDEX_API_TOKEN")
 app = FastAPI()
 
 
-def ensure_dirs():
-    WORK_DIR.mkdir(parents=True, exist_ok=True)
-
-
-def lock_acquire() -> bool:
-    ensure_dirs()
-    if LOCK_PATH.exists():
-        age = time.time() - LOCK_PATH.stat().st_mtime
-        if age < 2 * 60 * 60:
-            return False
-        try:
-            LOCK_PATH.unlink()
-        except Exception:
-            return False
-    LOCK_PATH.write_text(str(time.time()), encoding="utf-8")
-    return True
-
-
-def lock_release():
-    try:
-        if LOCK_PATH.exists():
-            LOCK_PATH.unlink()
-    except Exception:
-        pass
-
-
-def run_ingest() -> str:
-    if not lock_acquire():
-        return "LOCKED: reindex ja em execucao."
-    try:
-        ensure_dirs()
-        p = subprocess.run(["python", "ingest_job.py"], capture_output=True, text=True)
-        out = f"EXIT={p.returncode}\n\nSTDOUT:\n{p.stdout}\n\nSTDERR:\n{p.stderr}\n"
-        LOG_PATH.write_text(out[-200_000:], encoding="utf-8")
-        return out
-    finally:
-        lock_release()
-
-
 def scheduler_loop():
     if REINDEX_EVERY_SECONDS <= 0:
         print("[SCHEDULER] disabled (REINDEX_EVERY_SECONDS=0)")
         return
 
     while True:
-        print("[SCHEDULER] running reindex...")
-        print(run_ingest()[:2000])
+        print("[SCHEDULER] submitting reindex...")
+        job = JOBS.submit("scheduler")
+        job.done.wait()
+        print(f"[SCHEDULER] {job.summary()}")
         time.sleep(REINDEX_EVERY_SECONDS)
 
 
+def _authorize(request: Request, authorization: str | None) -> None:
+    if REINDEX_API_TOKEN:
+        if not authorization:
+            raise HTTPException(status_code=401, detail="Missing Authorization header")
+
+        expected = f"Bearer {REINDEX_API_TOKEN}"
+        if authorization != expected:
+            raise HTTPException(status_code=403, detail="Invalid token")
+        return
+
+    client_host = request.client.host if request.client else ""
+    if client_host not in {"127.0.0.1", "::1", "localhost"}:
+        raise HTTPException(
+            status_code=403,
+            detail="External /reindex disabled when REINDEX_API_TOKEN is not set",
+        )
+
+
 @app.get("/health", response_class=PlainTextResponse)
 def health():
     return "ok"
 
 
+@app.get("/ready")
+def ready():
+    status = STARTUP.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+
+@app.get("/metrics")
+def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
 @app.get("/logs", response_class=PlainTextResponse)
 def logs():
     if LOG_PATH.exists():
@@ -82,24 +71,35 @@ def logs():
     return "no logs yet"
 
 
-@app.post("/reindex", response_class=PlainTextResponse)
+@app.post("/reindex")
 def reindex(request: Request, authorization: str | None = Header(default=None)):
-    if REINDEX_API_TOKEN:
-        if not authorization:
-            raise HTTPException(status_code=401, detail="Missing Authorization header")
+    _authorize(request, authorization)
+    job = JOBS.submit("api")
+    body = job.to_dict(log_lines=0)
+    body["status_url"] = f"/reindex/{job.id}"
+    return JSONResponse(body, status_code=202)
 
-        expected = f"Bearer {REINDEX_API_TOKEN}"
-        if authorization != expected:
-            raise HTTPException(status_code=403, detail="Invalid token")
-        return run_ingest()
 
-    client_host = request.client.host if request.client else ""
-    if client_host not in {"127.0.0.1", "::1", "localhost"}:
-        raise HTTPException(
-            status_code=403,
-            detail="External /reindex disabled when REINDEX_API_TOKEN is not set",
-        )
-    return run_ingest()
+@app.get("/reindex")
+def reindex_jobs():
+    return [job.to_dict(log_lines=0) for job in JOBS.list()]
+
+
+@app.get("/reindex/{job_id}")
+def reindex_status(job_id: str):
+    job = JOBS.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job id")
+    return job.to_dict()
+
+
+@app.post("/reindex/{job_id}/cancel")
+def reindex_cancel(job_id: str, request: Request, authorization: str | None = Header(default=None)):
+    _authorize(request, authorization)
+    job = JOBS.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job id")
+    return job.to_dict(log_lines=0)
 
 
 def run_api():
@@ -107,8 +107,11 @@ def run_api():
 
 
 def main():
+    # API first so /health answers while the bot and models are still loading.
     threading.Thread(target=run_api, daemon=True).start()
     threading.Thread(target=scheduler_loop, daemon=True).start()
+    with STARTUP.phase("import bot"):
+        from bot_app import run_bot
     run_bot()
 
 
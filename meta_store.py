@@ -0,0 +1,134 @@
+import json
+import mmap
+import os
+import shutil
+import struct
+from array import array
+from pathlib import Path
+from typing import Any, Dict, Iterable, List
+
+import numpy as np
+
+# Layout (little endian, sections 8-byte aligned):
+#   header: magic(8) version(u32) n_sources(u32) n_chunks(u64) sources_nbytes(u64)
+#   sources: UTF-8 JSON list of distinct source paths
+#   source_idx: u32[n_chunks]
+#   chunk_id:   u32[n_chunks]
+#   text_offsets: u64[n_chunks + 1]
+#   text blob: UTF-8
+MAGIC = b"BSMETA\x00\x01"
+VERSION = 1
+_HEADER = struct.Struct("<8sIIQQ")
+
+
+def _pad(n: int) -> int:
+    return (-n) % 8
+
+
+class MetaStoreWriter:
+    """Streams chunks into a meta store file.
+
+    Texts go straight to a temporary blob file; only the small per-chunk
+    integer columns stay in memory until close().
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._blob_path = path.with_name(path.name + ".blob.tmp")
+        self._blob = self._blob_path.open("wb")
+        self._sources: List[str] = []
+        self._source_ids: Dict[str, int] = {}
+        self._source_idx = array("I")
+        self._chunk_ids = array("I")
+        self._offsets = array("Q", [0])
+
+    @property
+    def count(self) -> int:
+        return len(self._chunk_ids)
+
+    def append(self, text: str, source: str, chunk_id: int) -> None:
+        if source not in self._source_ids:
+            self._source_ids[source] = len(self._sources)
+            self._sources.append(source)
+        data = text.encode("utf-8")
+        self._blob.write(data)
+        self._source_idx.append(self._source_ids[source])
+        self._chunk_ids.append(int(chunk_id))
+        self._offsets.append(self._offsets[-1] + len(data))
+
+    def close(self) -> None:
+        self._blob.close()
+        sources_bytes = json.dumps(self._sources, ensure_ascii=False).encode("utf-8")
+        header = _HEADER.pack(MAGIC, VERSION, len(self._sources), self.count, len(sources_bytes))
+
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with tmp.open("wb") as f:
+            f.write(header)
+            f.write(sources_bytes)
+            f.write(b"\x00" * _pad(_HEADER.size + len(sources_bytes)))
+            f.write(np.asarray(self._source_idx, dtype="<u4").tobytes())
+            f.write(np.asarray(self._chunk_ids, dtype="<u4").tobytes())
+            f.write(np.asarray(self._offsets, dtype="<u8").tobytes())
+            with self._blob_path.open("rb") as blob:
+                shutil.copyfileobj(blob, f, 1024 * 1024)
+        os.replace(tmp, self.path)
+        self._blob_path.unlink(missing_ok=True)
+
+
+def write_meta_store(path: Path, chunks: Iterable[Dict[str, Any]]) -> None:
+    writer = MetaStoreWriter(path)
+    for chunk in chunks:
+        writer.append(chunk["text"], chunk["source"], chunk["chunk_id"])
+    writer.close()
+
+
+class MetaStore:
+    """Read-only, memory-mapped view over a file written by write_meta_store.
+
+    Only the source table is decoded on open; chunk texts are decoded on
+    access, so a lookup costs O(k) for the k hits of a query.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        with path.open("rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, n_sources, n_chunks, sources_nbytes = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Formato de metadados invalido em {path}")
+
+        pos = _HEADER.size
+        self.sources: List[str] = json.loads(self._mm[pos:pos + sources_nbytes].decode("utf-8"))
+        if len(self.sources) != n_sources:
+            raise ValueError(f"Tabela de fontes corrompida em {path}")
+        pos += sources_nbytes + _pad(_HEADER.size + sources_nbytes)
+
+        self._n = n_chunks
+        self.source_idx = np.frombuffer(self._mm, dtype="<u4", count=n_chunks, offset=pos)
+        pos += 4 * n_chunks
+        self.chunk_ids = np.frombuffer(self._mm, dtype="<u4", count=n_chunks, offset=pos)
+        pos += 4 * n_chunks
+        self.offsets = np.frombuffer(self._mm, dtype="<u8", count=n_chunks + 1, offset=pos)
+        self._text_start = pos + 8 * (n_chunks + 1)
+
+    def __len__(self) -> int:
+        return self._n
+
+    def text(self, i: int) -> str:
+        start = self._text_start + int(self.offsets[i])
+        end = self._text_start + int(self.offsets[i + 1])
+        return self._mm[start:end].decode("utf-8")
+
+    def source(self, i: int) -> str:
+        return self.sources[int(self.source_idx[i])]
+
+    def __getitem__(self, i: int) -> Dict[str, Any]:
+        i = int(i)
+        if i < 0 or i >= self._n:
+            raise IndexError(i)
+        return {
+            "text": self.text(i),
+            "source": self.source(i),
+            "chunk_id": int(self.chunk_ids[i]),
+        }
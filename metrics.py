@@ -0,0 +1,80 @@
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+# Answer stages range from sub-millisecond (cache, flat search) to minutes (LLM).
+_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+ANSWER_STAGE_SECONDS = Histogram(
+    "rag_answer_stage_seconds",
+    "Duration of each stage of the answer path.",
+    ["stage"],
+    buckets=_BUCKETS,
+)
+ANSWER_ERRORS = Counter("rag_answer_errors_total", "Answer-path failures, by stage.", ["stage"])
+ANSWERS = Counter("rag_answers_total", "Finished answers, by outcome.", ["outcome"])
+ANSWERS_IN_FLIGHT = Gauge("rag_answers_in_flight", "Answers being built right now.")
+QUERY_CACHE_LOOKUPS = Counter(
+    "rag_query_cache_lookups_total",
+    "Query embedding LRU lookups, by result (hit/miss).",
+    ["result"],
+)
+GENERATION_ACTIVE = Gauge("rag_generation_active", "Answers holding a generation slot.")
+GENERATION_QUEUED = Gauge("rag_generation_queued", "Answers waiting for a generation slot.")
+GENERATION_REJECTED = Counter(
+    "rag_generation_rejected_total",
+    "Answers turned away by admission control, by reason (queue_full/per_key_limit).",
+    ["reason"],
+)
+ANSWER_CACHE_LOOKUPS = Counter(
+    "rag_answer_cache_lookups_total",
+    "Semantic answer cache lookups, by result (hit/miss).",
+    ["result"],
+)
+CONTEXT_TOKENS = Histogram(
+    "rag_context_tokens",
+    "Prompt context tokens after merging and packing the hits.",
+    buckets=(64, 128, 256, 512, 768, 1024, 1536, 2048, 3072, 4096, 8192),
+)
+CITATION_HITS = Counter("rag_citation_hits_total", "Queries answered from the citation index without a search.")
+
+INGEST_STAGE_SECONDS = Gauge(
+    "rag_ingest_stage_seconds",
+    "Duration of each stage of the ingest run behind the loaded index.",
+    ["stage"],
+)
+INGEST_DOCS_PER_SECOND = Gauge("rag_ingest_docs_per_second", "Documents per second in the ingest stage of that run.")
+INGEST_CHUNKS_PER_SECOND = Gauge("rag_ingest_chunks_per_second", "Chunks per second in the ingest stage of that run.")
+INGEST_FINISHED = Gauge("rag_ingest_finished_timestamp_seconds", "Unix time at which that ingest run was recorded.")
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """Observe the block's duration under `stage`; count an error if it raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        ANSWER_ERRORS.labels(stage).inc()
+        raise
+    finally:
+        ANSWER_STAGE_SECONDS.labels(stage).observe(time.perf_counter() - start)
+
+
+def record_ingest(stats: Dict[str, Any] | None) -> None:
+    """Expose manifest["ingest_stats"] (see ingest_job.ingest_stats) of the loaded index."""
+    if not stats:
+        return
+    INGEST_STAGE_SECONDS.clear()
+    for name, seconds in stats.get("stages", {}).items():
+        INGEST_STAGE_SECONDS.labels(name).set(seconds)
+    INGEST_DOCS_PER_SECOND.set(stats.get("docs_per_second") or 0)
+    INGEST_CHUNKS_PER_SECOND.set(stats.get("chunks_per_second") or 0)
+    INGEST_FINISHED.set(stats.get("finished_at") or 0)
+
+
+def render() -> tuple[bytes, str]:
+    """(body, content type) in the Prometheus text exposition format."""
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,220 @@
+import importlib.util
+import os
+import signal
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Tuple
+
+PDF_BACKEND = os.getenv("PDF_BACKEND", "auto").lower()  # auto | pdfium | pymupdf | pypdf
+PDF_PAGE_TIMEOUT_SECONDS = float(os.getenv("PDF_PAGE_TIMEOUT_SECONDS", "30"))  # 0 disables
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "100"))  # 0 = never split a PDF
+
+# "auto" takes the first one installed; pypdf is a hard dependency.
+BACKENDS = ("pdfium", "pymupdf", "pypdf")
+_MODULES = {"pdfium": "pypdfium2", "pymupdf": "fitz", "pypdf": "pypdf"}
+# Page numbers kept per document in the stats lists.
+_MAX_LISTED_PAGES = 20
+
+
+class PageTimeout(BaseException):
+    # BaseException so `except Exception` inside the PDF libraries can't swallow it.
+    pass
+
+
+def _raise_page_timeout(signum, frame) -> None:
+    raise PageTimeout()
+
+
+class _PypdfDocument:
+    def __init__(self, path: Path) -> None:
+        from pypdf import PdfReader
+
+        self._reader = PdfReader(str(path))
+
+    def __len__(self) -> int:
+        return len(self._reader.pages)
+
+    def page_text(self, i: int) -> str:
+        return self._reader.pages[i].extract_text() or ""
+
+    def close(self) -> None:
+        pass
+
+
+class _PdfiumDocument:
+    def __init__(self, path: Path) -> None:
+        import pypdfium2
+
+        self._pdf = pypdfium2.PdfDocument(str(path))
+
+    def __len__(self) -> int:
+        return len(self._pdf)
+
+    def page_text(self, i: int) -> str:
+        page = self._pdf[i]
+        try:
+            textpage = page.get_textpage()
+            try:
+                return textpage.get_text_range()
+            finally:
+                textpage.close()
+        finally:
+            page.close()
+
+    def close(self) -> None:
+        self._pdf.close()
+
+
+class _PymupdfDocument:
+    def __init__(self, path: Path) -> None:
+        import fitz  # PyMuPDF
+
+        self._doc = fitz.open(str(path))
+
+    def __len__(self) -> int:
+        return self._doc.page_count
+
+    def page_text(self, i: int) -> str:
+        return self._doc.load_page(i).get_text()
+
+    def close(self) -> None:
+        self._doc.close()
+
+
+_OPENERS = {"pdfium": _PdfiumDocument, "pymupdf": _PymupdfDocument, "pypdf": _PypdfDocument}
+
+
+def available_backends() -> List[str]:
+    return [name for name in BACKENDS if importlib.util.find_spec(_MODULES[name]) is not None]
+
+
+def resolve_backend(name: str = PDF_BACKEND) -> str:
+    """The backend `name` selects ("auto": the fastest one installed)."""
+    available = available_backends()
+    if name == "auto":
+        return available[0]
+    if name not in _OPENERS:
+        raise RuntimeError(f"PDF_BACKEND invalido: {name} (use auto, {', '.join(BACKENDS)})")
+    if name not in available:
+        raise RuntimeError(f"PDF_BACKEND={name} requer o pacote {_MODULES[name]}, que nao esta instalado.")
+    return name
+
+
+@contextmanager
+def page_budget(seconds: float) -> Iterator[None]:
+    """Raise PageTimeout if the block runs longer than `seconds`.
+
+    Uses SIGALRM, so it only works on the main thread (the parse workers);
+    elsewhere the block runs unbounded. A file-level timer already armed
+    (ingest_job.parse_file_with_timeout) is suspended and re-armed with what
+    was left of it. Native backends are only interrupted once the current
+    library call returns.
+    """
+    if seconds <= 0 or not hasattr(signal, "SIGALRM") or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+    outer_left, _ = signal.getitimer(signal.ITIMER_REAL)
+    if outer_left and outer_left <= seconds:
+        yield  # the file timeout fires first anyway
+        return
+
+    start = time.monotonic()
+    previous = signal.signal(signal.SIGALRM, _raise_page_timeout)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+        if outer_left:
+            signal.setitimer(signal.ITIMER_REAL, max(outer_left - (time.monotonic() - start), 0.001))
+
+
+def page_count(path: Path, backend: str | None = None) -> int:
+    doc = _OPENERS[backend or resolve_backend()](path)
+    try:
+        return len(doc)
+    finally:
+        doc.close()
+
+
+def page_ranges(pages: int, per_task: int = PDF_PAGES_PER_TASK) -> List[Tuple[int, int]]:
+    """[start, stop) page ranges of at most `per_task` pages; one range when splitting is off."""
+    if per_task <= 0 or pages <= per_task:
+        return [(0, pages)]
+    return [(start, min(pages, start + per_task)) for start in range(0, pages, per_task)]
+
+
+def extract_pdf(
+    path: Path,
+    backend: str | None = None,
+    pages: Tuple[int, int] | None = None,
+    page_timeout: float = PDF_PAGE_TIMEOUT_SECONDS,
+) -> Tuple[str, Dict[str, Any]]:
+    """Text of the PDF's pages (all, or the [start, stop) range `pages`), plus stats.
+
+    A page that raises or exceeds `page_timeout` contributes no text and is
+    listed in stats["failed_pages"] / stats["timed_out_pages"] (1-based)
+    instead of failing the document.
+    """
+    backend = backend or resolve_backend()
+    start = time.perf_counter()
+    doc = _OPENERS[backend](path)
+    parts: List[str] = []
+    failed: List[Dict[str, Any]] = []
+    timed_out: List[int] = []
+    slowest = {"page": None, "seconds": 0.0}
+    try:
+        first, stop = pages or (0, len(doc))
+        for i in range(first, stop):
+            page_start = time.perf_counter()
+            text = ""
+            try:
+                with page_budget(page_timeout):
+                    text = doc.page_text(i)
+            except PageTimeout:
+                timed_out.append(i + 1)
+                # Interrupted mid-page, the reader's internal state is not to be trusted.
+                doc.close()
+                doc = _OPENERS[backend](path)
+            except Exception as exc:  # noqa: BLE001
+                failed.append({"page": i + 1, "error": f"{type(exc).__name__}: {exc}"[:200]})
+            seconds = time.perf_counter() - page_start
+            if seconds > slowest["seconds"]:
+                slowest = {"page": i + 1, "seconds": round(seconds, 3)}
+            text = text.strip()
+            if text:
+                parts.append(text)
+    finally:
+        doc.close()
+    if failed or timed_out:
+        print(f"[PDF] {path.name}: {len(failed)} failed / {len(timed_out)} timed-out page(s)")
+    stats = {
+        "backend": backend,
+        "pages": stop - first,
+        "seconds": round(time.perf_counter() - start, 3),
+        "failed_pages": failed[:_MAX_LISTED_PAGES],
+        "num_failed_pages": len(failed),
+        "timed_out_pages": timed_out[:_MAX_LISTED_PAGES],
+        "num_timed_out_pages": len(timed_out),
+        "slowest_page": slowest,
+    }
+    return "\n\n".join(parts), stats
+
+
+def merge_stats(parts: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Stats of a document parsed as several page ranges; `seconds` adds up the ranges."""
+    return {
+        "backend": parts[0].get("backend"),
+        "pages": sum(p.get("pages") or 0 for p in parts),
+        "seconds": round(sum(p.get("seconds") or 0 for p in parts), 3),
+        "failed_pages": [x for p in parts for x in p.get("failed_pages", [])][:_MAX_LISTED_PAGES],
+        "num_failed_pages": sum(p.get("num_failed_pages", 0) for p in parts),
+        "timed_out_pages": [x for p in parts for x in p.get("timed_out_pages", [])][:_MAX_LISTED_PAGES],
+        "num_timed_out_pages": sum(p.get("num_timed_out_pages", 0) for p in parts),
+        "slowest_page": max((p.get("slowest_page") or {"page": None, "seconds": 0.0} for p in parts),
+                            key=lambda s: s["seconds"]),
+        "ranges": len(parts),
+    }
@@ -0,0 +1,274 @@
+import argparse
+import importlib.util
+import json
+import os
+import statistics
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+
+EMBED_MODEL = os.getenv("EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+WORK_DIR = Path(os.getenv("WORK_DIR", "/data/work"))
+QUERY_ENCODER = os.getenv("QUERY_ENCODER", "torch").lower()
+ONNX_MODEL_DIR = Path(os.getenv("ONNX_MODEL_DIR", str(WORK_DIR / "onnx_encoder")))
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))  # 0 = onnxruntime default
+ONNX_MIN_COSINE = float(os.getenv("ONNX_MIN_COSINE", "0.99"))
+
+ONNX_FP32 = "model.onnx"
+ONNX_INT8 = "model.int8.onnx"
+ENCODER_INFO = "encoder.json"
+
+# Representative queries for the equivalence check and the benchmark.
+SAMPLE_QUERIES = [
+    "art. 312 do CPP",
+    "Quais são os requisitos da prisão preventiva?",
+    "prazo para interposição de recurso em sentido estrito",
+    "Súmula 691 STF",
+    "O que caracteriza o crime de peculato?",
+    "hipóteses de dispensa de licitação",
+    "competência do júri para crimes dolosos contra a vida",
+    "direito ao silêncio no interrogatório policial",
+    "súmula vinculante 11 uso de algemas",
+    "Quando cabe habeas corpus substitutivo de recurso ordinário?",
+    "progressão de regime em crimes hediondos",
+    "responsabilidade civil do Estado por omissão",
+]
+
+
+class TorchQueryEncoder:
+    """The reference encoder: the same SentenceTransformer used by ingest."""
+
+    def __init__(self, model_name: str = EMBED_MODEL) -> None:
+        from sentence_transformers import SentenceTransformer
+
+        self.name = model_name
+        self.model = SentenceTransformer(model_name, device="cpu")
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        encoded = self.model.encode(texts, normalize_embeddings=True, show_progress_bar=False)
+        return np.asarray(encoded, dtype="float32")
+
+
+class OnnxQueryEncoder:
+    """int8 ONNX Runtime export of EMBED_MODEL with the same pooling and L2 norm.
+
+    Needs only onnxruntime and tokenizers at load time, not torch.
+    """
+
+    def __init__(self, model_dir: Path = ONNX_MODEL_DIR) -> None:
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.info: Dict[str, Any] = json.loads((model_dir / ENCODER_INFO).read_text(encoding="utf-8"))
+        self.name = f"{self.info['embed_model']}+onnx-int8"
+
+        self.tokenizer = Tokenizer.from_file(str(model_dir / "tokenizer.json"))
+        self.tokenizer.enable_truncation(self.info["max_seq_length"])
+        self.tokenizer.enable_padding(pad_id=self.info["pad_id"], pad_token=self.info["pad_token"])
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if ONNX_THREADS > 0:
+            options.intra_op_num_threads = ONNX_THREADS
+        self.session = ort.InferenceSession(
+            str(model_dir / ONNX_INT8),
+            options,
+            providers=["CPUExecutionProvider"],
+        )
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        columns = {
+            "input_ids": [e.ids for e in encodings],
+            "attention_mask": [e.attention_mask for e in encodings],
+            "token_type_ids": [e.type_ids for e in encodings],
+        }
+        feed = {name: np.asarray(columns[name], dtype="int64") for name in self.info["input_names"]}
+        hidden = self.session.run(["last_hidden_state"], feed)[0]
+        mask = np.asarray(columns["attention_mask"], dtype="float32")[:, :, None]
+
+        pooling = self.info["pooling"]
+        if pooling == "cls":
+            vectors = hidden[:, 0]
+        elif pooling == "max":
+            vectors = np.where(mask > 0, hidden, -1e9).max(axis=1)
+        else:
+            vectors = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+        # Ingest encodes with normalize_embeddings=True; match it.
+        vectors = vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+        return np.ascontiguousarray(vectors, dtype="float32")
+
+
+def export_onnx(model_name: str = EMBED_MODEL, out_dir: Path = ONNX_MODEL_DIR) -> Path:
+    """Export the transformer of `model_name` to ONNX and quantize weights to int8."""
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from sentence_transformers import SentenceTransformer
+    from sentence_transformers.models import Pooling
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    st = SentenceTransformer(model_name, device="cpu")
+    transformer = st[0].auto_model.eval()
+    tokenizer = st.tokenizer
+    pooling = next((m for m in st if isinstance(m, Pooling)), None)
+    pooling_mode = pooling.get_pooling_mode_str() if pooling is not None else "mean"
+    if pooling_mode not in {"mean", "cls", "max"}:
+        raise RuntimeError(f"Pooling nao suportado no export ONNX: {pooling_mode}")
+
+    dummy = tokenizer(["consulta de exemplo"], return_tensors="pt")
+    input_names = list(dummy.keys())
+    dynamic_axes = {name: {0: "batch", 1: "seq"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "seq"}
+
+    fp32_path = out_dir / ONNX_FP32
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            (dict(dummy),),
+            str(fp32_path),
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=14,
+        )
+    quantize_dynamic(str(fp32_path), str(out_dir / ONNX_INT8), weight_type=QuantType.QInt8)
+    fp32_path.unlink(missing_ok=True)
+
+    tokenizer.save_pretrained(str(out_dir))
+    info = {
+        "embed_model": model_name,
+        "pooling": pooling_mode,
+        "max_seq_length": int(st.max_seq_length),
+        "input_names": input_names,
+        "pad_token": tokenizer.pad_token,
+        "pad_id": int(tokenizer.pad_token_id),
+        "dim": int(st.get_sentence_embedding_dimension()),
+    }
+    (out_dir / ENCODER_INFO).write_text(json.dumps(info, indent=2), encoding="utf-8")
+    print(f"[ENCODER] exported {model_name} to {out_dir / ONNX_INT8}")
+    return out_dir
+
+
+def onnx_export_matches(model_dir: Path = ONNX_MODEL_DIR, model_name: str = EMBED_MODEL) -> bool:
+    info_path = model_dir / ENCODER_INFO
+    if not info_path.exists() or not (model_dir / ONNX_INT8).exists():
+        return False
+    try:
+        info = json.loads(info_path.read_text(encoding="utf-8"))
+    except json.JSONDecodeError:
+        return False
+    return info.get("embed_model") == model_name
+
+
+def load_query_encoder() -> TorchQueryEncoder | OnnxQueryEncoder:
+    """Encoder selected by QUERY_ENCODER.
+
+    The onnx backend never exports at startup (that needs torch and minutes of
+    work); it loads what `python query_encoder.py export` wrote, or fails.
+    """
+    if QUERY_ENCODER == "onnx":
+        if importlib.util.find_spec("onnxruntime") is None:
+            raise RuntimeError("QUERY_ENCODER=onnx requer onnxruntime (pip install -r requirements-onnx.txt).")
+        if not onnx_export_matches(ONNX_MODEL_DIR):
+            raise RuntimeError(
+                f"Export ONNX de {EMBED_MODEL} ausente em {ONNX_MODEL_DIR}; "
+                "rode `python query_encoder.py export` antes de iniciar."
+            )
+        return OnnxQueryEncoder(ONNX_MODEL_DIR)
+    if QUERY_ENCODER != "torch":
+        raise RuntimeError(f"QUERY_ENCODER invalido: {QUERY_ENCODER} (use torch ou onnx)")
+    return TorchQueryEncoder()
+
+
+def check_equivalence(
+    candidate: OnnxQueryEncoder,
+    reference: TorchQueryEncoder,
+    queries: List[str],
+) -> Dict[str, float]:
+    """Cosine agreement between candidate and reference vectors, per query."""
+    a = candidate.encode(queries)
+    b = reference.encode(queries)
+    if a.shape != b.shape:
+        raise RuntimeError(f"Dimensoes diferentes: onnx={a.shape} torch={b.shape}")
+    cosines = (a * b).sum(axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+    return {
+        "queries": len(queries),
+        "min_cosine": round(float(cosines.min()), 5),
+        "mean_cosine": round(float(cosines.mean()), 5),
+    }
+
+
+def _latency(encoder: Any, queries: List[str], rounds: int) -> Dict[str, float]:
+    encoder.encode(queries[:1])  # warm-up
+    samples: List[float] = []
+    for _ in range(rounds):
+        for query in queries:
+            start = time.perf_counter()
+            encoder.encode([query])
+            samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "p50_ms": round(statistics.median(samples), 2),
+        "p95_ms": round(samples[int(0.95 * (len(samples) - 1))], 2),
+        "mean_ms": round(statistics.fmean(samples), 2),
+    }
+
+
+def benchmark(queries: List[str], rounds: int = 5) -> Dict[str, Any]:
+    """Load time and single-query latency for both backends, plus their agreement.
+
+    ONNX loads first so its load time is not helped by torch already being imported.
+    """
+    if not onnx_export_matches():
+        export_onnx()
+
+    start = time.perf_counter()
+    onnx_encoder = OnnxQueryEncoder()
+    onnx_load = time.perf_counter() - start
+
+    start = time.perf_counter()
+    torch_encoder = TorchQueryEncoder()
+    torch_load = time.perf_counter() - start
+
+    return {
+        "embed_model": EMBED_MODEL,
+        "torch": {"load_seconds": round(torch_load, 3), **_latency(torch_encoder, queries, rounds)},
+        "onnx_int8": {"load_seconds": round(onnx_load, 3), **_latency(onnx_encoder, queries, rounds)},
+        "equivalence": check_equivalence(onnx_encoder, torch_encoder, queries),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Export, verify and benchmark the ONNX int8 query encoder.")
+    parser.add_argument("command", choices=["export", "check", "bench"])
+    parser.add_argument("--queries", default=None, help="Text file with one query per line (default: built-in sample)")
+    parser.add_argument("--rounds", type=int, default=5, help="Passes over the queries in `bench`")
+    parser.add_argument("--min-cosine", type=float, default=ONNX_MIN_COSINE, help="Minimum per-query cosine in `check`")
+    args = parser.parse_args()
+
+    queries = SAMPLE_QUERIES
+    if args.queries:
+        lines = Path(args.queries).read_text(encoding="utf-8").splitlines()
+        queries = [line.strip() for line in lines if line.strip()]
+
+    if args.command == "export":
+        export_onnx()
+        return
+
+    if args.command == "bench":
+        print(json.dumps(benchmark(queries, args.rounds), indent=2))
+        return
+
+    if not onnx_export_matches():
+        export_onnx()
+    result = check_equivalence(OnnxQueryEncoder(), TorchQueryEncoder(), queries)
+    print(json.dumps(result, indent=2))
+    if result["min_cosine"] < args.min_cosine:
+        raise SystemExit(f"ONNX encoder diverges from torch: min_cosine={result['min_cosine']} < {args.min_cosine}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+import fcntl
+import os
+import re
+import signal
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from pathlib import Path
+from typing import Any, Deque, Dict, List
+
+WORK_DIR = Path(os.getenv("WORK_DIR", "/data/work"))
+LOCK_PATH = WORK_DIR / "reindex.lock"
+LOG_PATH = WORK_DIR / "reindex.log"
+REINDEX_CANCEL_GRACE_SECONDS = float(os.getenv("REINDEX_CANCEL_GRACE_SECONDS", "10"))
+REINDEX_JOB_HISTORY = int(os.getenv("REINDEX_JOB_HISTORY", "20"))
+
+# ingest_job.py prints "[STAGE] <name>" at each phase; tqdm bars give progress.
+_STAGE_LINE = re.compile(r"^\[STAGE\]\s+(\S+)")
+_TQDM_LINE = re.compile(r"^(?P<desc>[^|\n]*?):?\s*(?P<pct>\d{1,3})%\|.*?\|\s*(?P<n>\d+)/(?P<total>\d+)")
+
+ACTIVE_STATUSES = {"queued", "running"}
+
+
+class ReindexJob:
+    def __init__(self, source: str) -> None:
+        self.id = uuid.uuid4().hex[:12]
+        self.source = source
+        self.status = "queued"
+        self.stage: str | None = None
+        self.progress: Dict[str, Any] | None = None
+        self.created_at = time.time()
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+        self.returncode: int | None = None
+        self.error: str | None = None
+        self.log: Deque[str] = deque(maxlen=200)
+        self.cancel_requested = False
+        self.proc: subprocess.Popen | None = None
+        self.done = threading.Event()
+
+    def to_dict(self, log_lines: int = 30) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "source": self.source,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": self.progress,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "returncode": self.returncode,
+            "error": self.error,
+            "log_tail": list(self.log)[-log_lines:] if log_lines else [],
+        }
+
+    def summary(self) -> str:
+        text = f"job {self.id}: {self.status}"
+        if self.stage:
+            text += f" (stage={self.stage})"
+        if self.error:
+            text += f" - {self.error}"
+        return text
+
+
+def _kill_group(proc: subprocess.Popen, sig: int) -> None:
+    try:
+        os.killpg(proc.pid, sig)
+    except ProcessLookupError:
+        pass
+
+
+def _terminate(proc: subprocess.Popen, grace: float) -> None:
+    """SIGTERM the job's process group (ingest + its parse pool + soffice), then SIGKILL."""
+    _kill_group(proc, signal.SIGTERM)
+    try:
+        proc.wait(timeout=grace)
+    except subprocess.TimeoutExpired:
+        _kill_group(proc, signal.SIGKILL)
+
+
+class ReindexJobManager:
+    """Runs ingest_job.py one job at a time, in submission order.
+
+    Submitting while a job is already queued returns that job instead of
+    stacking another full rebuild behind it. Across processes, an flock on
+    LOCK_PATH guarantees a single ingest; the kernel drops it if we die.
+    """
+
+    def __init__(self) -> None:
+        self._jobs: "OrderedDict[str, ReindexJob]" = OrderedDict()
+        self._queue: Deque[ReindexJob] = deque()
+        self._cond = threading.Condition()
+        self._worker: threading.Thread | None = None
+
+    def submit(self, source: str) -> ReindexJob:
+        with self._cond:
+            if self._queue:
+                return self._queue[0]
+            job = ReindexJob(source)
+            self._jobs[job.id] = job
+            self._queue.append(job)
+            self._trim_history()
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._worker_loop, name="reindex-worker", daemon=True)
+                self._worker.start()
+            self._cond.notify()
+            return job
+
+    def get(self, job_id: str) -> ReindexJob | None:
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def list(self) -> List[ReindexJob]:
+        with self._cond:
+            return list(reversed(self._jobs.values()))
+
+    def active(self) -> ReindexJob | None:
+        with self._cond:
+            for job in self._jobs.values():
+                if job.status == "running":
+                    return job
+            return self._queue[0] if self._queue else None
+
+    def cancel(self, job_id: str) -> ReindexJob | None:
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.status not in ACTIVE_STATUSES:
+                return job
+            job.cancel_requested = True
+            if job.status == "queued":
+                self._queue.remove(job)
+                self._finish(job, "cancelled")
+                return job
+            proc = job.proc
+        if proc is not None:
+            threading.Thread(
+                target=_terminate,
+                args=(proc, REINDEX_CANCEL_GRACE_SECONDS),
+                name=f"reindex-cancel-{job.id}",
+                daemon=True,
+            ).start()
+        return job
+
+    def _trim_history(self) -> None:
+        while len(self._jobs) > max(1, REINDEX_JOB_HISTORY):
+            oldest = next(iter(self._jobs.values()))
+            if oldest.status in ACTIVE_STATUSES:
+                break
+            self._jobs.popitem(last=False)
+
+    def _finish(self, job: ReindexJob, status: str, error: str | None = None) -> None:
+        job.status = status
+        job.error = error
+        job.finished_at = time.time()
+        job.done.set()
+        print(f"[REINDEX] {job.summary()}")
+
+    def _worker_loop(self) -> None:
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                job = self._queue.popleft()
+                job.status = "running"
+                job.started_at = time.time()
+            try:
+                self._run(job)
+            except Exception as exc:  # noqa: BLE001
+                self._finish(job, "failed", f"{type(exc).__name__}: {exc}")
+
+    def _consume(self, job: ReindexJob, line: str) -> None:
+        line = line.rstrip()
+        if not line:
+            return
+        job.log.append(line)
+        m = _STAGE_LINE.match(line)
+        if m:
+            job.stage = m.group(1)
+            job.progress = None
+            return
+        m = _TQDM_LINE.match(line)
+        if m:
+            job.progress = {
+                "desc": m.group("desc").strip(),
+                "current": int(m.group("n")),
+                "total": int(m.group("total")),
+                "percent": int(m.group("pct")),
+            }
+
+    def _run(self, job: ReindexJob) -> None:
+        WORK_DIR.mkdir(parents=True, exist_ok=True)
+        with LOCK_PATH.open("a+") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                self._finish(job, "failed", "LOCKED: reindex ja em execucao em outro processo.")
+                return
+            try:
+                lock_file.seek(0)
+                lock_file.truncate()
+                lock_file.write(f"{os.getpid()} {job.id}\n")
+                lock_file.flush()
+                self._run_locked(job)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _run_locked(self, job: ReindexJob) -> None:
+        print(f"[REINDEX] job {job.id} started (source={job.source})")
+        env = dict(os.environ, PYTHONUNBUFFERED="1")
+        with LOG_PATH.open("w", encoding="utf-8") as log_file:
+            # New session: cancel signals the whole group, including workers it spawns.
+            # Text mode turns tqdm's carriage returns into separate lines.
+            proc = subprocess.Popen(
+                [sys.executable, "ingest_job.py"],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
+                errors="replace",
+                env=env,
+                start_new_session=True,
+            )
+            with self._cond:
+                job.proc = proc
+                cancelled_early = job.cancel_requested
+            if cancelled_early:
+                _terminate(proc, REINDEX_CANCEL_GRACE_SECONDS)
+
+            for line in proc.stdout:
+                self._consume(job, line)
+                log_file.write(line)
+                log_file.flush()
+            job.returncode = proc.wait()
+            log_file.write(f"\nEXIT={job.returncode}\n")
+
+        with self._cond:
+            job.proc = None
+        if job.cancel_requested:
+            self._finish(job, "cancelled")
+        elif job.returncode == 0:
+            self._finish(job, "succeeded")
+        else:
+            last = job.log[-1] if job.log else ""
+            self._finish(job, "failed", f"exit={job.returncode} {last}"[:500])
+
+
+JOBS = ReindexJobManager()
@@ -0,0 +1,72 @@
+import asyncio
+import os
+from typing import TYPE_CHECKING, Any, Dict, List, Tuple
+
+if TYPE_CHECKING:
+    # Type-only: importing the runtime pulls in faiss, which startup defers.
+    from index_local_runtime import LocalIndexRuntime
+
+RETRIEVAL_BATCH_WINDOW_MS = float(os.getenv("RETRIEVAL_BATCH_WINDOW_MS", "5"))
+RETRIEVAL_BATCH_MAX = int(os.getenv("RETRIEVAL_BATCH_MAX", "32"))
+
+
+class RetrievalBatcher:
+    """Coalesces concurrent searches into one LocalIndexRuntime.search_batch call.
+
+    The first query of a batch opens a window of RETRIEVAL_BATCH_WINDOW_MS;
+    everything that arrives before it closes (or until RETRIEVAL_BATCH_MAX
+    queries) is encoded and searched together in a worker thread. Each caller
+    gets its own hits, trimmed to the k it asked for; queries keep their own
+    area filter inside the shared batch.
+    """
+
+    def __init__(
+        self,
+        runtime: "LocalIndexRuntime",
+        window_ms: float = RETRIEVAL_BATCH_WINDOW_MS,
+        max_batch: int = RETRIEVAL_BATCH_MAX,
+    ) -> None:
+        self.runtime = runtime
+        self.window = window_ms / 1000.0
+        self.max_batch = max(1, max_batch)
+        self._pending: List[Tuple[str, int, str | None, asyncio.Future]] = []
+        self._timer: asyncio.TimerHandle | None = None
+
+    async def search(self, query: str, k: int = 4, area: str | None = None) -> List[Dict[str, Any]]:
+        loop = asyncio.get_running_loop()
+        fut: asyncio.Future = loop.create_future()
+        self._pending.append((query, k, area, fut))
+
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await fut
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.get_running_loop().create_task(self._run(batch))
+
+    async def _run(self, batch: List[Tuple[str, int, str | None, asyncio.Future]]) -> None:
+        queries = [q for q, _, _, _ in batch]
+        areas = [area for _, _, area, _ in batch]
+        k_max = max(k for _, k, _, _ in batch)
+        try:
+            results = await asyncio.to_thread(self.runtime.search_batch, queries, k_max, areas)
+        except Exception as exc:  # noqa: BLE001
+            for _, _, _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(exc)
+            return
+
+        for (_, k, _, fut), hits in zip(batch, results):
+            if fut.done():
+                continue
+            if isinstance(hits, Exception):
+                fut.set_exception(hits)  # e.g. an unknown area; only this caller fails
+            else:
+                fut.set_result(hits[:k])
@@ -1,75 +1,224 @@
 import argparse
+import hashlib
 import json
+import os
+import queue
+import shutil
+import signal
 import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Any, Dict, List
 
 ALLOWED_SUFFIXES = {".pdf", ".docx"}
 
+SOFFICE_WORKERS = int(os.getenv("SOFFICE_WORKERS", str(min(4, os.cpu_count() or 1))))
+SOFFICE_BATCH_SIZE = int(os.getenv("SOFFICE_BATCH_SIZE", "16"))
+SOFFICE_TIMEOUT_SECONDS = float(os.getenv("SOFFICE_TIMEOUT_SECONDS", "600"))
+
+
+def _conversion_result(
+    doc_path: Path,
+    ok: bool,
+    reason: str,
+    stdout: str = "",
+    stderr: str = "",
+    seconds: float = 0.0,
+) -> Dict[str, Any]:
+    return {
+        "source": str(doc_path),
+        "output": str(doc_path.with_suffix(".docx")),
+        "ok": ok,
+        "reason": reason,
+        "stdout": stdout,
+        "stderr": stderr,
+        "seconds": round(seconds, 3),
+    }
+
+
+def convert_docs_to_docx(
+    doc_paths: List[Path],
+    profile_dir: Path,
+    timeout: float = SOFFICE_TIMEOUT_SECONDS,
+) -> List[Dict[str, Any]]:
+    """Convert a batch of .doc files with a single soffice run.
+
+    `profile_dir` is the LibreOffice user profile owned by the calling worker;
+    separate profiles let several soffice processes run at once, and reusing
+    the same one keeps it warm across batches. Each run writes into its own
+    fresh --outdir, so nothing left by an earlier (failed or timed-out) batch
+    can be taken for this one's output. File stems must be unique within a
+    batch since soffice names every output after its input's stem.
+    """
+    outputs = {p: f"{p.stem}.docx" for p in doc_paths}
+    if len({name.lower() for name in outputs.values()}) != len(outputs):
+        raise ValueError("Nomes de arquivo repetidos no mesmo lote de conversao.")
+
+    profile_dir.mkdir(parents=True, exist_ok=True)
+    out_dir = Path(tempfile.mkdtemp(prefix="out_", dir=profile_dir))
+    try:
+        return _run_soffice(doc_paths, profile_dir, out_dir, outputs, timeout)
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
 
-def convert_doc_to_docx(doc_path: Path) -> Dict[str, Any]:
-    """Convert .doc file to .docx using soffice headless."""
-    out_dir = doc_path.parent
-    target_path = doc_path.with_suffix(".docx")
 
+def _run_soffice(
+    doc_paths: List[Path],
+    profile_dir: Path,
+    out_dir: Path,
+    outputs: Dict[Path, str],
+    timeout: float,
+) -> List[Dict[str, Any]]:
     cmd = [
         "soffice",
+        f"-env:UserInstallation={profile_dir.resolve().as_uri()}",
         "--headless",
         "--convert-to",
         "docx",
         "--outdir",
         str(out_dir),
-        str(doc_path),
+        *[str(p) for p in doc_paths],
     ]
 
+    started = time.perf_counter()
     try:
-        completed = subprocess.run(cmd, check=False, capture_output=True, text=True)
+        # Own session: `soffice` is a launcher for soffice.bin, and killing only
+        # the launcher would leave soffice.bin holding the profile lock.
+        proc = subprocess.Popen(
+            cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, start_new_session=True
+        )
     except FileNotFoundError:
-        return {
-            "source": str(doc_path),
-            "output": str(target_path),
-            "ok": False,
-            "reason": "soffice_not_found",
-            "stdout": "",
-            "stderr": "",
-        }
-
-    if completed.returncode != 0:
-        return {
-            "source": str(doc_path),
-            "output": str(target_path),
-            "ok": False,
-            "reason": "conversion_failed",
-            "stdout": completed.stdout,
-            "stderr": completed.stderr,
-        }
-
-    if not target_path.exists():
-        return {
-            "source": str(doc_path),
-            "output": str(target_path),
-            "ok": False,
-            "reason": "output_not_created",
-            "stdout": completed.stdout,
-            "stderr": completed.stderr,
-        }
+        return [_conversion_result(p, False, "soffice_not_found") for p in doc_paths]
+    try:
+        stdout, stderr = proc.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        proc.communicate()
+        seconds = (time.perf_counter() - started) / len(doc_paths)
+        return [_conversion_result(p, False, "conversion_timeout", seconds=seconds) for p in doc_paths]
+    completed = subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr)
+    # soffice gives no per-file timing; report the batch time split evenly.
+    seconds = (time.perf_counter() - started) / len(doc_paths)
 
-    return {
-        "source": str(doc_path),
-        "output": str(target_path),
-        "ok": True,
-        "reason": "converted",
-        "stdout": completed.stdout,
-        "stderr": completed.stderr,
-    }
+    results: List[Dict[str, Any]] = []
+    for doc_path in doc_paths:
+        produced = out_dir / outputs[doc_path]
+        if not produced.exists():
+            reason = "conversion_failed" if completed.returncode != 0 else "output_not_created"
+            results.append(_conversion_result(doc_path, False, reason, completed.stdout, completed.stderr, seconds))
+            continue
+        shutil.move(str(produced), str(doc_path.with_suffix(".docx")))
+        results.append(_conversion_result(doc_path, True, "converted", completed.stdout, completed.stderr, seconds))
+    return results
+
+
+def convert_doc_to_docx(doc_path: Path, profile_dir: Path | None = None) -> Dict[str, Any]:
+    """Convert .doc file to .docx using soffice headless."""
+    if profile_dir is not None:
+        return convert_docs_to_docx([doc_path], profile_dir)[0]
+    with tempfile.TemporaryDirectory(prefix="lo_profile_") as tmp:
+        return convert_docs_to_docx([doc_path], Path(tmp))[0]
+
+
+def _sha256_file(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
 
 
-def sanitize_docs(root: Path, delete_original_doc: bool) -> Dict[str, Any]:
+def _make_batches(doc_paths: List[Path], batch_size: int) -> List[List[Path]]:
+    batches: List[List[Path]] = []
+    stems: List[set] = []
+    for doc_path in doc_paths:
+        stem = doc_path.stem.lower()
+        for batch, used in zip(batches, stems):
+            if len(batch) < batch_size and stem not in used:
+                batch.append(doc_path)
+                used.add(stem)
+                break
+        else:
+            batches.append([doc_path])
+            stems.append({stem})
+    return batches
+
+
+def convert_all(
+    doc_paths: List[Path],
+    workers: int,
+    batch_size: int,
+    profile_root: Path,
+    cache_dir: Path | None,
+) -> List[Dict[str, Any]]:
+    """Convert .doc files over a pool of soffice workers, each with its own profile.
+
+    When `cache_dir` is set, outputs are stored by source sha256 and reused on
+    later runs without starting soffice. Results follow the order of `doc_paths`.
+    """
+    results: Dict[Path, Dict[str, Any]] = {}
+    digests: Dict[Path, str] = {}
+    pending: List[Path] = []
+
+    if cache_dir is not None:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+    for doc_path in doc_paths:
+        if cache_dir is None:
+            pending.append(doc_path)
+            continue
+        digest = _sha256_file(doc_path)
+        digests[doc_path] = digest
+        cached = cache_dir / f"{digest}.docx"
+        if cached.exists():
+            shutil.copyfile(cached, doc_path.with_suffix(".docx"))
+            results[doc_path] = _conversion_result(doc_path, True, "cache_hit")
+        else:
+            pending.append(doc_path)
+
+    profiles: "queue.Queue[Path]" = queue.Queue()
+    for i in range(max(1, workers)):
+        profile = profile_root / f"worker_{i}"
+        profile.mkdir(parents=True, exist_ok=True)
+        profiles.put(profile)
+
+    def run_batch(batch: List[Path]) -> List[Dict[str, Any]]:
+        profile = profiles.get()
+        try:
+            return convert_docs_to_docx(batch, profile)
+        finally:
+            profiles.put(profile)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for batch_results in pool.map(run_batch, _make_batches(pending, batch_size)):
+            for result in batch_results:
+                doc_path = Path(result["source"])
+                results[doc_path] = result
+                if result["ok"] and cache_dir is not None:
+                    shutil.copyfile(result["output"], cache_dir / f"{digests[doc_path]}.docx")
+
+    return [results[p] for p in doc_paths]
+
+
+def sanitize_docs(
+    root: Path,
+    delete_original_doc: bool,
+    workers: int = SOFFICE_WORKERS,
+    batch_size: int = SOFFICE_BATCH_SIZE,
+    cache_dir: Path | None = None,
+    profile_root: Path | None = None,
+) -> Dict[str, Any]:
     report: Dict[str, Any] = {
         "root": str(root),
         "found_doc": 0,
         "converted_doc_ok": 0,
         "converted_doc_failed": 0,
+        "conversion_cache_hits": 0,
+        "conversion_seconds": 0.0,
         "removed_non_allowed": 0,
         "kept_files": 0,
         "conversions": [],
@@ -80,15 +229,39 @@ def sanitize_docs(root: Path, delete_original_doc: bool) -> Dict[str, Any]:
     if not root.exists() or not root.is_dir():
         raise FileNotFoundError(f"Root path not found or is not a directory: {root}")
 
+    # Walk the tree once; later steps work from these lists.
+    all_files: List[Path] = []
+    all_dirs: List[Path] = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        base = Path(dirpath)
+        all_dirs.extend(base / d for d in dirnames)
+        all_files.extend(base / f for f in filenames)
+    all_files.sort()
+
     # 1) Convert .doc files first.
-    doc_files = [p for p in root.rglob("*") if p.is_file() and p.suffix.lower() == ".doc"]
+    doc_files = [p for p in all_files if p.suffix.lower() == ".doc"]
     report["found_doc"] = len(doc_files)
 
-    for doc_path in doc_files:
-        result = convert_doc_to_docx(doc_path)
+    tmp_profiles = None
+    if profile_root is None:
+        tmp_profiles = tempfile.TemporaryDirectory(prefix="lo_profiles_")
+        profile_root = Path(tmp_profiles.name)
+    try:
+        started = time.perf_counter()
+        conversions = convert_all(doc_files, workers, batch_size, profile_root, cache_dir)
+        report["conversion_seconds"] = round(time.perf_counter() - started, 3)
+    finally:
+        if tmp_profiles is not None:
+            tmp_profiles.cleanup()
+
+    kept = {p for p in all_files if p.suffix.lower() in ALLOWED_SUFFIXES}
+    for doc_path, result in zip(doc_files, conversions):
         report["conversions"].append(result)
         if result["ok"]:
             report["converted_doc_ok"] += 1
+            if result["reason"] == "cache_hit":
+                report["conversion_cache_hits"] += 1
+            kept.add(Path(result["output"]))
             if delete_original_doc:
                 try:
                     doc_path.unlink(missing_ok=True)
@@ -97,12 +270,12 @@ def sanitize_docs(root: Path, delete_original_doc: bool) -> Dict[str, Any]:
         else:
             report["converted_doc_failed"] += 1
             report["errors"].append({"path": str(doc_path), "reason": result["reason"]})
+    report["kept_files"] = len(kept)
 
     # 2) Remove files that are not allowed after conversion.
-    for file_path in [p for p in root.rglob("*") if p.is_file()]:
+    for file_path in all_files:
         suffix = file_path.suffix.lower()
-        if suffix in ALLOWED_SUFFIXES:
-            report["kept_files"] += 1
+        if suffix in ALLOWED_SUFFIXES or not file_path.exists():
             continue
 
         try:
@@ -113,13 +286,12 @@ def sanitize_docs(root: Path, delete_original_doc: bool) -> Dict[str, Any]:
             report["errors"].append({"path": str(file_path), "reason": f"remove_failed: {exc}"})
 
     # 3) Cleanup empty directories.
-    for path in sorted(root.rglob("*"), key=lambda p: len(p.parts), reverse=True):
-        if path.is_dir():
-            try:
-                if not any(path.iterdir()):
-                    path.rmdir()
-            except Exception:
-                pass
+    for path in sorted(all_dirs, key=lambda p: len(p.parts), reverse=True):
+        try:
+            if not any(path.iterdir()):
+                path.rmdir()
+        except Exception:
+            pass
 
     return report
 
@@ -133,13 +305,28 @@ def main() -> None:
         action="store_true",
         help="Delete original .doc files after successful conversion",
     )
+    parser.add_argument("--workers", type=int, default=SOFFICE_WORKERS, help="Concurrent soffice workers")
+    parser.add_argument("--batch-size", type=int, default=SOFFICE_BATCH_SIZE, help="Files per soffice run")
+    parser.add_argument("--cache-dir", default=None, help="Conversion cache dir (keyed by source sha256)")
+    parser.add_argument(
+        "--profile-dir",
+        default=None,
+        help="Root for per-worker LibreOffice profiles (kept between runs); temp dir if omitted",
+    )
     args = parser.parse_args()
 
     root = Path(args.root).resolve()
     report_path = Path(args.report).resolve()
     report_path.parent.mkdir(parents=True, exist_ok=True)
 
-    report = sanitize_docs(root=root, delete_original_doc=args.delete_original_doc)
+    report = sanitize_docs(
+        root=root,
+        delete_original_doc=args.delete_original_doc,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        cache_dir=Path(args.cache_dir).resolve() if args.cache_dir else None,
+        profile_root=Path(args.profile_dir).resolve() if args.profile_dir else None,
+    )
     report_path.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
 
 
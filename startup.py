@@ -0,0 +1,56 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator
+
+# main.py imports this module first, so this is close to process start.
+_PROCESS_START = time.monotonic()
+
+
+class StartupState:
+    """Startup phase timings and the readiness flag behind `/ready`.
+
+    Kept free of heavy imports so the API can serve it before torch/faiss load.
+    """
+
+    def __init__(self) -> None:
+        self.phases: Dict[str, float] = {}
+        self.ready = threading.Event()
+        self.error: str | None = None
+        self.ready_after: float | None = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.monotonic()
+        print(f"[STARTUP] {name}...")
+        try:
+            yield
+        finally:
+            seconds = time.monotonic() - start
+            with self._lock:
+                self.phases[name] = round(seconds, 3)
+            print(f"[STARTUP] {name} took {seconds:.2f}s")
+
+    def mark_ready(self) -> None:
+        self.ready_after = round(time.monotonic() - _PROCESS_START, 3)
+        self.ready.set()
+        print(f"[STARTUP] ready {self.ready_after:.2f}s after process start")
+
+    def fail(self, exc: BaseException) -> None:
+        self.error = f"{type(exc).__name__}: {exc}"
+        print(f"[STARTUP] warm-up failed: {self.error}")
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            phases = dict(self.phases)
+        return {
+            "ready": self.ready.is_set(),
+            "uptime_seconds": round(time.monotonic() - _PROCESS_START, 3),
+            "ready_after_seconds": self.ready_after,
+            "phases": phases,
+            "error": self.error,
+        }
+
+
+STARTUP = StartupState()
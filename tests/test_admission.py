@@ -0,0 +1,142 @@
+import asyncio
+import os
+
+import pytest
+
+os.environ.setdefault("HF_TOKEN", "test")
+
+from admission import AdmissionController, AdmissionRejected, SingleFlight  # noqa: E402
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_slots_are_capped_and_the_queue_is_bounded():
+    async def run():
+        ctl = AdmissionController(max_active=2, max_queue=2, max_per_key=1)
+        release = asyncio.Event()
+
+        async def answer(key):
+            async with ctl.slot(key):
+                await release.wait()
+
+        tasks = [asyncio.create_task(answer(k)) for k in ("a", "b", "c", "d")]
+        await settle()
+        assert (ctl.active, ctl.queued) == (2, 2)
+        with pytest.raises(AdmissionRejected) as full:
+            await ctl._acquire("e")
+        release.set()
+        await asyncio.gather(*tasks)
+        assert (ctl.active, ctl.queued) == (0, 0)
+        return full.value.reason
+
+    assert asyncio.run(run()) == "queue_full"
+
+
+def test_per_key_limit():
+    async def run():
+        ctl = AdmissionController(max_active=1, max_queue=10, max_per_key=1)
+        await ctl._acquire("holder")
+        waiter = asyncio.create_task(ctl._acquire("a"))
+        await settle()
+        with pytest.raises(AdmissionRejected, match="per_key_limit"):
+            await ctl._acquire("a")
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert ctl.queued == 0
+
+    asyncio.run(run())
+
+
+def test_freed_slots_rotate_across_keys():
+    async def run():
+        ctl = AdmissionController(max_active=1, max_queue=10, max_per_key=3)
+        order = []
+        gate = asyncio.Event()
+
+        async def answer(key, name):
+            async with ctl.slot(key):
+                order.append(name)
+                await gate.wait()
+
+        holder = asyncio.create_task(answer("x", "holder"))
+        await settle()
+        tasks = [asyncio.create_task(answer(k, n)) for k, n in (("a", "a1"), ("a", "a2"), ("a", "a3"), ("b", "b1"))]
+        await settle()
+        gate.set()
+        await asyncio.gather(holder, *tasks)
+        return order
+
+    assert asyncio.run(run()) == ["holder", "a1", "b1", "a2", "a3"]
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def run():
+        ctl = AdmissionController(max_active=1, max_queue=10, max_per_key=5)
+        await ctl._acquire("holder")
+        waiter = asyncio.create_task(ctl._acquire("a"))
+        await settle()
+        assert ctl.queued == 1
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert ctl.queued == 0
+        ctl._release()
+        assert ctl.active == 0
+
+    asyncio.run(run())
+
+
+def test_single_flight_shares_one_call():
+    async def run():
+        flight = SingleFlight()
+        calls = []
+
+        async def fn():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "resposta"
+
+        results = await asyncio.gather(*(flight.do("q", fn) for _ in range(3)))
+        assert len(flight) == 0
+        again = await flight.do("q", fn)
+        return results, again, len(calls)
+
+    results, again, calls = asyncio.run(run())
+    assert sorted(results) == [("resposta", False), ("resposta", True), ("resposta", True)]
+    assert again == ("resposta", False)
+    assert calls == 2
+
+
+def test_single_flight_shares_the_exception():
+    async def run():
+        flight = SingleFlight()
+
+        async def fn():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("falhou")
+
+        return await asyncio.gather(flight.do("q", fn), flight.do("q", fn), return_exceptions=True)
+
+    errors = asyncio.run(run())
+    assert all(isinstance(e, RuntimeError) for e in errors)
+
+
+def test_follower_cancel_does_not_cancel_the_leader():
+    async def run():
+        flight = SingleFlight()
+
+        async def fn():
+            await asyncio.sleep(0.02)
+            return "ok"
+
+        leader = asyncio.create_task(flight.do("q", fn))
+        await settle()
+        follower = asyncio.create_task(flight.do("q", fn))
+        await settle()
+        follower.cancel()
+        await asyncio.gather(follower, return_exceptions=True)
+        return await leader
+
+    assert asyncio.run(run()) == ("ok", False)
@@ -0,0 +1,104 @@
+import json
+import time
+
+import numpy as np
+import pytest
+
+import answer_cache
+from answer_cache import SemanticAnswerCache, numbers_key
+
+
+def unit(*values):
+    v = np.asarray(values, dtype="float32")
+    return v / np.linalg.norm(v)
+
+
+@pytest.fixture
+def cache():
+    return SemanticAnswerCache("m", max_size=3, threshold=0.95, ttl_seconds=0, path=None)
+
+
+def test_similar_question_hits(cache):
+    cache.put(unit(1, 0, 0), "O que e peculato?", None, "t1", "resposta")
+    assert cache.get(unit(1, 0.05, 0), "o que é peculato", None, "t1") == "resposta"
+    assert cache.get(unit(0, 1, 0), "outra coisa", None, "t1") is None
+    assert cache.stats() == {"size": 1, "hits": 1, "misses": 1}
+
+
+def test_numbers_and_area_must_match(cache):
+    cache.put(unit(1, 0, 0), "art. 312 do CPP", "penal", "t1", "312")
+    assert numbers_key("art. 312 do CPP, 2ª parte") == "312,2"
+    assert cache.get(unit(1, 0, 0), "art. 313 do CPP", "penal", "t1") is None
+    assert cache.get(unit(1, 0, 0), "art. 312 do CPP", None, "t1") is None
+    assert cache.get(unit(1, 0, 0), "art 312 CPP", "penal", "t1") == "312"
+
+
+def test_new_index_token_drops_old_answers(cache):
+    cache.put(unit(1, 0, 0), "q", None, "t1", "velha")
+    assert cache.get(unit(1, 0, 0), "q", None, "t2") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_lru_and_ttl(monkeypatch):
+    cache = SemanticAnswerCache("m", max_size=2, threshold=0.95, ttl_seconds=10, path=None)
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache.time, "time", lambda: now[0])
+    cache.put(unit(1, 0, 0), "a", None, "t", "A")
+    cache.put(unit(0, 1, 0), "b", None, "t", "B")
+    assert cache.get(unit(1, 0, 0), "a", None, "t") == "A"
+    cache.put(unit(0, 0, 1), "c", None, "t", "C")
+    assert cache.get(unit(0, 1, 0), "b", None, "t") is None  # least recently used
+    now[0] += 11
+    assert cache.get(unit(1, 0, 0), "a", None, "t") is None
+
+
+def test_disabled_cache_stores_nothing():
+    cache = SemanticAnswerCache("m", max_size=0, path=None)
+    cache.put(unit(1, 0), "q", None, "t", "A")
+    assert cache.get(unit(1, 0), "q", None, "t") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_saves_only_when_dirty_and_reloads(tmp_path):
+    path = tmp_path / "cache" / "answers.json"
+    cache = SemanticAnswerCache("m", max_size=4, ttl_seconds=0, path=path)
+    assert cache.save_if_dirty() is False
+    cache.put(unit(1, 0, 0), "q", None, "t", "A")
+    assert cache.save_if_dirty() is True
+    assert cache.save_if_dirty() is False
+    assert [p.name for p in path.parent.iterdir()] == ["answers.json"]
+
+    again = SemanticAnswerCache("m", max_size=4, ttl_seconds=0, path=path)
+    assert again.get(unit(1, 0, 0), "q", None, "t") == "A"
+    assert SemanticAnswerCache("other", max_size=4, ttl_seconds=0, path=path).stats()["size"] == 0
+
+
+def test_failed_save_keeps_file_and_retries(tmp_path, monkeypatch):
+    path = tmp_path / "answers.json"
+    cache = SemanticAnswerCache("m", max_size=4, ttl_seconds=0, path=path)
+    cache.put(unit(1, 0, 0), "q", None, "t", "A")
+    cache.save()
+    cache.put(unit(0, 1, 0), "r", None, "t", "B")
+
+    def broken_replace(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(answer_cache.os, "replace", broken_replace)
+    assert cache.save_if_dirty() is False
+    assert len(json.loads(path.read_text(encoding="utf-8"))["entries"]) == 1
+    monkeypatch.undo()
+    assert cache.save_if_dirty() is True
+    assert len(json.loads(path.read_text(encoding="utf-8"))["entries"]) == 2
+
+
+def test_autosave_writes_in_the_background(tmp_path):
+    path = tmp_path / "answers.json"
+    cache = SemanticAnswerCache("m", max_size=4, ttl_seconds=0, path=path)
+    assert SemanticAnswerCache("m", path=None).start_autosave() is None
+    cache.start_autosave(interval=0.01)
+    cache.put(unit(1, 0, 0), "q", None, "t", "A")
+    for _ in range(200):
+        if path.exists():
+            break
+        time.sleep(0.01)
+    assert json.loads(path.read_text(encoding="utf-8"))["entries"][0]["answer"] == "A"
@@ -0,0 +1,151 @@
+import hashlib
+import json
+
+import pytest
+
+import artifact_sync
+from artifact_sync import ArtifactSync, LocalDirTransport
+
+PREFIX = artifact_sync.ARTIFACTS_PREFIX
+
+
+def publish(root, revision, files):
+    """Lay out `files` ({files key: (name, bytes)}) and a manifest like ingest_job does."""
+    base = root / PREFIX
+    base.mkdir(parents=True, exist_ok=True)
+    manifest = {"revision": revision, "files": {}, "checksums": {}}
+    for key, (name, data) in files.items():
+        path = base / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        manifest["files"][key] = f"{PREFIX}/{name}"
+        manifest["checksums"][artifact_sync._checksum_key(key)] = hashlib.sha256(data).hexdigest()
+    manifest["files"]["manifest_json"] = f"{PREFIX}/manifest.json"
+    (base / "manifest.json").write_text(json.dumps(manifest), encoding="utf-8")
+    return manifest
+
+
+class CountingTransport(LocalDirTransport):
+    def __init__(self, root):
+        super().__init__(root)
+        self.fetched = []
+
+    def fetch(self, path, dest, revision):
+        self.fetched.append(path)
+        super().fetch(path, dest, revision)
+
+
+@pytest.fixture
+def remote(tmp_path):
+    return tmp_path / "remote"
+
+
+@pytest.fixture
+def sync(tmp_path, remote):
+    updates = []
+    syncer = ArtifactSync(CountingTransport(remote), tmp_path / "storage", on_update=lambda: updates.append(1))
+    syncer.updates = updates
+    return syncer
+
+
+FILES = {
+    "faiss_index": ("faiss.index", b"index-v1"),
+    "meta_bin": ("meta.bin", b"meta-v1"),
+    "shard_penal": ("shards/penal.index", b"penal-v1"),
+}
+
+
+def test_first_sync_downloads_everything(sync, remote):
+    publish(remote, "rev1", FILES)
+    assert sync.sync_once() is True
+    assert (sync.current / "faiss.index").read_bytes() == b"index-v1"
+    assert (sync.current / "shards" / "penal.index").read_bytes() == b"penal-v1"
+    assert json.loads((sync.current / "manifest.json").read_text())["revision"] == "rev1"
+    assert sync.stats == {"syncs": 1, "downloaded": 3, "reused": 0}
+    assert sync.updates == [1]
+    # Same revision again: nothing to do.
+    assert sync.sync_once() is False
+
+
+def test_unchanged_files_are_reused(sync, remote):
+    publish(remote, "rev1", FILES)
+    sync.sync_once()
+    sync.transport.fetched.clear()
+    publish(remote, "rev2", {**FILES, "meta_bin": ("meta.bin", b"meta-v2")})
+    assert sync.sync_once() is True
+    assert sync.transport.fetched == [f"{PREFIX}/meta.bin"]
+    assert (sync.current / "meta.bin").read_bytes() == b"meta-v2"
+    assert (sync.current / "faiss.index").read_bytes() == b"index-v1"
+    assert sync.stats["reused"] == 2
+
+
+def test_new_revision_with_same_content_skips_on_update(sync, remote):
+    publish(remote, "rev1", FILES)
+    sync.sync_once()
+    publish(remote, "rev2", FILES)
+    assert sync.sync_once() is True
+    assert sync.updates == [1]
+
+
+def test_pending_manifest_is_ignored(sync, remote):
+    publish(remote, "PENDING", FILES)
+    assert sync.sync_once() is False
+    assert not sync.current.exists()
+
+
+def test_bad_checksum_keeps_current_version(sync, remote):
+    publish(remote, "rev1", FILES)
+    sync.sync_once()
+    manifest = publish(remote, "rev2", {**FILES, "meta_bin": ("meta.bin", b"meta-v2")})
+    manifest["checksums"]["meta_sha256"] = "0" * 64
+    (remote / PREFIX / "manifest.json").write_text(json.dumps(manifest), encoding="utf-8")
+    with pytest.raises(RuntimeError, match="Checksum invalido"):
+        sync.sync_once()
+    assert (sync.current / "meta.bin").read_bytes() == b"meta-v1"
+
+
+def test_partial_download_resumes(sync, remote):
+    publish(remote, "rev1", FILES)
+    staging = sync.storage_dir / "staging" / "rev1"
+    staging.mkdir(parents=True)
+    (staging / "faiss.index.part").write_bytes(b"index-")
+    sync.sync_once()
+    assert (sync.current / "faiss.index").read_bytes() == b"index-v1"
+
+
+def test_old_versions_are_pruned(sync, remote, monkeypatch):
+    monkeypatch.setattr(artifact_sync, "ARTIFACT_KEEP_VERSIONS", 2)
+    for n in range(4):
+        publish(remote, f"rev{n}", {**FILES, "meta_bin": ("meta.bin", f"meta-{n}".encode())})
+        sync.sync_once()
+    kept = sorted(p.name for p in (sync.storage_dir / "versions").iterdir())
+    assert len(kept) == 2 and "rev3" in kept
+    assert sync.current.resolve().name == "rev3"
+
+
+def test_every_published_file_key_has_a_checksum_key():
+    for key in ("faiss_index", "meta_bin", "failures_json", "parse_report_json", "citations_json",
+                "conversion_report_json", "rescore_vectors"):
+        assert artifact_sync._checksum_key(key).endswith("_sha256")
+    assert artifact_sync._checksum_key("shard_penal") == "shard_penal_sha256"
+    with pytest.raises(RuntimeError, match="sem checksum conhecido"):
+        artifact_sync._checksum_key("novo_arquivo")
+
+
+def test_parse_report_is_verified(sync, remote):
+    manifest = publish(remote, "rev1", {**FILES, "parse_report_json": ("parse_report.json", b"{}")})
+    assert "parse_report_sha256" in manifest["checksums"]
+    manifest["checksums"]["parse_report_sha256"] = "0" * 64
+    (remote / PREFIX / "manifest.json").write_text(json.dumps(manifest), encoding="utf-8")
+    with pytest.raises(RuntimeError, match="Checksum invalido"):
+        sync.sync_once()
+
+
+def test_unverifiable_manifest_is_rejected_before_downloading(sync, remote):
+    manifest = publish(remote, "rev1", FILES)
+    del manifest["checksums"]["meta_sha256"]
+    (remote / PREFIX / "manifest.json").write_text(json.dumps(manifest), encoding="utf-8")
+    with pytest.raises(RuntimeError, match="sem checksum para: meta_bin"):
+        sync.sync_once()
+    assert sync.transport.fetched == []
+    assert not sync.current.exists()
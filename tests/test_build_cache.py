@@ -0,0 +1,59 @@
+import numpy as np
+
+from build_cache import BuildCache
+
+
+def test_text_roundtrip_and_stats(tmp_path):
+    cache = BuildCache(tmp_path, "model", {"chunk_chars": 1200})
+    assert cache.get_text("abc") is None
+    cache.put_text("abc", "texto", {"pages": 3})
+    assert cache.get_text("abc") == "texto"
+    assert cache.get_text_stats("abc") == {"pages": 3}
+    assert cache.stats["parse_hits"] == 1
+    assert cache.stats["parse_misses"] == 1
+
+
+def test_chunks_invalidate_on_config_change(tmp_path):
+    vectors = np.ones((2, 4), dtype="float32")
+    cache = BuildCache(tmp_path, "model", {"chunk_chars": 1200})
+    cache.put_chunks("abc", ["a", "b"], vectors)
+    parts, got = cache.get_chunks("abc")
+    assert parts == ["a", "b"]
+    np.testing.assert_array_equal(got, vectors)
+
+    assert BuildCache(tmp_path, "model", {"chunk_chars": 800}).get_chunks("abc") is None
+    assert BuildCache(tmp_path, "other", {"chunk_chars": 1200}).get_chunks("abc") is None
+
+
+def test_pdf_backend_keys_only_pdf_text_separately(tmp_path):
+    pypdf = BuildCache(tmp_path, "model", {})
+    pypdf.put_text("abc", "pypdf", pdf=True)
+    pypdf.put_text("doc", "docx")
+    pdfium = BuildCache(tmp_path, "model", {}, "pdfium")
+    assert pdfium.get_text("abc", pdf=True) is None
+    assert pdfium.get_text("doc") == "docx"
+    pdfium.put_text("abc", "pdfium", pdf=True)
+    assert BuildCache(tmp_path, "model", {}).get_text("abc", pdf=True) == "pypdf"
+
+
+def test_pdf_backend_keys_only_pdf_chunks_separately(tmp_path):
+    vectors = np.ones((1, 2), dtype="float32")
+    pypdf = BuildCache(tmp_path, "model", {})
+    pypdf.put_chunks("abc", ["pdf"], vectors, pdf=True)
+    pypdf.put_chunks("doc", ["docx"], vectors)
+    pdfium = BuildCache(tmp_path, "model", {}, "pdfium")
+    assert pdfium.get_chunks("abc", pdf=True) is None
+    assert pdfium.get_chunks("doc")[0] == ["docx"]
+
+
+def test_prune_keeps_only_entries_used_this_run(tmp_path):
+    first = BuildCache(tmp_path, "model", {})
+    first.put_text("old", "x", {"pages": 1})
+    first.put_text("kept", "y", {"pages": 1})
+    first.put_chunks("old", ["x"], np.ones((1, 2), dtype="float32"))
+
+    second = BuildCache(tmp_path, "model", {})
+    assert second.get_text("kept") == "y"
+    assert second.prune() == 4  # old.txt, old.stats.json, old.json, old.npy
+    assert sorted(p.name for p in (tmp_path / "text").iterdir()) == ["kept.stats.json", "kept.txt"]
+    assert list((tmp_path / "embed").iterdir()) == []
@@ -0,0 +1,69 @@
+import re
+
+import pytest
+
+from chunker import TokenChunker, is_major_boundary
+
+
+class WordTokenizer:
+    """One token per whitespace-separated word, with the fast-tokenizer call shape."""
+
+    def __init__(self) -> None:
+        self.batched_calls = 0
+
+    def __call__(self, text, add_special_tokens=False, return_attention_mask=True, return_offsets_mapping=False):
+        if isinstance(text, list):
+            self.batched_calls += 1
+            return {"input_ids": [text_.split() for text_ in text]}
+        offsets = [(m.start(), m.end()) for m in re.finditer(r"\S+", text)]
+        return {"input_ids": [text[a:b] for a, b in offsets], "offset_mapping": offsets}
+
+
+def words(n: int, prefix: str = "w") -> str:
+    return " ".join(f"{prefix}{i}" for i in range(n))
+
+
+def test_chunks_respect_the_token_budget():
+    text = "\n".join(words(3, f"l{i}_") for i in range(10))
+    chunks = TokenChunker(WordTokenizer(), max_tokens=7).chunk(text)
+    assert chunks == ["\n".join(words(3, f"l{i}_") for i in (j, j + 1)) for j in range(0, 10, 2)]
+    assert all(len(c.split()) <= 7 for c in chunks)
+
+
+def test_lines_are_tokenized_in_one_batch():
+    tokenizer = WordTokenizer()
+    TokenChunker(tokenizer, max_tokens=5).chunk("\n".join(words(2) for _ in range(20)))
+    assert tokenizer.batched_calls == 1
+
+
+def test_long_line_is_split_on_token_offsets():
+    chunks = TokenChunker(WordTokenizer(), max_tokens=4).chunk(words(10))
+    assert chunks == ["w0 w1 w2 w3", "w4 w5 w6 w7", "w8 w9"]
+
+
+def test_major_boundary_cuts_a_half_full_chunk():
+    text = "\n".join(["intro um dois tres", "Art. 1º Texto do artigo", "Art. 2º Outro"])
+    chunks = TokenChunker(WordTokenizer(), max_tokens=8).chunk(text)
+    assert chunks == ["intro um dois tres", "Art. 1º Texto do artigo", "Art. 2º Outro"]
+    # Below half the budget the heading just joins the chunk.
+    assert TokenChunker(WordTokenizer(), max_tokens=20).chunk(text) == [text]
+
+
+def test_overlap_carries_trailing_lines():
+    text = "\n".join(["a b", "c d", "e f", "g h"])
+    chunks = TokenChunker(WordTokenizer(), max_tokens=4, overlap_tokens=2).chunk(text)
+    assert chunks == ["a b\nc d", "c d\ne f", "e f\ng h"]
+
+
+def test_empty_text_and_invalid_budget():
+    assert TokenChunker(WordTokenizer(), max_tokens=4).chunk("\n  \n") == []
+    with pytest.raises(ValueError):
+        TokenChunker(WordTokenizer(), max_tokens=0)
+
+
+@pytest.mark.parametrize(
+    "line, major",
+    [("Art. 5º", True), ("SÚMULA 11", True), ("Capítulo II", True), ("Parte Geral", True), ("o art. 5", False)],
+)
+def test_is_major_boundary(line, major):
+    assert is_major_boundary(line) is major
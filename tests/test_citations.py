@@ -0,0 +1,93 @@
+import pytest
+
+from citations import (
+    chunk_anchors,
+    document_keys,
+    load_citation_index,
+    query_anchors,
+    write_citation_index,
+)
+
+
+def test_document_keys_from_file_name_and_header():
+    assert document_keys("leis/dl_3689_1941.txt", "Decreto-Lei nº 3.689, de 3 de outubro de 1941") == ["dl:3689"]
+    assert document_keys("lei_8.txt", "LEI Nº 8.666, DE 21 DE JUNHO DE 1993") == ["lei:8"]
+    assert document_keys("licitacoes.txt", "LEI Nº 8.666, DE 21 DE JUNHO DE 1993") == ["lei:8666"]
+    assert document_keys("sumulas_vinculantes.txt", "Lei nº 8.666") == ["court:sv"]
+    assert document_keys("sumulas_do_stf.txt", "") == ["court:stf"]
+
+
+
+def test_header_ignores_laws_named_in_the_ementa():
+    decree = "Presidência da República\nDECRETO Nº 9.412, DE 18 DE JUNHO DE 2018\nAtualiza os valores da Lei nº 8.666"
+    assert document_keys("valores_licitacao.txt", decree) == ["dec:9412"]
+    ementa = "Regulamenta a Lei nº 8.666, de 21 de junho de 1993.\nDECRETO Nº 9.000"
+    assert document_keys("regulamento.txt", ementa) == []
+    assert document_keys("dec_9412_2018.txt", decree) == ["dec:9412"]
+
+
+def test_article_headings():
+    text = "Art. 312. A prisão preventiva...\nart. 313 citado no texto\nArt. 24-A - Novo artigo\nART 1º Disposição"
+    assert chunk_anchors(["dl:3689"], text) == ["dl:3689|art:312", "dl:3689|art:24-a", "dl:3689|art:1"]
+
+
+@pytest.mark.parametrize(
+    "heading, number",
+    [
+        ("SÚMULA VINCULANTE 11", 11),
+        ("Súmula Vinculante 11:", 11),
+        ("Sumula Nº 2", 2),
+        ("Súmula nº 691 - Não compete ao STF...", 691),
+        ("SUMULA 7.", 7),
+        ("  Súmula 14 – texto", 14),
+    ],
+)
+def test_sumula_heading_forms(heading, number):
+    text = f"Texto anterior.\n{heading}\nEnunciado da súmula."
+    assert chunk_anchors(["court:stf"], text) == [f"sumula:stf:{number}"]
+
+
+def test_sumula_mention_inside_a_line_is_not_a_heading():
+    assert chunk_anchors(["court:stf"], "conforme a Súmula 691 do STF, nao cabe") == []
+    assert chunk_anchors(["court:stf"], "Súmula 691 do STF foi superada") == []
+
+
+def test_headings_resolve_queries_through_the_index(tmp_path):
+    docs = {
+        "sumulas_vinculantes.txt": "SÚMULA VINCULANTE 11\nSó é lícito o uso de algemas...\n\nSÚMULA VINCULANTE 12\nA cobrança...",
+        "sumulas_stf.txt": "Sumula Nº 2\nConcede-se liberdade vigiada...\nSúmula nº 691 - Não compete...",
+    }
+    anchors = {}
+    chunk_id = 0
+    for path, text in docs.items():
+        keys = document_keys(path, text)
+        for chunk in text.split("\n\n"):
+            for anchor in chunk_anchors(keys, chunk):
+                anchors.setdefault(anchor, []).append(chunk_id)
+            chunk_id += 1
+    path = tmp_path / "citations.json"
+    write_citation_index(path, anchors)
+    index = load_citation_index(path)
+
+    def lookup(query):
+        return [i for anchor in query_anchors(query) for i in index.get(anchor, [])]
+
+    assert lookup("O que diz a Súmula Vinculante 11?") == [0]
+    assert lookup("súmula vinculante nº 12") == [1]
+    assert lookup("Súmula 2 do STF") == [2]
+    assert lookup("sumula 691 stf") == [2]
+    # Without a court the number is ambiguous.
+    assert lookup("Súmula 691") == []
+
+
+def test_query_anchors_articles():
+    assert query_anchors("o que diz o art. 312 do CPP?") == ["dl:3689|art:312"]
+    assert query_anchors("artigo 24-A da Lei 8.666") == ["lei:8666|art:24-a"]
+    assert query_anchors("prisao preventiva") == []
+
+
+def test_load_citation_index_ignores_missing_and_old_versions(tmp_path):
+    path = tmp_path / "citations.json"
+    assert load_citation_index(path) == {}
+    path.write_text('{"version": 0, "anchors": {"x": [1]}}', encoding="utf-8")
+    assert load_citation_index(path) == {}
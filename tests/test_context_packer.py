@@ -0,0 +1,76 @@
+import pytest
+
+import context_packer
+from context_packer import SEPARATOR, drop_near_duplicates, merge_adjacent, pack_context
+
+
+@pytest.fixture(autouse=True)
+def word_counter(monkeypatch):
+    # One token per word keeps the budgets readable and needs no tokenizer download.
+    monkeypatch.setattr(context_packer, "_counter", lambda text: len(text.split()))
+
+
+def hit(source, chunk_id, text, score=0.5):
+    return {"source": source, "chunk_id": chunk_id, "text": text, "score": score}
+
+
+def words(n, prefix="w"):
+    return " ".join(f"{prefix}{i}" for i in range(n))
+
+
+def test_consecutive_chunks_merge_without_repeating_the_overlap():
+    overlap = "trecho com sobreposicao comum entre os dois pedacos ao final"
+    a = "Art. 1 texto inicial que continua no proximo " + overlap
+    b = overlap + " e segue ate o fim"
+    blocks = merge_adjacent([hit("lei.txt", 3, b, 0.9), hit("lei.txt", 2, a, 0.4), hit("outra.txt", 7, "x", 0.6)])
+    assert [blk["source"] for blk in blocks] == ["lei.txt", "outra.txt"]
+    assert blocks[0]["text"] == a[: a.index("trecho")] + b
+    assert blocks[0]["chunk_ids"] == [2, 3]
+    assert blocks[0]["score"] == 0.9
+
+
+def test_non_adjacent_chunks_stay_apart():
+    blocks = merge_adjacent([hit("lei.txt", 1, "um"), hit("lei.txt", 3, "tres"), hit("lei.txt", 1, "um")])
+    assert [blk["chunk_ids"] for blk in blocks] == [[1], [3]]
+
+
+def test_near_duplicates_are_dropped():
+    article = "Art. 312. A prisao preventiva podera ser decretada como garantia da ordem publica"
+    blocks = [
+        {"source": "cpp.txt", "text": "Capitulo III " + article + " e da ordem economica", "score": 0.9},
+        {"source": "compilado.txt", "text": article, "score": 0.8},
+        {"source": "outro.txt", "text": "Art. 313. Sera admitida a decretacao da prisao preventiva", "score": 0.7},
+    ]
+    assert [b["source"] for b in drop_near_duplicates(blocks)] == ["cpp.txt", "outro.txt"]
+
+
+def test_everything_fits():
+    hits = [hit("a.txt", 0, words(10, "a"), 0.9), hit("b.txt", 0, words(10, "b"), 0.8)]
+    context, stats = pack_context(hits, max_tokens=100)
+    assert context.count(SEPARATOR) == 1
+    assert context.startswith("[a.txt] (score=0.900)")
+    assert stats == {"hits": 2, "blocks": 2, "packed": 2, "tokens": len(context.split())}
+
+
+def test_last_block_is_truncated_within_budget():
+    hits = [hit("a.txt", 0, words(50, "a"), 0.9), hit("b.txt", 0, words(200, "b"), 0.8), hit("c.txt", 0, "c", 0.1)]
+    context, stats = pack_context(hits, max_tokens=150)
+    assert stats["packed"] == 2 and stats["tokens"] <= 150
+    assert len(context.split()) <= 150
+    assert context.endswith("[...]")
+    assert "[c.txt]" not in context
+
+
+def test_small_leftover_budget_is_not_used():
+    hits = [hit("a.txt", 0, words(100, "a"), 0.9), hit("b.txt", 0, words(200, "b"), 0.8)]
+    context, stats = pack_context(hits, max_tokens=140)
+    assert stats["packed"] == 1
+    assert "[b.txt]" not in context
+
+
+def test_token_counter_falls_back_to_estimate(monkeypatch):
+    monkeypatch.setattr(context_packer, "_counter", None)
+    monkeypatch.setattr(context_packer, "CONTEXT_TOKENIZER", "")
+    count = context_packer.token_counter()
+    assert count is context_packer._estimate_tokens
+    assert count("x" * 35) == int(35 / context_packer.CONTEXT_CHARS_PER_TOKEN) + 1
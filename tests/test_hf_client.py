@@ -0,0 +1,161 @@
+import asyncio
+import os
+import socket
+import time
+
+import pytest
+import requests
+
+os.environ.setdefault("HF_TOKEN", "test")
+
+import hf_client  # noqa: E402
+from loadtest import MOCK_ANSWER, MockInference  # noqa: E402
+
+MESSAGES = [{"role": "user", "content": "pergunta"}]
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(hf_client, "HF_BACKOFF_SECONDS", 0.01)
+    monkeypatch.setattr(hf_client, "HF_MAX_RETRIES", 3)
+
+
+def start_mock(monkeypatch, **kwargs) -> MockInference:
+    options = dict(latency_ms=0, jitter_ms=0, token_ms=0, error_rate=0.0, error_status=503)
+    options.update(kwargs)
+    mock = MockInference(**options)
+    monkeypatch.setattr(hf_client, "HF_INFERENCE_URL", mock.start())
+    return mock
+
+
+@pytest.fixture
+def mock(monkeypatch, request):
+    server = start_mock(monkeypatch, **getattr(request, "param", {}))
+    yield server
+    server.stop()
+
+
+class FailFirst(MockInference):
+    """Answers `failures` requests with error_status, then succeeds."""
+
+    def __init__(self, failures: int, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.failures = failures
+
+    def _draw(self, client: tuple) -> tuple[float, bool]:
+        delay, _ = super()._draw(client)
+        failed = self.requests <= self.failures
+        if failed:
+            self.errors += 1
+        return delay, failed
+
+
+def test_call_hf_returns_generated_text(mock):
+    assert hf_client.call_hf(MESSAGES) == MOCK_ANSWER.strip()
+
+
+def test_retries_503_until_success(monkeypatch):
+    server = FailFirst(2, latency_ms=0, jitter_ms=0, token_ms=0, error_rate=0.0, error_status=503)
+    monkeypatch.setattr(hf_client, "HF_INFERENCE_URL", server.start())
+    try:
+        assert hf_client.call_hf(MESSAGES) == MOCK_ANSWER.strip()
+        assert server.stats()["requests"] == 3
+    finally:
+        server.stop()
+
+
+@pytest.mark.parametrize("mock", [{"error_rate": 1.0, "error_status": 503}], indirect=True)
+def test_gives_up_after_max_retries(mock):
+    with pytest.raises(requests.HTTPError):
+        hf_client.call_hf(MESSAGES)
+    assert mock.stats()["requests"] == hf_client.HF_MAX_RETRIES + 1
+
+
+@pytest.mark.parametrize("mock", [{"error_rate": 1.0, "error_status": 500}], indirect=True)
+def test_other_errors_are_not_retried(mock):
+    with pytest.raises(requests.HTTPError):
+        hf_client.call_hf(MESSAGES)
+    assert mock.stats()["requests"] == 1
+
+
+@pytest.mark.parametrize("mock", [{"latency_ms": 1000}], indirect=True)
+def test_read_timeout_is_not_retried(mock, monkeypatch):
+    monkeypatch.setattr(hf_client, "HF_READ_TIMEOUT", 0.2)
+    with pytest.raises(requests.ReadTimeout):
+        hf_client.call_hf(MESSAGES)
+    assert mock.stats()["requests"] == 1
+
+
+@pytest.mark.parametrize("mock", [{"error_rate": 1.0, "error_status": 503}], indirect=True)
+def test_retry_budget_caps_total_time(mock, monkeypatch):
+    monkeypatch.setattr(hf_client, "HF_MAX_RETRIES", 50)
+    monkeypatch.setattr(hf_client, "HF_BACKOFF_SECONDS", 0.1)
+    monkeypatch.setattr(hf_client, "HF_BACKOFF_MAX_SECONDS", 0.1)
+    monkeypatch.setattr(hf_client, "HF_RETRY_BUDGET_SECONDS", 0.5)
+    start = time.monotonic()
+    with pytest.raises(requests.HTTPError):
+        hf_client.call_hf(MESSAGES)
+    assert time.monotonic() - start < 1.0
+    assert 1 < mock.stats()["requests"] < 10
+
+
+def test_connection_errors_are_retried(monkeypatch, capsys):
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    monkeypatch.setattr(hf_client, "HF_INFERENCE_URL", f"http://127.0.0.1:{port}/models/none")
+    with pytest.raises(requests.ConnectionError):
+        hf_client.call_hf(MESSAGES)
+    assert capsys.readouterr().out.count("[HF] retry") == hf_client.HF_MAX_RETRIES
+
+
+def test_sequential_calls_reuse_one_connection(mock):
+    for _ in range(10):
+        hf_client.call_hf(MESSAGES)
+    assert mock.stats()["requests"] == 10
+    assert mock.stats()["connections"] == 1
+
+
+@pytest.mark.parametrize("mock", [{"latency_ms": 50}], indirect=True)
+def test_generation_concurrency_is_bounded_by_pool(mock):
+    async def burst():
+        return await asyncio.gather(*(hf_client.acall_hf(MESSAGES) for _ in range(hf_client.HF_POOL_SIZE * 2)))
+
+    answers = asyncio.run(burst())
+    assert answers == [MOCK_ANSWER.strip()] * (hf_client.HF_POOL_SIZE * 2)
+    assert mock.stats()["max_concurrent"] <= hf_client.HF_POOL_SIZE
+
+
+def test_stream_yields_tokens(mock):
+    pieces = list(hf_client.stream_hf(MESSAGES))
+    assert len(pieces) == len(MOCK_ANSWER.split())
+    assert "".join(pieces).strip() == MOCK_ANSWER
+
+
+def test_astream_yields_tokens(mock):
+    async def collect():
+        return [piece async for piece in hf_client.astream_hf(MESSAGES)]
+
+    assert "".join(asyncio.run(collect())).strip() == MOCK_ANSWER
+
+
+@pytest.mark.parametrize("mock", [{"token_ms": 100}], indirect=True)
+def test_closing_astream_early_frees_the_executor_slot(mock, monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(hf_client, "GENERATION_EXECUTOR", executor)
+
+    async def first_two_then_wait_for_slot():
+        stream = hf_client.astream_hf(MESSAGES)
+        pieces = [await stream.__anext__(), await stream.__anext__()]
+        await stream.aclose()
+        # The full answer takes ~2s to stream; the pump must give its slot back well before that.
+        start = time.monotonic()
+        await asyncio.wrap_future(executor.submit(lambda: "livre"))
+        return pieces, time.monotonic() - start
+
+    pieces, waited = asyncio.run(first_two_then_wait_for_slot())
+    executor.shutdown()
+    assert len(pieces) == 2
+    assert waited < 0.5
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+import index_builder
+from index_builder import build_index, choose_index_type, measure_recall, rescore
+
+
+def _vectors(n: int, dim: int = 16, seed: int = 0) -> np.ndarray:
+    v = np.random.default_rng(seed).standard_normal((n, dim)).astype("float32")
+    return v / np.linalg.norm(v, axis=1, keepdims=True)
+
+
+class SelfThenNoise:
+    """An "index" that returns the query's own row first and junk after it."""
+
+    def __init__(self, vectors: np.ndarray) -> None:
+        self.vectors = vectors
+
+    def search(self, queries, k):
+        ids = np.full((len(queries), k), -1, dtype="int64")
+        for row, q in enumerate(queries):
+            ids[row, 0] = int(np.argmax(self.vectors @ q))
+        return np.zeros_like(ids, dtype="float32"), ids
+
+
+def test_flat_recall_is_exact():
+    vectors = _vectors(500)
+    index, _, _ = build_index(vectors, "flat")
+    result = measure_recall(index, vectors, k=10, n_queries=50)
+    assert result == {"k": 10, "queries": 50, "recall": 1.0}
+
+
+def test_query_is_held_out_of_its_own_results():
+    vectors = _vectors(300)
+    # Finding only itself must not count as a hit.
+    assert measure_recall(SelfThenNoise(vectors), vectors, k=5, n_queries=20)["recall"] == 0.0
+
+
+def test_rescored_recall_matches_flat():
+    vectors = _vectors(400)
+    index, _, _ = build_index(vectors, "flat")
+    assert measure_recall(index, vectors, k=5, n_queries=30, rescore_factor=4)["recall"] == 1.0
+
+
+def test_too_few_vectors():
+    assert measure_recall(None, _vectors(1), k=10)["recall"] is None
+
+
+def test_rescore_orders_by_exact_score():
+    vectors = _vectors(50)
+    query = vectors[:1]
+    candidates = np.array([[7, 0, 3, -1]])
+    scores, ids = rescore(query, candidates, vectors, 2)
+    assert ids[0, 0] == 0
+    assert scores[0, 0] == pytest.approx(1.0, abs=1e-5)
+
+
+def test_choose_index_type():
+    assert choose_index_type(1000, "auto") == "flat"
+    assert choose_index_type(100_000, "auto") == "hnsw"
+    assert choose_index_type(1_000_000, "auto") == "ivfpq"
+    with pytest.raises(ValueError):
+        choose_index_type(10, "annoy")
+
+
+def test_forced_ivf_falls_back_to_flat_on_a_tiny_shard(monkeypatch):
+    assert choose_index_type(255, "ivfpq") == "flat"
+    assert choose_index_type(256, "ivfpq") == "ivfpq"
+    assert choose_index_type(50, "ivf") == "ivf"  # nlist shrinks with the shard
+    monkeypatch.setattr(index_builder, "IVF_NLIST", 100)
+    assert choose_index_type(50, "ivf") == "flat"
+
+    vectors = _vectors(50)
+    for forced in ("ivf", "ivfpq"):
+        index, info, _ = build_index(vectors, choose_index_type(len(vectors), forced))
+        assert index.ntotal == 50 and info["type"] == "flat"
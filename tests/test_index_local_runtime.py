@@ -0,0 +1,140 @@
+import asyncio
+import time
+
+import numpy as np
+import pytest
+
+import index_local_runtime
+from index_local_runtime import LocalIndexRuntime, QueryEmbeddingCache
+from retrieval_batcher import RetrievalBatcher
+
+
+class FakeEncoder:
+    """Maps a query to a fixed unit vector; counts what it had to encode."""
+
+    def __init__(self, name: str = "fake-encoder", dim: int = 8) -> None:
+        self.name = name
+        self.dim = dim
+        self.calls = []
+
+    def encode(self, texts):
+        self.calls.append(list(texts))
+        out = np.zeros((len(texts), self.dim), dtype="float32")
+        for row, text in enumerate(texts):
+            out[row, sum(map(ord, text)) % self.dim] = 1.0
+        return out
+
+
+@pytest.fixture
+def runtime(monkeypatch):
+    encoder = FakeEncoder()
+    monkeypatch.setattr(index_local_runtime, "load_query_encoder", lambda: encoder)
+    return LocalIndexRuntime()
+
+
+def test_cache_lru():
+    cache = QueryEmbeddingCache(max_size=2)
+    a, b, c = (("m", t) for t in "abc")
+    cache.put(a, np.zeros(1))
+    cache.put(b, np.ones(1))
+    assert cache.get(a) is not None  # a is now most recent
+    cache.put(c, np.ones(1))
+    assert cache.get(b) is None
+    assert cache.stats() == {"size": 2, "hits": 1, "misses": 1}
+
+
+def test_repeated_queries_are_encoded_once(runtime):
+    runtime.encode_queries(["prisão  preventiva", "prisão preventiva", "peculato"])
+    runtime.encode_queries(["peculato"])
+    assert runtime.model.calls == [["peculato", "prisão preventiva"]]
+
+
+def test_vectors_are_not_served_across_encoders(runtime):
+    runtime.encode_query("peculato")
+    runtime.model = FakeEncoder(name="other-encoder")
+    runtime.encode_query("peculato")
+    assert runtime.model.calls == [["peculato"]]
+
+
+@pytest.fixture
+def sharded(runtime):
+    """Two domain shards of four one-hot vectors each, loaded without artifacts."""
+    faiss = pytest.importorskip("faiss")
+    shards = []
+    for s, name in enumerate(["civil", "penal"]):
+        index = faiss.IndexFlatIP(8)
+        index.add(np.eye(8, dtype="float32")[s * 4:(s + 1) * 4])
+        shards.append(index_local_runtime.IndexShard(name, index, s * 4))
+    meta = [{"source": f"{'civil' if i < 4 else 'penal'}_{i}.txt", "text": str(i)} for i in range(8)]
+    runtime._snapshot = index_local_runtime.IndexSnapshot(shards, meta, "t", {"sharding": "domain"}, {})
+    return runtime
+
+
+def test_area_restricts_the_search(sharded):
+    hits = sharded.search("peculato", k=8, area="penal")
+    assert {h["source"].split("_")[0] for h in hits} == {"penal"}
+    assert len(sharded.search("peculato", k=8)) == 8
+
+
+def test_unknown_area_fails_only_its_own_query(sharded):
+    results = sharded.search_batch(["peculato", "furto", "usucapiao"], k=2, areas=["penal", "nao_existe", None])
+    assert isinstance(results[1], ValueError)
+    assert "Area desconhecida" in str(results[1])
+    assert len(results[0]) == 2 and len(results[2]) == 2
+    with pytest.raises(ValueError, match="Area desconhecida"):
+        sharded.search("furto", area="nao_existe")
+
+
+def test_batcher_fails_only_the_caller_with_an_unknown_area(sharded):
+    async def run():
+        batcher = RetrievalBatcher(sharded, window_ms=50)
+        return await asyncio.gather(
+            batcher.search("peculato", 1, "penal"),
+            batcher.search("furto", 1, "nao_existe"),
+            batcher.search("usucapiao", 3, None),
+            return_exceptions=True,
+        )
+
+    penal, bad, everything = asyncio.run(run())
+    assert isinstance(bad, ValueError)
+    assert len(penal) == 1 and penal[0]["source"].startswith("penal")
+    assert len(everything) == 3
+
+
+def test_reload_watcher_polls_and_survives_errors(runtime):
+    calls = []
+
+    def check():
+        calls.append(1)
+        if len(calls) == 1:
+            raise OSError("manifest.json ilegivel")
+
+    runtime.maybe_reload = check
+    runtime.start_reload_watcher(poll_seconds=0.01)
+    for _ in range(200):
+        if len(calls) >= 3:
+            break
+        time.sleep(0.01)
+    assert len(calls) >= 3
+
+
+def test_meta_from_another_build_is_rejected(runtime, tmp_path, monkeypatch):
+    faiss = pytest.importorskip("faiss")
+    from meta_store import write_meta_store
+
+    index = faiss.IndexFlatIP(8)
+    index.add(np.eye(8, dtype="float32")[:4])
+    faiss.write_index(index, str(tmp_path / "faiss.index"))
+    write_meta_store(tmp_path / "meta.bin", [{"text": "t", "source": "a.txt", "chunk_id": i} for i in range(5)])
+    monkeypatch.setattr(index_local_runtime, "ART_DIR", tmp_path)
+    with pytest.raises(RuntimeError, match="builds diferentes: 5 chunks em meta.bin, 4 vetores"):
+        runtime.load()
+
+
+def test_cites_checks_the_citation_index_without_encoding(sharded):
+    sharded._snapshot.citations = {"dl:3689|art:312": [5]}
+    assert sharded.cites("o que diz o art. 312 do CPP?")
+    assert sharded.cites("art. 312 do CPP", area="penal")
+    assert not sharded.cites("art. 312 do CPP", area="civil")
+    assert not sharded.cites("art. 313 do CPP")
+    assert sharded.model.calls == []
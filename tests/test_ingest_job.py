@@ -0,0 +1,84 @@
+import time
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+pytest.importorskip("sentence_transformers")
+
+import ingest_job  # noqa: E402
+from build_cache import BuildCache  # noqa: E402
+
+
+def fake_parse_worker(args):
+    path = args[0]
+    if "hang" in path:
+        time.sleep(60)  # stands in for a native call SIGALRM cannot interrupt
+    return f"texto de {Path(path).name}", "", {"chars": 1}
+
+
+def test_hung_worker_is_killed_and_the_rest_still_parse(tmp_path, monkeypatch):
+    # Workers are forked, so they see the patched module.
+    monkeypatch.setattr(ingest_job, "_parse_worker", fake_parse_worker)
+    monkeypatch.setattr(ingest_job, "PARSE_KILL_MARGIN_SECONDS", 0.5)
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    files = []
+    for name in ["a.docx", "hang.docx", "b.docx", "c.docx", "d.docx"]:
+        (docs / name).write_text(name)
+        files.append(docs / name)
+    cache = BuildCache(tmp_path / "cache", "m", {})
+
+    start = time.monotonic()
+    out = list(ingest_job.iter_documents(files, docs, cache, workers=2, timeout=1.0, pdf_backend="pypdf"))
+    assert time.monotonic() - start < 10
+    by_name = {d["source_path"]: d for d in out}
+    assert [d["source_path"] for d in out] == [f.name for f in files]
+    assert by_name["hang.docx"]["error"] == "timeout_after_1s"
+    assert by_name["hang.docx"]["stats"]["timed_out"] is True
+    assert all(by_name[n]["text"] == f"texto de {n}" for n in ["a.docx", "b.docx", "c.docx", "d.docx"])
+
+
+def test_rebuilt_shards_stay_staged_until_published(tmp_path):
+    vectors = np.eye(8, dtype="float32")
+    shards = [{"name": "penal", "offset": 0, "count": 8, "num_docs": 1, "content_key": "k1"}]
+    live = tmp_path / ingest_job.shard_file("penal")
+    live.parent.mkdir(parents=True)
+    live.write_bytes(b"indice antigo")
+
+    entries = ingest_job.build_shards(vectors, shards, tmp_path, {})
+    assert live.read_bytes() == b"indice antigo"
+    assert entries[0]["sha256"] == ingest_job.sha256_file(ingest_job.staged_path(live))
+
+    ingest_job.publish_staged([live])
+    assert not ingest_job.staged_path(live).exists()
+    assert ingest_job.sha256_file(live) == entries[0]["sha256"]
+
+
+
+def slow_page_count(path, backend=None):
+    if "slow" in Path(path).name:
+        time.sleep(60)  # a PDF whose xref table sends the parser into a loop
+    return 12
+
+
+def ranged_parse_worker(args):
+    path, _, _, pages = args
+    return f"{Path(path).name} {pages}", "", {"chars": 1}
+
+
+def test_page_count_runs_off_the_parent_under_the_timeout(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest_job, "page_count", slow_page_count)
+    monkeypatch.setattr(ingest_job, "_parse_worker", ranged_parse_worker)
+    monkeypatch.setattr(ingest_job, "PDF_PAGES_PER_TASK", 5)
+    files = []
+    for name in ["slow.pdf", "long.pdf"]:
+        (tmp_path / name).write_text(name)
+        files.append(tmp_path / name)
+    cache = BuildCache(tmp_path / "cache", "m", {})
+
+    start = time.monotonic()
+    docs = {d["source_path"]: d for d in ingest_job.iter_documents(files, tmp_path, cache, 1, 1.0, "pypdf")}
+    assert time.monotonic() - start < 10
+    assert docs["slow.pdf"]["text"] == "slow.pdf None"  # not split, parsed as one task
+    assert "long.pdf (0, 5)" in docs["long.pdf"]["text"] and "long.pdf (10, 12)" in docs["long.pdf"]["text"]
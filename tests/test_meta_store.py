@@ -0,0 +1,35 @@
+import pytest
+
+from meta_store import MetaStore, MetaStoreWriter, write_meta_store
+
+
+def test_roundtrip(tmp_path):
+    chunks = [
+        {"text": "Art. 1º Todo poder emana do povo.", "source": "cf.pdf", "chunk_id": 0},
+        {"text": "ação, prisão — súmula", "source": "sumulas.pdf", "chunk_id": 0},
+        {"text": "", "source": "cf.pdf", "chunk_id": 1},
+    ]
+    write_meta_store(tmp_path / "meta.bin", chunks)
+    store = MetaStore(tmp_path / "meta.bin")
+    assert len(store) == 3
+    assert [store[i] for i in range(3)] == chunks
+    assert store.sources == ["cf.pdf", "sumulas.pdf"]
+    with pytest.raises(IndexError):
+        store[3]
+
+
+def test_writer_streams_and_counts(tmp_path):
+    writer = MetaStoreWriter(tmp_path / "meta.bin")
+    for i in range(1000):
+        writer.append(f"texto {i}", f"doc{i % 7}.pdf", i)
+    assert writer.count == 1000
+    writer.close()
+    assert not (tmp_path / "meta.bin.blob.tmp").exists()
+    store = MetaStore(tmp_path / "meta.bin")
+    assert store[999] == {"text": "texto 999", "source": "doc5.pdf", "chunk_id": 999}
+
+
+def test_rejects_other_files(tmp_path):
+    (tmp_path / "meta.bin").write_bytes(b"\0" * 64)
+    with pytest.raises(ValueError):
+        MetaStore(tmp_path / "meta.bin")
@@ -0,0 +1,38 @@
+import pytest
+
+import pdf_extract
+from pdf_extract import merge_stats, page_ranges, resolve_backend
+
+
+def test_page_ranges():
+    assert page_ranges(250, 100) == [(0, 100), (100, 200), (200, 250)]
+    assert page_ranges(100, 100) == [(0, 100)]
+    assert page_ranges(500, 0) == [(0, 500)]
+
+
+def test_merge_stats_adds_up_ranges():
+    parts = [
+        {"backend": "pypdf", "pages": 100, "seconds": 1.5, "failed_pages": [{"page": 3, "error": "x"}],
+         "num_failed_pages": 1, "timed_out_pages": [], "num_timed_out_pages": 0,
+         "slowest_page": {"page": 3, "seconds": 0.4}},
+        {"backend": "pypdf", "pages": 20, "seconds": 0.25, "failed_pages": [],
+         "num_failed_pages": 0, "timed_out_pages": [117], "num_timed_out_pages": 1,
+         "slowest_page": {"page": 117, "seconds": 30.0}},
+    ]
+    merged = merge_stats(parts)
+    assert merged["pages"] == 120 and merged["seconds"] == 1.75 and merged["ranges"] == 2
+    assert merged["num_failed_pages"] == 1 and merged["timed_out_pages"] == [117]
+    assert merged["slowest_page"] == {"page": 117, "seconds": 30.0}
+
+
+def test_resolve_backend():
+    assert resolve_backend("auto") in pdf_extract.BACKENDS
+    assert resolve_backend("pypdf") == "pypdf"
+    with pytest.raises(RuntimeError, match="PDF_BACKEND invalido"):
+        resolve_backend("xpdf")
+
+
+def test_missing_backend_package_is_reported(monkeypatch):
+    monkeypatch.setattr(pdf_extract, "available_backends", lambda: ["pypdf"])
+    with pytest.raises(RuntimeError, match="requer o pacote fitz"):
+        resolve_backend("pymupdf")
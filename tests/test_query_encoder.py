@@ -0,0 +1,41 @@
+import pytest
+
+import query_encoder
+
+
+@pytest.fixture
+def onnx_backend(monkeypatch, tmp_path):
+    monkeypatch.setattr(query_encoder, "QUERY_ENCODER", "onnx")
+    monkeypatch.setattr(query_encoder, "ONNX_MODEL_DIR", tmp_path)
+
+    def no_export(*args, **kwargs):
+        raise AssertionError("startup must not export")
+
+    monkeypatch.setattr(query_encoder, "export_onnx", no_export)
+    # Pretend onnxruntime is installed; the export check comes before any import.
+    monkeypatch.setattr(query_encoder.importlib.util, "find_spec", lambda name: object())
+    return tmp_path
+
+
+def test_onnx_without_export_fails_clearly(onnx_backend):
+    with pytest.raises(RuntimeError, match="query_encoder.py export"):
+        query_encoder.load_query_encoder()
+
+
+def test_onnx_export_of_another_model_fails_clearly(onnx_backend):
+    (onnx_backend / query_encoder.ONNX_INT8).write_bytes(b"")
+    (onnx_backend / query_encoder.ENCODER_INFO).write_text('{"embed_model": "outro/modelo"}', encoding="utf-8")
+    with pytest.raises(RuntimeError, match="query_encoder.py export"):
+        query_encoder.load_query_encoder()
+
+
+def test_onnx_without_onnxruntime_fails_clearly(onnx_backend, monkeypatch):
+    monkeypatch.setattr(query_encoder.importlib.util, "find_spec", lambda name: None)
+    with pytest.raises(RuntimeError, match="requirements-onnx.txt"):
+        query_encoder.load_query_encoder()
+
+
+def test_unknown_backend_is_rejected(monkeypatch):
+    monkeypatch.setattr(query_encoder, "QUERY_ENCODER", "tf")
+    with pytest.raises(RuntimeError, match="QUERY_ENCODER invalido"):
+        query_encoder.load_query_encoder()
@@ -0,0 +1,143 @@
+import fcntl
+import os
+import time
+
+import pytest
+
+import reindex_jobs
+from reindex_jobs import ReindexJob, ReindexJobManager
+
+# Stands in for ingest_job.py: prints a stage line and a tqdm bar, then
+# FAKE_INGEST_MODE decides the rest ("fail": exit 3; "gate": wait until
+# FAKE_INGEST_GATE exists; "hang": sleep in a child, whose pid goes to
+# FAKE_INGEST_CHILD_PID_FILE, like the parse pool and soffice would).
+FAKE_INGEST = """
+import os, subprocess, sys, time
+from pathlib import Path
+mode = os.environ.get("FAKE_INGEST_MODE", "")
+print("[STAGE] ingest", flush=True)
+print("Ingest:  50%|#####     | 1/2 [00:01<00:01,  1.00it/s]", flush=True)
+if mode == "fail":
+    print("RuntimeError: Nenhum documento parseado com sucesso.", flush=True)
+    sys.exit(3)
+if mode == "gate":
+    while not Path(os.environ["FAKE_INGEST_GATE"]).exists():
+        time.sleep(0.01)
+if mode == "hang":
+    child = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+    Path(os.environ["FAKE_INGEST_CHILD_PID_FILE"]).write_text(str(child.pid))
+    print("[STAGE] index", flush=True)
+    child.wait()
+print("[STAGE] done", flush=True)
+"""
+
+
+@pytest.fixture
+def jobs(tmp_path, monkeypatch):
+    # _run_locked starts "ingest_job.py" from the working directory.
+    (tmp_path / "ingest_job.py").write_text(FAKE_INGEST)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(reindex_jobs, "WORK_DIR", tmp_path / "work")
+    monkeypatch.setattr(reindex_jobs, "LOCK_PATH", tmp_path / "work" / "reindex.lock")
+    monkeypatch.setattr(reindex_jobs, "LOG_PATH", tmp_path / "work" / "reindex.log")
+    monkeypatch.setattr(reindex_jobs, "REINDEX_CANCEL_GRACE_SECONDS", 2)
+    return ReindexJobManager()
+
+
+def wait_done(job: ReindexJob, timeout: float = 15) -> ReindexJob:
+    assert job.done.wait(timeout), f"job still {job.status}"
+    return job
+
+
+def wait_for(predicate, timeout: float = 15) -> None:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.01)
+
+
+def test_stage_and_tqdm_lines_are_parsed():
+    manager, job = ReindexJobManager(), ReindexJob("teste")
+    manager._consume(job, "[STAGE] ingest\n")
+    manager._consume(job, "Ingest:  42%|####2     | 21/50 [00:10<00:14,  2.00it/s]\n")
+    assert job.stage == "ingest"
+    assert job.progress == {"desc": "Ingest", "current": 21, "total": 50, "percent": 42}
+    manager._consume(job, "[STAGE] index\n")
+    assert (job.stage, job.progress) == ("index", None)
+    manager._consume(job, "\n")
+    assert list(job.log) == ["[STAGE] ingest", "Ingest:  42%|####2     | 21/50 [00:10<00:14,  2.00it/s]", "[STAGE] index"]
+
+
+def test_job_runs_to_completion(jobs):
+    job = wait_done(jobs.submit("teste"))
+    assert (job.status, job.returncode, job.stage) == ("succeeded", 0, "done")
+    assert job.progress is None  # reset by the last [STAGE] line
+    assert "Ingest:  50%" in job.to_dict()["log_tail"][1]
+    assert reindex_jobs.LOG_PATH.read_text(encoding="utf-8").endswith("EXIT=0\n")
+
+
+def test_failed_job_reports_exit_code_and_last_line(jobs, monkeypatch):
+    monkeypatch.setenv("FAKE_INGEST_MODE", "fail")
+    job = wait_done(jobs.submit("teste"))
+    assert job.status == "failed"
+    assert job.error == "exit=3 RuntimeError: Nenhum documento parseado com sucesso."
+
+
+def test_submit_while_queued_returns_the_queued_job(jobs, tmp_path, monkeypatch):
+    gate = tmp_path / "gate"
+    monkeypatch.setenv("FAKE_INGEST_MODE", "gate")
+    monkeypatch.setenv("FAKE_INGEST_GATE", str(gate))
+    running = jobs.submit("a")
+    wait_for(lambda: running.stage == "ingest")
+    queued = jobs.submit("b")
+    assert queued is not running and queued.status == "queued"
+    assert jobs.submit("c") is queued
+    assert jobs.active() is running
+    gate.touch()
+    assert [wait_done(j).status for j in (running, queued)] == ["succeeded", "succeeded"]
+    assert [j.source for j in jobs.list()] == ["b", "a"]
+
+
+def test_lock_held_by_another_process_fails_the_job(jobs):
+    reindex_jobs.WORK_DIR.mkdir(parents=True)
+    with reindex_jobs.LOCK_PATH.open("a+") as held:
+        fcntl.flock(held, fcntl.LOCK_EX)
+        job = wait_done(jobs.submit("teste"))
+    assert job.status == "failed"
+    assert job.error.startswith("LOCKED")
+    assert job.returncode is None
+
+
+def test_cancel_kills_the_whole_process_group(jobs, tmp_path, monkeypatch):
+    pid_file = tmp_path / "child.pid"
+    monkeypatch.setenv("FAKE_INGEST_MODE", "hang")
+    monkeypatch.setenv("FAKE_INGEST_CHILD_PID_FILE", str(pid_file))
+    job = jobs.submit("teste")
+    wait_for(lambda: job.stage == "index")
+    child = int(pid_file.read_text())
+    jobs.cancel(job.id)
+    assert wait_done(job).status == "cancelled"
+    for _ in range(100):
+        try:
+            os.kill(child, 0)
+        except ProcessLookupError:
+            break
+        time.sleep(0.05)
+    else:
+        pytest.fail("child of the cancelled ingest survived")
+
+
+def test_cancel_queued_job_never_runs_it(jobs, tmp_path, monkeypatch):
+    gate = tmp_path / "gate"
+    monkeypatch.setenv("FAKE_INGEST_MODE", "gate")
+    monkeypatch.setenv("FAKE_INGEST_GATE", str(gate))
+    running = jobs.submit("a")
+    wait_for(lambda: running.stage == "ingest")
+    queued = jobs.submit("b")
+    assert jobs.cancel(queued.id).status == "cancelled"
+    assert queued.started_at is None
+    gate.touch()
+    assert wait_done(running).status == "succeeded"
+    again = jobs.submit("c")
+    assert again is not queued
+    assert wait_done(again).status == "succeeded"
@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+
+from retrieval_batcher import RetrievalBatcher
+
+
+class FakeRuntime:
+    """search_batch returns k numbered hits per query and records each batch."""
+
+    def __init__(self, fail_on=None):
+        self.batches = []
+        self.fail_on = fail_on
+
+    def search_batch(self, queries, k, areas):
+        self.batches.append((list(queries), k, list(areas)))
+        if self.fail_on == "batch":
+            raise RuntimeError("indice indisponivel")
+        return [
+            ValueError(f"Area desconhecida: {area}") if self.fail_on and area == self.fail_on
+            else [{"query": q, "rank": r} for r in range(k)]
+            for q, area in zip(queries, areas)
+        ]
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_concurrent_queries_share_one_batch():
+    runtime = FakeRuntime()
+
+    async def go():
+        batcher = RetrievalBatcher(runtime, window_ms=20, max_batch=32)
+        return await asyncio.gather(batcher.search("a", 2), batcher.search("b", 4, "penal"))
+
+    a, b = run(go())
+    assert runtime.batches == [(["a", "b"], 4, [None, "penal"])]
+    assert [h["query"] for h in a] == ["a", "a"]  # trimmed to its own k
+    assert len(b) == 4
+
+
+def test_max_batch_flushes_without_waiting_for_the_window():
+    runtime = FakeRuntime()
+
+    async def go():
+        batcher = RetrievalBatcher(runtime, window_ms=10_000, max_batch=3)
+        return await asyncio.wait_for(asyncio.gather(*(batcher.search(str(n), 1) for n in range(3))), timeout=2)
+
+    assert len(run(go())) == 3
+    assert [len(b[0]) for b in runtime.batches] == [3]
+
+
+def test_queries_after_the_window_start_a_new_batch():
+    runtime = FakeRuntime()
+
+    async def go():
+        batcher = RetrievalBatcher(runtime, window_ms=5)
+        first = await batcher.search("a")
+        second = await batcher.search("b")
+        return first, second
+
+    run(go())
+    assert [b[0] for b in runtime.batches] == [["a"], ["b"]]
+
+
+def test_one_failing_query_does_not_fail_the_others():
+    runtime = FakeRuntime(fail_on="nao_existe")
+
+    async def go():
+        batcher = RetrievalBatcher(runtime, window_ms=20)
+        return await asyncio.gather(
+            batcher.search("a", 1, "penal"),
+            batcher.search("b", 1, "nao_existe"),
+            batcher.search("c", 1),
+            return_exceptions=True,
+        )
+
+    ok, bad, other = run(go())
+    assert isinstance(bad, ValueError)
+    assert ok == [{"query": "a", "rank": 0}] and other == [{"query": "c", "rank": 0}]
+    assert len(runtime.batches) == 1
+
+
+def test_batch_failure_reaches_every_caller():
+    runtime = FakeRuntime(fail_on="batch")
+
+    async def go():
+        batcher = RetrievalBatcher(runtime, window_ms=20)
+        return await asyncio.gather(batcher.search("a"), batcher.search("b"), return_exceptions=True)
+
+    results = run(go())
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+def test_cancelled_caller_does_not_break_the_batch():
+    runtime = FakeRuntime()
+
+    async def go():
+        batcher = RetrievalBatcher(runtime, window_ms=20)
+        gone = asyncio.create_task(batcher.search("a"))
+        kept = asyncio.create_task(batcher.search("b"))
+        await asyncio.sleep(0)
+        gone.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await gone
+        return await kept
+
+    assert run(go())[0]["query"] == "b"
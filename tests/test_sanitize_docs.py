@@ -0,0 +1,104 @@
+import os
+import stat
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+from sanitize_docs import convert_all, convert_docs_to_docx
+
+# Writes "<stem>.docx" into --outdir for every input, unless FAKE_SOFFICE_MODE
+# says otherwise ("nothing": write nothing; "hang": write, then sleep). Like the
+# real launcher, "hang" leaves the work to a child (soffice.bin), whose pid goes
+# to FAKE_SOFFICE_CHILD_PID_FILE.
+FAKE_SOFFICE = """#!{python}
+import os, subprocess, sys, time
+from pathlib import Path
+args = sys.argv[1:]
+out = Path(args[args.index("--outdir") + 1])
+mode = os.environ.get("FAKE_SOFFICE_MODE", "")
+if mode != "nothing":
+    for arg in args:
+        if arg.endswith(".doc"):
+            (out / (Path(arg).stem + ".docx")).write_text("converted " + arg)
+if mode == "hang":
+    child = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+    pid_file = os.environ.get("FAKE_SOFFICE_CHILD_PID_FILE")
+    if pid_file:
+        Path(pid_file).write_text(str(child.pid))
+    child.wait()
+"""
+
+
+@pytest.fixture
+def fake_soffice(tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    script = bin_dir / "soffice"
+    script.write_text(FAKE_SOFFICE.format(python=sys.executable))
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    return monkeypatch
+
+
+def _doc(path: Path) -> Path:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"doc " + str(path).encode())
+    return path
+
+
+def test_converts_batch(tmp_path, fake_soffice):
+    docs = [_doc(tmp_path / "docs" / "a.doc"), _doc(tmp_path / "docs" / "b.doc")]
+    results = convert_docs_to_docx(docs, tmp_path / "profile")
+    assert [r["reason"] for r in results] == ["converted", "converted"]
+    assert (tmp_path / "docs" / "a.docx").read_text().endswith("a.doc")
+
+
+def test_timed_out_batch_output_is_not_reused(tmp_path, fake_soffice):
+    profile = tmp_path / "profile"
+    fake_soffice.setenv("FAKE_SOFFICE_MODE", "hang")
+    first = _doc(tmp_path / "one" / "lei.doc")
+    assert convert_docs_to_docx([first], profile, timeout=1)[0]["reason"] == "conversion_timeout"
+
+    fake_soffice.setenv("FAKE_SOFFICE_MODE", "nothing")
+    second = _doc(tmp_path / "two" / "lei.doc")
+    result = convert_docs_to_docx([second], profile)[0]
+    assert result["reason"] == "output_not_created"
+    assert not second.with_suffix(".docx").exists()
+
+
+def test_timeout_kills_the_whole_process_group(tmp_path, fake_soffice):
+    pid_file = tmp_path / "child.pid"
+    fake_soffice.setenv("FAKE_SOFFICE_MODE", "hang")
+    fake_soffice.setenv("FAKE_SOFFICE_CHILD_PID_FILE", str(pid_file))
+    doc = _doc(tmp_path / "docs" / "lei.doc")
+    assert convert_docs_to_docx([doc], tmp_path / "profile", timeout=1)[0]["reason"] == "conversion_timeout"
+    child = int(pid_file.read_text())
+    for _ in range(100):
+        try:
+            os.kill(child, 0)
+        except ProcessLookupError:
+            break
+        time.sleep(0.05)
+    else:
+        pytest.fail("soffice.bin stand-in survived the timeout")
+
+
+def test_duplicate_stems_in_one_batch_are_rejected(tmp_path, fake_soffice):
+    docs = [_doc(tmp_path / "x" / "lei.doc"), _doc(tmp_path / "y" / "LEI.doc")]
+    with pytest.raises(ValueError):
+        convert_docs_to_docx(docs, tmp_path / "profile")
+
+
+def test_convert_all_splits_same_stems_and_caches(tmp_path, fake_soffice):
+    docs = [_doc(tmp_path / "x" / "lei.doc"), _doc(tmp_path / "y" / "lei.doc")]
+    cache = tmp_path / "cache"
+    results = convert_all(docs, workers=2, batch_size=8, profile_root=tmp_path / "profiles", cache_dir=cache)
+    assert [r["reason"] for r in results] == ["converted", "converted"]
+    assert (tmp_path / "x" / "lei.docx").read_text().endswith(str(docs[0]))
+    assert (tmp_path / "y" / "lei.docx").read_text().endswith(str(docs[1]))
+
+    fake_soffice.setenv("FAKE_SOFFICE_MODE", "nothing")
+    again = convert_all(docs, workers=1, batch_size=8, profile_root=tmp_path / "profiles", cache_dir=cache)
+    assert [r["reason"] for r in again] == ["cache_hit", "cache_hit"]